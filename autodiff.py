@@ -0,0 +1,451 @@
+# autodiff.py
+"""
+Automatic differentiation of an expression string, without Sympy.
+
+The expression (same syntax as for utils.build_functions_from_sympy) is
+parsed with Python's ast module into a tape: a list of elementary
+operations on earlier entries, where identical operations are stored once.
+Derivatives are new entries of the same tape:
+
+    gradient  reverse mode: adjoints are accumulated from the output back
+              to the variables, so grad costs a few times f whatever n
+    tangent   forward mode (dual numbers) on any entries; applied to the
+              gradient entries, it gives the Hessian-vector product H v
+              for a few times the cost of grad
+
+Every program is then written out as straight-line Python/NumPy source,
+like the "codegen" backend of utils (which compiles and caches it).
+"""
+import ast
+import io
+import math
+import tokenize
+
+
+# Functions of the expressions: name -> (operation, NumPy function)
+FUNCTIONS = {
+    "sin": "sin", "cos": "cos", "tan": "tan",
+    "asin": "arcsin", "acos": "arccos", "atan": "arctan",
+    "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+    "exp": "exp", "log": "log", "ln": "log", "sqrt": "sqrt",
+    "abs": "absolute", "Abs": "absolute", "sign": "sign",
+}
+CONSTANTS = {"pi": math.pi, "E": math.e}
+
+# NumPy functions used by the generated source
+NUMPY_NAMES = tuple(sorted(set(FUNCTIONS.values())))
+
+_BINARY = {ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.Div: "div",
+           ast.Pow: "pow"}
+_FORMATS = {"add": "{} + {}", "sub": "{} - {}", "mul": "{} * {}", "div": "{} / {}",
+            "pow": "{} ** {}", "neg": "-{}"}
+
+
+class Tape:
+    """
+    Operations of a program, in evaluation order.
+
+    Entry k is a tuple (op, args, value): op is "var" (value: index i of
+    x[i]), "dir" (index i of the direction v[i]), "const" (value: the
+    float), a binary operation ("add", "sub", "mul", "div", "pow"), "neg",
+    or a NumPy function name; args are the indices of the operands.
+    Constant operands are folded and identical entries are shared, so
+    op() returns the index of an existing entry where possible.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self._index = {}
+
+    def _add(self, entry):
+        k = self._index.get(entry)
+        if k is None:
+            k = self._index[entry] = len(self.ops)
+            self.ops.append(entry)
+        return k
+
+    def leaf(self, op, value):
+        """Entry without operands, such as ("var", (), i)."""
+        return self._add((op, (), value))
+
+    def var(self, i):
+        return self.leaf("var", i)
+
+    def direction(self, i):
+        return self.leaf("dir", i)
+
+    def const(self, c):
+        return self.leaf("const", float(c))
+
+    def value(self, k):
+        """The constant value of entry k, or None."""
+        op, _, value = self.ops[k]
+        return value if op == "const" else None
+
+    def op(self, name, *args):
+        c = [self.value(a) for a in args]
+        if name == "neg":
+            if c[0] is not None:
+                return self.const(-c[0])
+            if self.ops[args[0]][0] == "neg":
+                return self.ops[args[0]][1][0]
+        elif name in ("add", "sub"):
+            a, b = args
+            if c[0] is not None and c[1] is not None:
+                return self.const(c[0] + c[1] if name == "add" else c[0] - c[1])
+            if c[1] == 0:
+                return a
+            if c[0] == 0:
+                return b if name == "add" else self.op("neg", b)
+            if self.ops[b][0] == "neg":
+                # a + (-b) -> a - b, a - (-b) -> a + b
+                return self.op("sub" if name == "add" else "add", a, self.ops[b][1][0])
+            if name == "add" and b < a:
+                args = (b, a)
+        elif name == "mul":
+            a, b = args
+            if c[0] is not None and c[1] is not None:
+                return self.const(c[0] * c[1])
+            if c[0] is not None:
+                a, b = b, a
+                c = c[::-1]
+            if c[1] is not None:
+                if c[1] == 0:
+                    return self.const(0.0)
+                if c[1] == 1:
+                    return a
+                if c[1] == -1:
+                    return self.op("neg", a)
+            args = (a, b) if (c[1] is not None or a < b) else (b, a)
+        elif name == "div":
+            a, b = args
+            if c[0] == 0:
+                return self.const(0.0)
+            if c[1] == 1:
+                return a
+            if c[0] is not None and c[1]:
+                return self.const(c[0] / c[1])
+        elif name == "pow":
+            if c[1] == 1:
+                return args[0]
+            if c[1] == 0:
+                return self.const(1.0)
+        return self._add((name, tuple(args), None))
+
+    def partials(self, k):
+        """
+        Local derivatives of entry k: list of (operand, derivative entry).
+        """
+        op, args, _ = self.ops[k]
+        if not args or op == "sign":
+            return []
+        one = self.const(1.0)
+        if op == "add":
+            return [(args[0], one), (args[1], one)]
+        if op == "sub":
+            return [(args[0], one), (args[1], self.const(-1.0))]
+        if op == "neg":
+            return [(args[0], self.const(-1.0))]
+        if op == "mul":
+            return [(args[0], args[1]), (args[1], args[0])]
+        a = args[0]
+        if op == "div":
+            b = args[1]
+            return [(a, self.op("div", one, b)),
+                    (b, self.op("neg", self.op("div", k, b)))]
+        if op == "pow":
+            b = args[1]
+            c = self.value(b)
+            if c is not None:
+                return [(a, self.op("mul", b, self.op("pow", a, self.const(c - 1.0))))]
+            return [(a, self.op("mul", b, self.op("pow", a, self.op("sub", b, one)))),
+                    (b, self.op("mul", k, self.op("log", a)))]
+        if op == "sin":
+            d = self.op("cos", a)
+        elif op == "cos":
+            d = self.op("neg", self.op("sin", a))
+        elif op == "tan":
+            d = self.op("add", one, self.op("mul", k, k))
+        elif op == "exp":
+            d = k
+        elif op == "log":
+            d = self.op("div", one, a)
+        elif op == "sqrt":
+            d = self.op("div", self.const(0.5), k)
+        elif op == "sinh":
+            d = self.op("cosh", a)
+        elif op == "cosh":
+            d = self.op("sinh", a)
+        elif op == "tanh":
+            d = self.op("sub", one, self.op("mul", k, k))
+        elif op == "arctan":
+            d = self.op("div", one, self.op("add", one, self.op("mul", a, a)))
+        elif op in ("arcsin", "arccos"):
+            d = self.op("div", one, self.op("sqrt", self.op("sub", one, self.op("mul", a, a))))
+            if op == "arccos":
+                d = self.op("neg", d)
+        elif op == "absolute":
+            d = self.op("sign", a)
+        else:
+            raise ValueError("No derivative for operation '{}'.".format(op))
+        return [(a, d)]
+
+    def reachable(self, outputs):
+        """Sorted indices of the entries the outputs depend on."""
+        seen = set()
+        stack = [k for k in outputs if k is not None]
+        while stack:
+            k = stack.pop()
+            if k not in seen:
+                seen.add(k)
+                stack.extend(self.ops[k][1])
+        return sorted(seen)
+
+
+def split_terms(f_str):
+    """
+    Split f_str at its top-level + and - signs: list of (sign, term).
+
+    Long sums are parsed term by term, since ast.parse recurses once per
+    operator of a chain a + b + c + ...
+    """
+    terms = []
+    depth, start, sign, prev = 0, 0, 1.0, None
+    lines = f_str.splitlines(True) or [""]
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    tokens = tokenize.generate_tokens(io.StringIO(f_str).readline)
+    for tok in tokens:
+        if tok.type in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER,
+                        tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT):
+            continue
+        pos = offsets[tok.start[0] - 1] + tok.start[1]
+        if tok.string in "([{":
+            depth += 1
+        elif tok.string in ")]}":
+            depth -= 1
+        elif (depth == 0 and tok.string in "+-" and prev is not None
+              and (prev.type in (tokenize.NAME, tokenize.NUMBER) or prev.string in ")]}")):
+            terms.append((sign, f_str[start:pos]))
+            sign = 1.0 if tok.string == "+" else -1.0
+            start = pos + 1
+        prev = tok
+    terms.append((sign, f_str[start:]))
+    return terms
+
+
+def parse(f_str, var_names, tape=None):
+    """
+    Record the expression f_str on a tape.
+
+    Returns
+    -------
+    tape : Tape
+    out : int
+        Index of the entry holding f.
+    """
+    if tape is None:
+        tape = Tape()
+    index = {name: i for i, name in enumerate(var_names)}
+    # x^2 means x**2, as for Sympy
+    f_str = f_str.replace("^", "**")
+    out = None
+    def leaf(node):
+        if isinstance(node, ast.Name):
+            if node.id in index:
+                return tape.var(index[node.id])
+            if node.id in CONSTANTS:
+                return tape.const(CONSTANTS[node.id])
+            raise ValueError("Unknown name '{}' in the expression.".format(node.id))
+        raise unsupported(node)
+
+    for sign, term in split_terms(f_str):
+        k = parse_term(term.strip(), tape, leaf)
+        if out is None:
+            out = k if sign > 0 else tape.op("neg", k)
+        else:
+            out = tape.op("add" if sign > 0 else "sub", out, k)
+    return tape, out
+
+
+def unsupported(node):
+    return ValueError(
+        "'{}' is not supported by the automatic differentiation backend.".format(
+            ast.unparse(node)
+        )
+    )
+
+
+def parse_term(term, tape, leaf):
+    """
+    Record one term on the tape and return the index of its entry.
+
+    Names and subscripts are resolved by leaf(node) -> entry.
+    """
+    return parse_node(ast.parse(term, mode="eval").body, tape, leaf)
+
+
+def parse_node(root, tape, leaf):
+    """Record the ast expression root on the tape (see parse_term)."""
+    # Iterative post-order walk (nested expressions can be deep)
+    result = {}
+    stack = [(root, False)]
+    while stack:
+        node, done = stack.pop()
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            children = [node.left, node.right]
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            children = [node.operand]
+        elif isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS
+                    and len(node.args) == 1 and not node.keywords):
+                raise unsupported(node)
+            children = node.args
+        elif isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise unsupported(node)
+            result[id(node)] = tape.const(node.value)
+            continue
+        elif isinstance(node, (ast.Name, ast.Subscript)):
+            result[id(node)] = leaf(node)
+            continue
+        else:
+            raise unsupported(node)
+
+        if not done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+        args = [result.pop(id(child)) for child in children]
+        if isinstance(node, ast.BinOp):
+            k = tape.op(_BINARY[type(node.op)], *args)
+        elif isinstance(node, ast.UnaryOp):
+            k = tape.op("neg", *args) if isinstance(node.op, ast.USub) else args[0]
+        else:
+            k = tape.op(FUNCTIONS[node.func.id], *args)
+        result[id(node)] = k
+    return result[id(root)]
+
+
+def gradient(tape, out, n):
+    """
+    Reverse mode: entries of d out / d x_i, i = 0..n-1 (None where zero).
+    """
+    adjoint = adjoints(tape, out)
+    return [adjoint.get(i) for i in range(n)]
+
+
+def adjoints(tape, out):
+    """
+    Reverse mode: {value of a "var" entry: entry of d out / d var} for the
+    variables out depends on.
+    """
+    adjoint = {out: tape.const(1.0)}
+    result = {}
+    for k in reversed(tape.reachable([out])):
+        a = adjoint.pop(k, None)
+        if a is None:
+            continue
+        op, _, value = tape.ops[k]
+        if op == "var":
+            result[value] = a
+            continue
+        for arg, d in tape.partials(k):
+            contribution = tape.op("mul", a, d)
+            prev = adjoint.get(arg)
+            adjoint[arg] = contribution if prev is None else tape.op("add", prev, contribution)
+    return result
+
+
+def tangent(tape, outputs, seed=None):
+    """
+    Forward mode: entries of the derivatives of the outputs in the
+    direction v (v[i] is the tangent of x[i]; None where zero).
+
+    seed(value) gives the tangent entry of each "var" entry instead (None
+    for zero); by default it is the direction entry v[value].
+    """
+    if seed is None:
+        seed = tape.direction
+    tangents = {}
+    for k in tape.reachable(outputs):
+        op, _, value = tape.ops[k]
+        if op == "var":
+            t = seed(value)
+            if t is not None:
+                tangents[k] = t
+            continue
+        t = None
+        for arg, d in tape.partials(k):
+            ta = tangents.get(arg)
+            if ta is None:
+                continue
+            term = tape.op("mul", d, ta)
+            t = term if t is None else tape.op("add", t, term)
+        if t is not None:
+            tangents[k] = t
+    return [None if k is None else tangents.get(k) for k in outputs]
+
+
+def literal(c):
+    """Source of the constant c."""
+    if math.isnan(c) or math.isinf(c):
+        raise ValueError("The expression has a non-finite constant.")
+    text = str(int(c)) if c.is_integer() and abs(c) < 1e15 else repr(c)
+    return "({})".format(text) if c < 0 else text
+
+
+def op_code(op, operands):
+    """Source of the operation op on the sources of its operands."""
+    if op in _FORMATS:
+        return _FORMATS[op].format(*operands)
+    return "{}({})".format(op, *operands)
+
+
+def source(tape, name, params, outputs, scalar=False):
+    """
+    Python source of def name(*params): evaluating the outputs, one
+    statement per tape entry. With scalar=True, the single output is
+    returned; otherwise output i is written into out[i] and out is
+    returned (params must then end with "out").
+    """
+    names = {}
+    lines = ["def {}({}):\n".format(name, ", ".join(params))]
+    for k in tape.reachable(outputs):
+        op, args, value = tape.ops[k]
+        if op == "var":
+            names[k] = "x[{}]".format(value)
+        elif op == "dir":
+            names[k] = "v[{}]".format(value)
+        elif op == "const":
+            names[k] = literal(value)
+        else:
+            names[k] = "_t{}".format(k)
+            lines.append("    _t{} = {}\n".format(k, op_code(op, [names[a] for a in args])))
+    if scalar:
+        (k,) = outputs
+        lines.append("    return {}\n".format(names[k]))
+        return "".join(lines)
+    for i, k in enumerate(outputs):
+        lines.append("    out[{}] = {}\n".format(i, "0.0" if k is None else names[k]))
+    lines.append("    return out\n")
+    return "".join(lines)
+
+
+def ad_sources(f_str, var_names):
+    """
+    Source of f(x), grad(x, out) and hvp(x, v, out) for the expression.
+
+    hvp(x, v, out) also gives the Hessian in one call: with v the rows of
+    the identity matrix (NumPy arrays), out[i] receives row i.
+    """
+    n = len(var_names)
+    tape, out = parse(f_str, var_names)
+    grad = gradient(tape, out, n)
+    hvp = tangent(tape, grad)
+    return {
+        "f": source(tape, "f", ["x"], [out], scalar=True),
+        "grad": source(tape, "grad", ["x", "out"], grad),
+        "hvp": source(tape, "hvp", ["x", "v", "out"], hvp),
+    }
@@ -0,0 +1,263 @@
+# batched.py
+import numpy as np
+
+from newton_ls import newton_direction
+
+
+def line_search_backtracking_batched(f, X, D, FX, GX, alpha0=1.0, c1=1e-4, tau=0.5):
+    """
+    Backtracking line search with Armijo condition on B lanes at once.
+
+    Every lane b has its own step alpha_b. At each reduction, f is called
+    once on the stacked trial points of the lanes that are still searching.
+
+    Parameters
+    ----------
+    f : callable
+        f(X) -> np.ndarray of shape (B,), for X of shape (B, n).
+    X : np.ndarray of shape (B, n)
+        Current points.
+    D : np.ndarray of shape (B, n)
+        Search directions.
+    FX : np.ndarray of shape (B,)
+        f at X.
+    GX : np.ndarray of shape (B, n)
+        grad at X.
+    alpha0, c1, tau : float
+        As in line_search_backtracking.
+
+    Returns
+    -------
+    alpha : np.ndarray of shape (B,)
+    ok : np.ndarray of bool, shape (B,)
+        True for the lanes where a satisfactory step was found.
+    F_new : np.ndarray of shape (B,)
+        f at the accepted points (FX for the lanes that failed).
+    """
+    gd = np.einsum("ij,ij->i", GX, D)
+    alpha = np.full(X.shape[0], float(alpha0))
+    ok = np.zeros(X.shape[0], dtype=bool)
+    F_new = np.array(FX, dtype=float)
+
+    # Lanes without a descent direction fail immediately
+    pending = gd < 0
+
+    while np.any(pending):
+        idx = np.flatnonzero(pending)
+        F_trial = f(X[idx] + alpha[idx, None] * D[idx])
+        accept = F_trial <= FX[idx] + c1 * alpha[idx] * gd[idx]
+
+        ok[idx[accept]] = True
+        F_new[idx[accept]] = F_trial[accept]
+        pending[idx[accept]] = False
+        alpha[idx[~accept]] *= tau
+        pending &= alpha > 1e-12
+
+    alpha[~ok] = 0.0
+    return alpha, ok, F_new
+
+
+def _newton_directions(H, G):
+    """
+    Solve H_b d_b = -g_b for every lane with one stacked np.linalg.solve.
+
+    Lanes where this fails or does not give a descent direction (singular
+    or indefinite Hessian) are solved again one by one with
+    newton_direction, which shifts H_b to be positive definite as
+    newton_with_line_search does.
+    """
+    try:
+        D = np.linalg.solve(H, -G[..., None])[..., 0]
+        redo = np.flatnonzero(
+            ~(np.einsum("bi,bi->b", G, D) < 0) | ~np.all(np.isfinite(D), axis=1)
+        )
+    except np.linalg.LinAlgError:
+        D = np.empty_like(G)
+        redo = range(G.shape[0])
+
+    for b in redo:
+        D[b], _ = newton_direction(H[b], G[b])
+    return D
+
+
+def _search_with_fallback(f, X, D, FX, G):
+    """
+    Batched line search along D, then along -g for the lanes that failed
+    (the steepest-descent fallback of the scalar solvers). D is modified in
+    place for those lanes.
+    """
+    alpha, ok, F_new = line_search_backtracking_batched(f, X, D, FX, G)
+    retry = np.flatnonzero(~ok)
+    if retry.size:
+        D[retry] = -G[retry]
+        alpha[retry], ok[retry], F_new[retry] = line_search_backtracking_batched(
+            f, X[retry], D[retry], FX[retry], G[retry]
+        )
+    return alpha, ok, F_new
+
+
+class _Lanes:
+    """Per-lane iteration count, convergence flag and reason."""
+
+    def __init__(self, B):
+        self.active = np.ones(B, dtype=bool)
+        self.it = np.zeros(B, dtype=int)
+        self.converged = np.zeros(B, dtype=bool)
+        self.reason = [""] * B
+
+    def stop(self, idx, k, converged, reason, values=None):
+        """Stop lanes idx at iteration k; reason is formatted with values."""
+        for j, b in enumerate(idx):
+            self.active[b] = False
+            self.it[b] = k + 1
+            self.converged[b] = converged
+            self.reason[b] = reason if values is None else reason.format(values[j])
+
+    def finish(self, max_iter):
+        for b in np.flatnonzero(self.active):
+            self.it[b] = max_iter
+            self.reason[b] = "maximum iterations reached"
+        return self.it, self.converged, self.reason
+
+
+def newton_batched(f, grad, hess, X0, tol=1e-6, max_iter=100):
+    """
+    Newton method with backtracking line search on B starting points at once.
+
+    The B iterates advance together; each lane stops independently when its
+    gradient or step norm falls below tol. At each iteration grad and hess
+    are called once on all active lanes and the stacked Newton systems are
+    solved by a single np.linalg.solve (see _newton_directions).
+
+    Parameters
+    ----------
+    f, grad, hess : callables
+        Batched functions, e.g. from build_batched_functions_from_sympy:
+        f(X) -> (B,), grad(X) -> (B, n), hess(X) -> (B, n, n).
+    X0 : array_like of shape (B, n)
+        Starting points, one per row.
+
+    Returns
+    -------
+    X_star : np.ndarray of shape (B, n)
+    it : np.ndarray of int, shape (B,)
+        Number of iterations performed by each lane.
+    history : np.ndarray of shape (k + 1, B, n)
+        Iterates of all lanes (stopped lanes keep their last point).
+    converged : np.ndarray of bool, shape (B,)
+    reason : list of str
+    """
+    X = np.array(X0, dtype=float)
+    lanes = _Lanes(X.shape[0])
+    history = [X.copy()]
+    FX = f(X)
+    G = grad(X)
+
+    for k in range(max_iter):
+        gnorm = np.linalg.norm(G, axis=1)
+        small = lanes.active & (gnorm <= tol)
+        lanes.stop(
+            np.flatnonzero(small), k, True, "gradient norm {:.2e} <= tol", gnorm[small]
+        )
+        idx = np.flatnonzero(lanes.active)
+        if idx.size == 0:
+            break
+
+        Xa, Ga = X[idx], G[idx]
+        D = _newton_directions(hess(Xa), Ga)
+
+        alpha, ok, F_new = _search_with_fallback(f, Xa, D, FX[idx], Ga)
+        lanes.stop(idx[~ok], k, False, "line search failed")
+        idx, Xa, D, alpha, F_new = idx[ok], Xa[ok], D[ok], alpha[ok], F_new[ok]
+
+        S = alpha[:, None] * D
+        X[idx] = Xa + S
+        FX[idx] = F_new
+        history.append(X.copy())
+
+        step_norm = np.linalg.norm(S, axis=1)
+        small = step_norm <= tol
+        lanes.stop(idx[small], k, True, "step norm {:.2e} <= tol", step_norm[small])
+
+        idx = idx[~small]
+        if idx.size:
+            G[idx] = grad(X[idx])
+
+    it, converged, reason = lanes.finish(max_iter)
+    return X, it, np.array(history), converged, reason
+
+
+def bfgs_batched(f, grad, X0, tol=1e-6, max_iter=100):
+    """
+    Quasi-Newton BFGS method with backtracking line search on B starting
+    points at once.
+
+    Every lane keeps its own inverse-Hessian approximation D_b (stored as a
+    (B, n, n) stack) and is updated with the same symmetric rank-two
+    correction as bfgs_update. Each iteration makes one batched f call per
+    line-search reduction and one batched grad call.
+
+    Parameters
+    ----------
+    f, grad : callables
+        Batched functions: f(X) -> (B,), grad(X) -> (B, n).
+    X0 : array_like of shape (B, n)
+        Starting points, one per row.
+
+    Returns
+    -------
+    X_star, it, history, converged, reason
+        As in newton_batched.
+    """
+    X = np.array(X0, dtype=float)
+    B, n = X.shape
+    lanes = _Lanes(B)
+    Dstack = np.broadcast_to(np.eye(n), (B, n, n)).copy()
+    history = [X.copy()]
+    FX = f(X)
+    G = grad(X)
+
+    for k in range(max_iter):
+        gnorm = np.linalg.norm(G, axis=1)
+        small = lanes.active & (gnorm <= tol)
+        lanes.stop(
+            np.flatnonzero(small), k, True, "gradient norm {:.2e} <= tol", gnorm[small]
+        )
+        idx = np.flatnonzero(lanes.active)
+        if idx.size == 0:
+            break
+
+        Xa, Ga = X[idx], G[idx]
+        D = -np.einsum("bij,bj->bi", Dstack[idx], Ga)
+
+        alpha, ok, F_new = _search_with_fallback(f, Xa, D, FX[idx], Ga)
+        lanes.stop(idx[~ok], k, False, "line search failed")
+        idx, Xa, Ga = idx[ok], Xa[ok], Ga[ok]
+        D, alpha, F_new = D[ok], alpha[ok], F_new[ok]
+
+        S = alpha[:, None] * D
+        X[idx] = Xa + S
+        FX[idx] = F_new
+        G_new = grad(X[idx])
+        Y = G_new - Ga
+        G[idx] = G_new
+        history.append(X.copy())
+
+        # BFGS update on the lanes with y^T s > 0
+        ys = np.einsum("bi,bi->b", Y, S)
+        upd = ys > 1e-12
+        if np.any(upd):
+            Du, Su, Yu = Dstack[idx[upd]], S[upd], Y[upd]
+            rho = 1.0 / ys[upd]
+            Dy = np.einsum("bij,bj->bi", Du, Yu)
+            yDy = np.einsum("bi,bi->b", Yu, Dy)
+            W = (0.5 * (rho + rho * rho * yDy))[:, None] * Su - rho[:, None] * Dy
+            Du += Su[:, :, None] * W[:, None, :] + W[:, :, None] * Su[:, None, :]
+            Dstack[idx[upd]] = Du
+
+        step_norm = np.linalg.norm(S, axis=1)
+        small = step_norm <= tol
+        lanes.stop(idx[small], k, True, "step norm {:.2e} <= tol", step_norm[small])
+
+    it, converged, reason = lanes.finish(max_iter)
+    return X, it, np.array(history), converged, reason
@@ -0,0 +1,366 @@
+# bench_solvers.py
+"""
+Benchmark of the solvers on standard scalable test problems.
+
+Every solver is run on every problem at each dimension and the harness
+records the wall time (median of --repeat runs), iterations, f / grad / hess
+(or Hessian-vector product) call counts, convergence and the peak memory
+allocated during one run (tracemalloc, measured in a separate run).
+Function building is not timed; --backend chooses how the derivatives
+are built (symbolic "codegen" or automatic differentiation "ad").
+
+Results can be written to JSON and CSV, and compared with a baseline
+JSON written by an earlier run: a run is a regression if it no longer
+converges or needs more iterations or evaluations. These are
+deterministic, so the exit status (1 if there is any regression) can be
+used as a CI check. Wall times vary between runs and machines: runs
+slower than the baseline by more than --time-tol (relative) and
+--min-time seconds are listed separately and do not change the status.
+
+Usage:
+    python bench_solvers.py [--dims 2 10 50] [--problems ...] [--methods ...]
+                            [--backend codegen|ad]
+                            [--json out.json] [--csv out.csv]
+                            [--baseline base.json] [--time-tol 0.25]
+                            [--min-time 0.05]
+"""
+import argparse
+import csv
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils import build_functions_from_sympy, build_hvp_from_sympy
+from newton_ls import newton_with_line_search, newton_cg
+from quasi_newton_dfp import quasi_newton_dfp
+from bfgs import bfgs
+from lbfgs import lbfgs
+from trust_region import trust_region
+
+
+DEFAULT_DIMS = [2, 10, 50]
+
+
+def _names(n):
+    return ["x{}".format(i + 1) for i in range(n)]
+
+
+def extended_rosenbrock(n):
+    """Extended Rosenbrock (n even), x0 = (-1.2, 1, ...), min 0 at (1, ..., 1)."""
+    x = _names(n)
+    f = " + ".join(
+        "100*({1} - {0}**2)**2 + (1 - {0})**2".format(x[i], x[i + 1])
+        for i in range(0, n, 2)
+    )
+    x0 = np.tile([-1.2, 1.0], n // 2)
+    return f, x, x0
+
+
+def extended_powell(n):
+    """Extended Powell singular function (n multiple of 4), min 0 at 0."""
+    x = _names(n)
+    f = " + ".join(
+        "({0} + 10*{1})**2 + 5*({2} - {3})**2 + ({1} - 2*{2})**4 + 10*({0} - {3})**4".format(
+            *x[i:i + 4]
+        )
+        for i in range(0, n, 4)
+    )
+    x0 = np.tile([3.0, -1.0, 0.0, 1.0], n // 4)
+    return f, x, x0
+
+
+def tridiagonal(n):
+    """Generalized tridiagonal function, x0 = (2, ..., 2)."""
+    x = _names(n)
+    f = " + ".join(
+        "({0} + {1} - 3)**2 + ({0} - {1} + 1)**4".format(x[i], x[i + 1])
+        for i in range(n - 1)
+    )
+    return f, x, np.full(n, 2.0)
+
+
+def dixon_price(n):
+    """Dixon-Price function, x0 = (1, ..., 1), min 0."""
+    x = _names(n)
+    terms = ["({} - 1)**2".format(x[0])]
+    terms += ["{}*(2*{}**2 - {})**2".format(i + 1, x[i], x[i - 1]) for i in range(1, n)]
+    return " + ".join(terms), x, np.ones(n)
+
+
+def _pw02(expr, x0):
+    # Examples of the course (also in EXAMPLES of opti gui.py), n = 2
+    return lambda n: (expr, ["x", "y"], np.array(x0, dtype=float))
+
+
+# name -> (generator(n) -> (f_str, var_names, x0), dimension rule)
+# The rule maps a requested n to the dimension used (None: problem skipped).
+PROBLEMS = {
+    "rosenbrock": (extended_rosenbrock, lambda n: 2 * max(1, n // 2)),
+    "powell": (extended_powell, lambda n: 4 * max(1, round(n / 4))),
+    "tridiagonal": (tridiagonal, lambda n: max(n, 2)),
+    "dixon-price": (dixon_price, lambda n: max(n, 2)),
+    "pw02a": (_pw02("x**2 - 5*x*y + y**4 - 25*x - 8*y", [0.0, 0.0]), lambda n: 2),
+    "pw02b": (_pw02("(x**4 - 3) + y**4", [1.0, 1.0]), lambda n: 2),
+    "pw02c": (_pw02("x**4 - 4*y**3 + 6*(x**2 + y**2) - 4*(x + y)", [0.5, 0.5]), lambda n: 2),
+}
+
+METHODS = ("newton", "newton-lazy", "newton-cg", "trust-region", "dfp", "bfgs", "lbfgs")
+
+# Iterations a Hessian factorization is reused for by "newton-lazy"
+LAZY_REFRESH = 4
+
+# Fields compared with the baseline; a larger value is a regression
+COUNT_FIELDS = ("iterations", "nfev", "ngev", "nhev")
+
+
+def _counted(fn, counts, key):
+    def wrapper(*args, **kwargs):
+        counts[key] += 1
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def run_one(method, funcs, x0, tol, max_iter):
+    """
+    Run one solver with counting wrappers.
+
+    Returns
+    -------
+    result : tuple
+        The solver's (x_star, it, history, converged, reason).
+    counts : dict
+        Number of f, grad and hess (or hvp) calls: nfev, ngev, nhev.
+    """
+    f, grad, hess, hvp = funcs
+    counts = {"nfev": 0, "ngev": 0, "nhev": 0}
+    f = _counted(f, counts, "nfev")
+    grad = _counted(grad, counts, "ngev")
+    options = dict(tol=tol, max_iter=max_iter, record="none")
+
+    if method == "newton":
+        hess = _counted(hess, counts, "nhev")
+        result = newton_with_line_search(f, grad, hess, x0, **options)
+    elif method == "newton-lazy":
+        hess = _counted(hess, counts, "nhev")
+        result = newton_with_line_search(f, grad, hess, x0, refresh=LAZY_REFRESH, **options)
+    elif method == "newton-cg":
+        hvp = _counted(hvp, counts, "nhev")
+        result = newton_cg(f, grad, x0, hvp=hvp, **options)
+    elif method == "trust-region":
+        hess = _counted(hess, counts, "nhev")
+        result = trust_region(f, grad, hess, x0, **options)
+    elif method == "dfp":
+        result = quasi_newton_dfp(f, grad, x0, **options)
+    elif method == "bfgs":
+        result = bfgs(f, grad, x0, **options)
+    elif method == "lbfgs":
+        result = lbfgs(f, grad, x0, **options)
+    else:
+        raise ValueError(
+            "Unknown method '{}'; expected one of: {}.".format(method, ", ".join(METHODS))
+        )
+    return result, counts
+
+
+def bench(problem, n, methods, tol=1e-6, max_iter=1000, repeat=3, backend="codegen"):
+    """Rows of results of every method on one problem of dimension n."""
+    generator, _ = PROBLEMS[problem]
+    f_str, names, x0 = generator(n)
+    f, grad, hess, _ = build_functions_from_sympy(f_str, names, backend=backend)
+    hvp, _ = build_hvp_from_sympy(f_str, names, backend=backend)
+    funcs = (f, grad, hess, hvp)
+
+    rows = []
+    # Unbounded problems (pw02c) overflow on purpose
+    with np.errstate(all="ignore"):
+        for method in methods:
+            rows.append(_bench_method(method, funcs, x0, problem, len(names), tol,
+                                      max_iter, repeat))
+    return rows
+
+
+def _bench_method(method, funcs, x0, problem, n, tol, max_iter, repeat):
+    f, grad = funcs[:2]
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        (x_star, it, _, converged, reason), counts = run_one(
+            method, funcs, x0, tol, max_iter
+        )
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    run_one(method, funcs, x0, tol, max_iter)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "problem": problem,
+        "n": n,
+        "method": method,
+        "time_s": float(np.median(times)),
+        "iterations": int(it),
+        "converged": bool(converged),
+        "reason": reason,
+        "f": float(f(x_star)),
+        "gnorm": float(np.linalg.norm(grad(x_star))),
+        **counts,
+        "peak_mib": peak / 2**20,
+    }
+
+
+def run_suite(dims, problems, methods, tol=1e-6, max_iter=1000, repeat=3, out=None,
+              backend="codegen"):
+    """
+    Run the benchmark; each (problem, n) is run once even if several
+    requested dims map to it. Progress lines go to `out` (if not None).
+    """
+    rows = []
+    done = set()
+    for problem in problems:
+        _, dim_rule = PROBLEMS[problem]
+        for n in dims:
+            n_used = dim_rule(n)
+            if n_used is None or (problem, n_used) in done:
+                continue
+            done.add((problem, n_used))
+            for row in bench(problem, n_used, methods, tol, max_iter, repeat, backend):
+                rows.append(row)
+                if out is not None:
+                    print(format_row(row), file=out, flush=True)
+    return rows
+
+
+def format_header():
+    return (f"{'problem':<12} {'n':>4}  {'method':<12} {'time':>10} {'iter':>5} "
+            f"{'nfev':>6} {'ngev':>6} {'nhev':>6} {'peak':>9}  status")
+
+
+def format_row(r):
+    status = "ok" if r["converged"] else "NOT converged ({})".format(r["reason"])
+    return (f"{r['problem']:<12} {r['n']:>4}  {r['method']:<12} {r['time_s'] * 1e3:>7.2f} ms "
+            f"{r['iterations']:>5} {r['nfev']:>6} {r['ngev']:>6} {r['nhev']:>6} "
+            f"{r['peak_mib']:>5.2f} MiB  {status}")
+
+
+def write_json(rows, path):
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"meta": meta, "results": rows}, fh, indent=1)
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _matched(rows, baseline_rows):
+    """(label, row, baseline row) of the rows that are in the baseline."""
+    base = {(r["problem"], r["n"], r["method"]): r for r in baseline_rows}
+    for r in rows:
+        key = (r["problem"], r["n"], r["method"])
+        if key in base:
+            yield "{} n={} {}".format(*key), r, base[key]
+
+
+def compare(rows, baseline_rows):
+    """
+    Regressions of rows with respect to baseline_rows.
+
+    A row regresses if it converged in the baseline but not now, or uses
+    more iterations or evaluations. Wall times are not compared (see
+    slowdowns).
+
+    Returns
+    -------
+    regressions : list of str
+    """
+    regressions = []
+    for label, r, b in _matched(rows, baseline_rows):
+        if b["converged"] and not r["converged"]:
+            regressions.append(f"{label}: no longer converges ({r['reason']})")
+        for field in COUNT_FIELDS:
+            if r[field] > b[field]:
+                regressions.append(f"{label}: {field} {b[field]} -> {r[field]}")
+    return regressions
+
+
+def slowdowns(rows, baseline_rows, time_tol=0.25, min_time=0.05):
+    """
+    Rows more than (1 + time_tol) times slower than in baseline_rows, and
+    slower by more than min_time seconds (shorter runs are mostly noise).
+
+    Returns
+    -------
+    slowdowns : list of str
+    """
+    lines = []
+    for label, r, b in _matched(rows, baseline_rows):
+        if (r["time_s"] > (1.0 + time_tol) * b["time_s"]
+                and r["time_s"] - b["time_s"] > min_time):
+            lines.append(
+                f"{label}: time {b['time_s'] * 1e3:.2f} ms -> {r['time_s'] * 1e3:.2f} ms"
+            )
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--dims", type=int, nargs="+", default=DEFAULT_DIMS)
+    parser.add_argument("--problems", nargs="+", default=list(PROBLEMS), choices=list(PROBLEMS))
+    parser.add_argument("--methods", nargs="+", default=list(METHODS), choices=METHODS)
+    parser.add_argument("--backend", default="codegen", choices=("codegen", "ad"),
+                        help="derivatives: symbolic (codegen) or automatic (ad)")
+    parser.add_argument("--tol", type=float, default=1e-6)
+    parser.add_argument("--max-iter", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the results to this JSON file")
+    parser.add_argument("--csv", help="write the results to this CSV file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--time-tol", type=float, default=0.25,
+                        help="relative slowdown reported (default 0.25)")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="smallest slowdown reported, in seconds (default 0.05)")
+    args = parser.parse_args(argv)
+
+    print(format_header())
+    print("-" * 91)
+    rows = run_suite(args.dims, args.problems, args.methods, args.tol, args.max_iter,
+                     args.repeat, out=sys.stdout, backend=args.backend)
+    if args.json:
+        write_json(rows, args.json)
+    if args.csv and rows:
+        write_csv(rows, args.csv)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline_rows = json.load(fh)["results"]
+        regressions = compare(rows, baseline_rows)
+        slower = slowdowns(rows, baseline_rows, args.time_tol, args.min_time)
+        print()
+        if slower:
+            print(f"{len(slower)} slower run(s) than {args.baseline} (not a failure):")
+            for line in slower:
+                print("  " + line)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"No regression against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# bench_updates.py
+"""
+Benchmark of the inverse-Hessian updates used by BFGS and DFP.
+
+Compares, for each n, the previous dense formulas (new n x n matrices on
+every step) with the in-place O(n^2) updates bfgs_update / dfp_update:
+time per iteration and peak memory allocated by one update.
+
+Usage:
+    python bench_updates.py [n1 n2 ...]
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from bfgs import bfgs_update
+from quasi_newton_dfp import dfp_update
+
+
+DEFAULT_SIZES = [100, 500, 1000, 2000, 5000]
+
+
+def bfgs_update_dense(D, s, y):
+    """Previous BFGS update: D = V D V^T + rho s s^T with V = I - rho s y^T."""
+    n = s.size
+    rho = 1.0 / np.dot(y, s)
+    I = np.eye(n)
+    V = I - rho * np.outer(s, y)
+    return V @ D @ V.T + rho * np.outer(s, s)
+
+
+def dfp_update_dense(D, s, y):
+    """Previous DFP update: two new outer products and a new D."""
+    ys = np.dot(y, s)
+    Dy = D @ y
+    yDy = np.dot(y, Dy)
+    return D + np.outer(s, s) / ys - np.outer(Dy, Dy) / yDy
+
+
+def make_problem(n, seed=0):
+    """Random SPD D and a pair (s, y) with y^T s > 0."""
+    rng = np.random.default_rng(seed)
+    A = rng.standard_normal((n, n)) / np.sqrt(n)
+    D = A @ A.T + np.eye(n)
+    s = rng.standard_normal(n)
+    y = s + 0.1 * rng.standard_normal(n)
+    return D, s, y
+
+
+def time_per_call(fn, min_time=0.2, max_calls=1000):
+    """Average wall time of fn() over enough calls to last min_time."""
+    fn()
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or calls >= max_calls:
+            return elapsed / calls
+
+
+def peak_memory(fn):
+    """Peak bytes allocated while running fn() once."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench(n):
+    D0, s, y = make_problem(n)
+    D = D0.copy()
+    Dy = np.empty(n)
+    work = np.empty((n, n))
+
+    # The in-place updates are applied to a scratch copy; the repeated
+    # updates with the same (s, y) keep D symmetric positive definite.
+    cases = [
+        ("BFGS", "dense", lambda: bfgs_update_dense(D0, s, y)),
+        ("BFGS", "in-place", lambda: bfgs_update(D, s, y, Dy, work)),
+        ("DFP", "dense", lambda: dfp_update_dense(D0, s, y)),
+        ("DFP", "in-place", lambda: dfp_update(D, s, y, Dy, work)),
+    ]
+
+    rows = []
+    for method, variant, fn in cases:
+        t = time_per_call(fn)
+        mem = peak_memory(fn)
+        rows.append((n, method, variant, t, mem))
+    return rows
+
+
+def main(sizes):
+    print(f"{'n':>6}  {'method':<6} {'update':<9} {'time/iter':>12} {'peak memory':>12}")
+    print("-" * 52)
+    for n in sizes:
+        for n_, method, variant, t, mem in bench(n):
+            print(f"{n_:>6}  {method:<6} {variant:<9} {t * 1e3:>9.3f} ms {mem / 2**20:>9.2f} MiB")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or DEFAULT_SIZES
+    main(sizes)
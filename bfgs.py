@@ -1,69 +1,188 @@
 # bfgs.py
 import numpy as np
-from line_search import line_search_backtracking
+from line_search import get_line_search
+from history import History
+from instrument import lap_timer
+from iteration import Evaluations, IterState, run
 
 
-def bfgs(f, grad, x0, tol=1e-6, max_iter=100):
+def bfgs_update(D, s, y, Dy, work):
+    """
+    In-place BFGS update of the symmetric inverse-Hessian approximation D.
+
+    Expanding the product form gives a symmetric rank-two correction,
+        D_{k+1} = D_k + s w^T + w s^T,
+        w = 0.5 (rho + rho^2 y^T D_k y) s - rho D_k y,
+    which costs O(n^2). D_k y is written into Dy and s w^T into the
+    preallocated n x n buffer `work`, so no new matrix is allocated.
+    `work` may also hold only b < n rows: D is then updated by blocks of
+    b rows (for a D in a memory-mapped file, see checkpoint.py).
+
+    Returns
+    -------
+    updated : bool
+        False (and D unchanged) if y^T s <= 1e-12.
+    """
+    ys = np.dot(y, s)
+    if ys <= 1e-12:
+        return False
+
+    rho = 1.0 / ys
+    np.dot(D, y, out=Dy)
+    yDy = np.dot(y, Dy)
+    w = (0.5 * (rho + rho * rho * yDy)) * s - rho * Dy
+
+    if work.shape[0] == len(s):
+        np.multiply.outer(s, w, out=work)
+        D += work
+        D += work.T
+        return True
+
+    for i in range(0, len(s), work.shape[0]):
+        rows = slice(i, i + work.shape[0])
+        block = work[:len(s[rows])]
+        np.multiply.outer(s[rows], w, out=block)
+        D[rows] += block
+        np.multiply.outer(w[rows], s, out=block)
+        D[rows] += block
+    return True
+
+
+def bfgs(f, grad, x0, tol=1e-6, max_iter=100, line_search="armijo",
+         fg=None, record="all", record_n=10, callback=None,
+         stats=None, checkpoint=None):
     """
     Quasi-Newton BFGS method with line search (inverse-Hessian form).
 
     D_{k+1} = (I - rho s y^T) D_k (I - rho y s^T) + rho s s^T,
     where rho = 1 / (y^T s).
 
+    line_search selects the step rule: "armijo" (backtracking) or "wolfe"
+    (strong Wolfe). If a fused evaluator fg(x) -> (f(x), grad(x)) is given
+    (see utils.build_fused_from_sympy), it is used instead of separate f
+    and grad calls wherever both are needed.
+
+    record selects which iterates are kept in the returned history
+    ("all", "none", "final", "stride" or "ends", with record_n the stride
+    or the number kept at each end; see history.History).
+
+    If an instrument.Stats is passed as stats, it collects the call counts
+    and times of the functions and the time of each phase of the
+    iterations (direction, line search, update); it is also attached to
+    the result as history.stats.
+
+    callback(state) is called after every iteration with an
+    iteration.IterState; if it returns True the run stops. See
+    bfgs_iter for the generator form.
+
+    If a checkpoint.Checkpoint is passed as checkpoint, x, g, D and the
+    iteration are saved in its directory periodically, and a run given a
+    checkpoint that already holds a BFGS state continues from it instead
+    of x0 (see checkpoint.resume). D may then be memory-mapped.
+
     Returns
     -------
     x_star, it, history, converged, reason
     """
+    return run(
+        bfgs_iter(f, grad, x0, tol, max_iter, line_search, fg, record, record_n, stats,
+                  checkpoint),
+        callback,
+    )
+
+
+def bfgs_iter(f, grad, x0, tol=1e-6, max_iter=100, line_search="armijo",
+              fg=None, record="all", record_n=10, stats=None, checkpoint=None):
+    """
+    Generator form of bfgs.
+
+    Yields an iteration.IterState after every iteration; sending True
+    asks the solver to stop. The generator returns the result of bfgs.
+    """
+    lap = lap_timer(stats)
+    if stats is not None:
+        stats.start()
+        f, grad, fg = stats.wrap("f", f), stats.wrap("grad", grad), stats.wrap("fg", fg)
+    evals = Evaluations(f, grad, fg)
+    f, grad, fg = evals.f, evals.grad, evals.fg
+    search = get_line_search(line_search)
     x = np.array(x0, dtype=float)
     n = x.size
-    D = np.eye(n)
-    history = [x.copy()]
-    g = grad(x)
+    state = None
+    if checkpoint is None:
+        D, work = np.eye(n), np.empty((n, n))
+    else:
+        state = checkpoint.begin(
+            "bfgs", n, dict(tol=tol, max_iter=max_iter, line_search=line_search)
+        )
+        D = checkpoint.identity(n) if state is None else state["D"]
+        work = checkpoint.work(n)
+    Dy = np.empty(n)
+    if state is not None:
+        x, fx, g = state["x"], state["fx"], state["g"]
+        evals.nfev, evals.ngev = state["nfev"], state["ngev"]
+    elif fg is None:
+        fx, g = f(x), grad(x)
+    else:
+        fx, g = fg(x)
+    gnorm = np.linalg.norm(g)
+    history = History(x.size, max_iter + 1, record, record_n)
+    history.append(x, fx, gnorm)
     converged = False
     reason = ""
+    k0 = 0 if state is None else state["k"]
+    k = k0 - 1  # (it = k0 if no iteration is left)
 
-    for k in range(max_iter):
-        gnorm = np.linalg.norm(g)
+    for k in range(k0, max_iter):
         if gnorm <= tol:
             converged = True
             reason = f"gradient norm {gnorm:.2e} <= tol"
             break
+        lap()
 
         d = -D @ g
+        lap("direction")
 
-        alpha, ok = line_search_backtracking(f, grad, x, d)
+        alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
         if not ok:
             d = -g
-            alpha, ok = line_search_backtracking(f, grad, x, d)
+            alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
             if not ok:
                 reason = "line search failed"
                 break
+        lap("line search")
 
         s = alpha * d
         x_new = x + s
-        g_new = grad(x_new)
+        if g_new is None:
+            g_new = grad(x_new)
         y = g_new - g
 
-        ys = np.dot(y, s)
-        if ys > 1e-12:
-            rho = 1.0 / ys
-            I = np.eye(n)
-            V = I - rho * np.outer(s, y)
-            D = V @ D @ V.T + rho * np.outer(s, s)
+        bfgs_update(D, s, y, Dy, work)
 
         step_norm = np.linalg.norm(x_new - x)
-        history.append(x_new.copy())
+        x, g, fx = x_new, g_new, f_new
+        gnorm = np.linalg.norm(g)
+        history.append(x, fx, gnorm, alpha)
+        if checkpoint is not None:
+            checkpoint.step(k + 1, x, fx, g, D, evals)
+        lap("update")
+        stop = yield IterState(k + 1, x, fx, gnorm, alpha, evals.nfev, evals.ngev)
 
         if step_norm <= tol:
-            x = x_new
-            g = g_new
             converged = True
             reason = f"step norm {step_norm:.2e} <= tol"
             break
-
-        x, g = x_new, g_new
+        if stop:
+            reason = "stopped by callback"
+            break
 
     if not converged and reason == "":
         reason = "maximum iterations reached"
 
-    return x, k + 1, np.array(history), converged, reason
+    if checkpoint is not None:
+        checkpoint.finish()
+    if stats is not None:
+        stats.stop()
+    history.stats = stats
+    return x, k + 1, history, converged, reason
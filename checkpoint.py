@@ -0,0 +1,245 @@
+# checkpoint.py
+"""
+Checkpoints of a running solver, to continue it after the process ends
+(preemption, crash, or a larger max_iter):
+
+    ck = Checkpoint("run1", every=20)
+    bfgs(f, grad, x0, max_iter=5000, checkpoint=ck)
+    ...
+    x_star, it, history, converged, reason = resume("run1", f, grad)
+
+Passing the same Checkpoint (or resume) to a solver again continues from
+the saved state instead of x0. bfgs, quasi_newton_dfp and
+newton_with_line_search accept a checkpoint.
+
+A checkpoint is a directory: state.json (solver, settings, iteration,
+f, evaluation counts) and, for iteration k, state-k.npz (x and g; g is
+left out where the solver did not evaluate it) and D-k.npy (the inverse-Hessian approximation of BFGS/DFP). The arrays are
+written first and state.json is replaced last, so an interrupted write
+leaves the previous checkpoint intact.
+
+With memmap=True, D lives in the file D.work.npy of the directory
+instead of RAM (for an n x n matrix larger than the memory): it is
+updated in place by blocks of rows, and each checkpoint copies it to
+D-k.npy.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+_FORMAT = 1
+
+# Rows per block of the in-place updates of a memory-mapped D
+MEMMAP_ROWS = 256
+
+
+class Checkpoint:
+    """
+    Periodic checkpoint of the state of one solver run, in a directory.
+
+    Parameters
+    ----------
+    path : str
+        Directory (created if needed).
+    every : int or None
+        Write the state every `every` iterations, and at the end of the
+        run; None: only at the end.
+    memmap : bool
+        Keep D (BFGS/DFP) in a memory-mapped file of the directory.
+    """
+
+    def __init__(self, path, every=10, memmap=False):
+        self.path = path
+        self.every = every
+        self.memmap = memmap
+        self._solver = None
+        self._params = None
+        self._latest = None  # state of the last iteration seen
+        self._saved_k = None  # iteration of the last checkpoint written
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def read_state(self):
+        """Contents of state.json, or None if there is no checkpoint."""
+        try:
+            with open(self._file("state.json"), "r", encoding="utf-8") as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            return None
+        if state.get("format") != _FORMAT:
+            raise ValueError("{} was written by an incompatible version.".format(self.path))
+        return state
+
+    # ----- Called by the solvers -----
+
+    def begin(self, solver, n, params):
+        """
+        Start a run of `solver` in dimension n with the given settings.
+
+        Returns
+        -------
+        state : dict or None
+            The saved x, fx, g (None if it was not evaluated), D (None for
+            Newton), k (iterations done), nfev and ngev, or None if there
+            is no checkpoint yet.
+        """
+        self._solver, self._params = solver, dict(params)
+        os.makedirs(self.path, exist_ok=True)
+        state = self.read_state()
+        if state is None:
+            self._saved_k = 0
+            return None
+        if state["solver"] != solver or state["n"] != n:
+            raise ValueError(
+                "The checkpoint in {} is of {} in dimension {}, not {} in dimension {}.".format(
+                    self.path, state["solver"], state["n"], solver, n
+                )
+            )
+        with np.load(self._file(state["arrays"])) as arrays:
+            x = arrays["x"]
+            g = arrays["g"] if "g" in arrays.files else None
+        D = None
+        if state["D"] is not None:
+            if self.memmap:
+                work = self._file("D.work.npy")
+                shutil.copyfile(self._file(state["D"]), work)
+                D = np.load(work, mmap_mode="r+")
+            else:
+                D = np.load(self._file(state["D"]))
+        self._saved_k = state["k"]
+        return dict(x=x, fx=state["fx"], g=g, D=D, k=state["k"],
+                    nfev=state["nfev"], ngev=state["ngev"])
+
+    def identity(self, n):
+        """Initial D: the n x n identity, in RAM or memory-mapped."""
+        if not self.memmap:
+            return np.eye(n)
+        D = np.lib.format.open_memmap(self._file("D.work.npy"), mode="w+",
+                                      dtype=float, shape=(n, n))
+        D[np.arange(n), np.arange(n)] = 1.0
+        return D
+
+    def work(self, n):
+        """Buffer of the in-place D updates: n rows, or a block if memory-mapped."""
+        return np.empty((min(n, MEMMAP_ROWS) if self.memmap else n, n))
+
+    def step(self, k, x, fx, g, D, evals):
+        """
+        Record the state after iteration k; written if `every` iterations
+        have passed since the last checkpoint.
+        """
+        self._latest = (k, x, fx, g, D, evals.nfev, evals.ngev)
+        if self.every is not None and k - self._saved_k >= self.every:
+            self._write()
+
+    def finish(self):
+        """Write the last recorded state, if not written yet."""
+        if self._latest is not None and self._latest[0] != self._saved_k:
+            self._write()
+
+    def _write(self):
+        k, x, fx, g, D, nfev, ngev = self._latest
+        old = self.read_state()
+
+        arrays = "state-{}.npz".format(k)
+        tmp = self._file(arrays + ".tmp.npz")
+        if g is None:
+            np.savez(tmp, x=x)
+        else:
+            np.savez(tmp, x=x, g=g)
+        os.replace(tmp, self._file(arrays))
+
+        D_name = None
+        if D is not None:
+            D_name = "D-{}.npy".format(k)
+            tmp = self._file(D_name + ".tmp")
+            if isinstance(D, np.memmap):
+                # Copy the file, without reading D into memory
+                D.flush()
+                shutil.copyfile(D.filename, tmp)
+            else:
+                with open(tmp, "wb") as fh:
+                    np.save(fh, D)
+            os.replace(tmp, self._file(D_name))
+
+        state = {
+            "format": _FORMAT,
+            "solver": self._solver,
+            "n": int(x.size),
+            "k": int(k),
+            "fx": float(fx),
+            "nfev": int(nfev),
+            "ngev": int(ngev),
+            "arrays": arrays,
+            "D": D_name,
+            "params": self._params,
+            "every": self.every,
+            "memmap": self.memmap,
+        }
+        tmp = self._file("state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+        os.replace(tmp, self._file("state.json"))
+        self._saved_k = k
+
+        # Files of the previous checkpoint
+        if old is not None:
+            for name in (old["arrays"], old["D"]):
+                if name is not None and name not in (arrays, D_name):
+                    try:
+                        os.remove(self._file(name))
+                    except FileNotFoundError:
+                        pass
+
+
+def resume(path, f, grad, hess=None, fg=None, max_iter=None, callback=None, stats=None,
+           record="all", record_n=10):
+    """
+    Continue the run saved in the checkpoint directory `path`, with the
+    same solver and settings (max_iter may be raised), and keep
+    checkpointing it there.
+
+    Parameters
+    ----------
+    path : str
+    f, grad, hess, fg : callables
+        The functions of the problem (hess only for newton_with_line_search).
+    max_iter : int, optional
+        Total number of iterations, counting those before the checkpoint
+        (default: the saved setting).
+    callback, stats, record, record_n
+        As in the solvers; the history only holds the resumed iterations.
+
+    Returns
+    -------
+    x_star, it, history, converged, reason
+        As returned by the solver (it counts all the iterations).
+    """
+    from bfgs import bfgs
+    from newton_ls import newton_with_line_search
+    from quasi_newton_dfp import quasi_newton_dfp
+
+    checkpoint = Checkpoint(path)
+    state = checkpoint.read_state()
+    if state is None:
+        raise FileNotFoundError("No checkpoint in {}.".format(path))
+    checkpoint.every, checkpoint.memmap = state["every"], state["memmap"]
+    params = dict(state["params"])
+    if max_iter is not None:
+        params["max_iter"] = max_iter
+    with np.load(checkpoint._file(state["arrays"])) as arrays:
+        x0 = arrays["x"]
+    options = dict(fg=fg, record=record, record_n=record_n, callback=callback,
+                   stats=stats, checkpoint=checkpoint, **params)
+
+    if state["solver"] == "bfgs":
+        return bfgs(f, grad, x0, **options)
+    if state["solver"] == "dfp":
+        return quasi_newton_dfp(f, grad, x0, **options)
+    if state["solver"] == "newton":
+        return newton_with_line_search(f, grad, hess, x0, **options)
+    raise ValueError("Unknown solver '{}' in {}.".format(state["solver"], path))
@@ -0,0 +1,348 @@
+# finite_diff.py
+"""
+Derivatives of black-box objectives (plain NumPy code, simulations) by
+finite differences, for use with any of the solvers:
+
+    fd = FiniteDifferences(f, n, method="central", vectorized=True)
+    x_star, *_ = newton_with_line_search(fd.f, fd.grad, fd.hess, x0)
+
+The perturbed points of a gradient are evaluated together: in a single
+call f(X) on the stacked points if f is vectorized, otherwise on a pool
+of threads or processes (or one after the other). The Hessian and the
+Hessian-vector products are differences of gradients, and all the
+gradients they need are evaluated in the same batch. With a known
+sparsity pattern of the Hessian, columns that share no row are
+perturbed together (Curtis, Powell & Reid), so a banded Hessian costs a
+few gradients for any n.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import os
+
+import numpy as np
+
+
+METHODS = ("forward", "central", "complex")
+POOLS = ("thread", "process")
+
+_EPS = np.finfo(float).eps
+# Relative steps of the gradient, and of the differences of gradients
+# (larger when the gradient itself is approximate)
+_GRAD_STEP = {"forward": _EPS ** 0.5, "central": _EPS ** (1 / 3), "complex": 1e-20}
+_HESS_STEP = {"forward": _EPS ** (1 / 3), "central": _EPS ** 0.25, "complex": _EPS ** (1 / 3)}
+_HESS_STEP_EXACT = {"forward": _EPS ** 0.5, "central": _EPS ** (1 / 3), "complex": _EPS ** (1 / 3)}
+
+# Default bound on the size of one batch of points (number of floats)
+BATCH_FLOATS = 2 ** 21
+
+
+def cpr_groups(pattern):
+    """
+    Curtis-Powell-Reid grouping of the columns of a symmetric sparsity
+    pattern: columns in the same group have no nonzero row in common
+    (greedy coloring, in column order).
+
+    Parameters
+    ----------
+    pattern : scipy.sparse matrix or array_like of shape (n, n)
+        Nonzero entries of the Hessian (symmetrized; the diagonal is
+        always included).
+
+    Returns
+    -------
+    groups : np.ndarray of int, shape (n,)
+        Group of each column, 0 .. n_groups - 1.
+    pattern : scipy.sparse.csc_matrix
+        The symmetrized pattern, with ones at the nonzero entries.
+    """
+    from scipy.sparse import csc_matrix, identity
+
+    S = csc_matrix(pattern, dtype=bool)
+    n = S.shape[0]
+    if S.shape != (n, n):
+        raise ValueError("The sparsity pattern must be square.")
+    S = csc_matrix((S + S.T + identity(n, dtype=bool, format="csc")), dtype=float)
+    S.data[:] = 1.0
+    S.sort_indices()
+    indices, indptr = S.indices, S.indptr
+
+    groups = np.full(n, -1)
+    for j in range(n):
+        rows = indices[indptr[j]:indptr[j + 1]]
+        # Columns with a nonzero in one of these rows (S is symmetric)
+        neighbors = np.concatenate([indices[indptr[r]:indptr[r + 1]] for r in rows])
+        taken = groups[neighbors]
+        used = np.zeros(neighbors.size + 1, dtype=bool)
+        used[taken[(taken >= 0) & (taken < used.size)]] = True
+        # Smallest group not used by a neighbor
+        groups[j] = np.argmin(used)
+    return groups, S
+
+
+class FiniteDifferences:
+    """
+    Gradient, Hessian and Hessian-vector products of f by finite
+    differences.
+
+    The gradient uses n + 1 (forward), 2n (central) or n (complex step)
+    evaluations of f. The complex step, Im f(x + i h e_j) / h, has no
+    cancellation error, so it is accurate to machine precision; it
+    requires f to accept complex input, be real-analytic (no abs,
+    comparisons or np.real on the way) and return complex values: f must
+    not convert its result to float, as the functions of the utils
+    builders do (a ValueError is raised if it does).
+
+    hvp(x, v) differences two gradients (one for "forward": the gradient
+    at x is reused from the last grad call), and hess(x) one pair per
+    group of columns: n groups without a pattern, the CPR groups of
+    `sparsity` otherwise. The evaluations of all these gradients form a
+    single batch.
+
+    Parameters
+    ----------
+    f : callable
+        f(x) -> float; with vectorized=True, f(X) -> np.ndarray of shape
+        (m,) for X of shape (m, n). With method="complex", f returns
+        complex values for complex input.
+    n : int
+        Dimension.
+    method : str
+        "forward", "central" or "complex".
+    grad : callable, optional
+        Exact gradient grad(x); then only the Hessian and the products
+        are approximated, by differences of grad.
+    vectorized : bool
+        Evaluate f once on each batch of stacked points.
+    pool : str or concurrent.futures.Executor, optional
+        For f that is not vectorized: evaluate the points of a batch on a
+        "thread" or "process" pool (f must then be picklable, e.g. defined
+        at module level), or on a given executor. Default: one after the
+        other in this thread.
+    workers : int, optional
+        Size of the pool (default: the executor's default).
+    sparsity : scipy.sparse matrix or array_like, optional
+        Sparsity pattern of the Hessian (see cpr_groups); hess then
+        returns a scipy.sparse.csc_matrix. Requires SciPy.
+    batch_floats : int
+        Largest number of floats in one batch of points; larger batches
+        are evaluated in several parts.
+
+    Attributes
+    ----------
+    nfev : int
+        Number of evaluations of f (points) so far, besides the calls of
+        the method f.
+    n_groups : int
+        Number of groups of columns perturbed together by hess.
+
+    Use as a context manager, or call close(), to shut down a pool it
+    created.
+    """
+
+    def __init__(self, f, n, method="central", grad=None, vectorized=False, pool=None,
+                 workers=None, sparsity=None, batch_floats=BATCH_FLOATS):
+        if method not in METHODS:
+            raise ValueError(
+                "Unknown method '{}'; expected one of: {}.".format(method, ", ".join(METHODS))
+            )
+        if pool is not None and not isinstance(pool, Executor) and pool not in POOLS:
+            raise ValueError(
+                "Unknown pool '{}'; expected one of: {}, or an Executor.".format(
+                    pool, ", ".join(POOLS)
+                )
+            )
+        self._f, self._grad = f, grad
+        self.n = n
+        self.method = method
+        self.vectorized = vectorized
+        self._pool, self._workers = pool, workers
+        self._executor = pool if isinstance(pool, Executor) else None
+        self._batch_rows = max(1, batch_floats // max(n, 1))
+        self._last_grad = None  # (x, grad(x)) of the last grad call
+        self.nfev = 0
+
+        second = _HESS_STEP_EXACT if grad is not None else _HESS_STEP
+        self._grad_step = _GRAD_STEP[method]
+        self._hess_step = second[method]
+
+        if sparsity is None:
+            self.groups, self.pattern = np.arange(n), None
+        else:
+            self.groups, self.pattern = cpr_groups(sparsity)
+        self.n_groups = int(self.groups.max()) + 1 if n else 0
+
+    # ----- Evaluation of batches -----
+
+    def _map(self, fn, X):
+        if self._pool is None:
+            return [fn(x) for x in X]
+        if self._executor is None:
+            executor = ThreadPoolExecutor if self._pool == "thread" else ProcessPoolExecutor
+            self._executor = executor(self._workers)
+        chunksize = 1
+        if isinstance(self._executor, ProcessPoolExecutor):
+            # A few chunks per worker: fewer round trips
+            workers = self._workers or os.cpu_count() or 1
+            chunksize = max(1, len(X) // (4 * workers))
+        return list(self._executor.map(fn, X, chunksize=chunksize))
+
+    def evaluate(self, X):
+        """f at the rows of X, in one batch (np.ndarray of shape (m,))."""
+        self.nfev += len(X)
+        if self.vectorized:
+            values = np.asarray(self._f(X))
+            if values.shape != (len(X),):
+                raise ValueError(
+                    "A vectorized f must return an array of shape ({},) for {} points, "
+                    "not {}.".format(len(X), len(X), values.shape)
+                )
+            return values
+        return np.array(self._map(self._f, X))
+
+    def _perturbed_values(self, P, steps, signs):
+        """
+        f at P[p] + s * steps[p, j] * e_j for every point p, coordinate j and
+        sign s, as an array of shape (len(P), n, len(signs)); the points
+        are made and evaluated in parts of at most batch_floats floats.
+        """
+        k, n = P.shape
+        S = len(signs)
+        signs = np.asarray(signs)
+        total = k * n * S
+        dtype = complex if np.iscomplexobj(signs) else float
+        values = np.empty(total, dtype=dtype)
+        for start in range(0, total, self._batch_rows):
+            r = np.arange(start, min(start + self._batch_rows, total))
+            p, j, s = r // (n * S), (r // S) % n, r % S
+            X = P[p].astype(dtype)
+            X[np.arange(r.size), j] += signs[s] * steps[p, j]
+            F = self.evaluate(X)
+            if dtype is complex and not np.iscomplexobj(F):
+                raise ValueError(
+                    "With method='complex', f must return complex values for complex "
+                    "input; it returned {} (is its result converted to float?).".format(F.dtype)
+                )
+            values[start:start + r.size] = F
+        return values.reshape(k, n, S)
+
+    def _values(self, P):
+        # f at the rows of P, in parts
+        return np.concatenate([
+            self.evaluate(P[i:i + self._batch_rows])
+            for i in range(0, len(P), self._batch_rows)
+        ]) if len(P) else np.empty(0)
+
+    def gradients(self, P):
+        """
+        Gradients at the rows of P (shape (k, n)); all the evaluations of f
+        form one batch.
+        """
+        P = np.atleast_2d(np.asarray(P, dtype=float))
+        if self._grad is not None:
+            return np.array(self._map(self._grad, P), dtype=float).reshape(P.shape)
+
+        steps = self._grad_step * np.maximum(1.0, np.abs(P))
+        if self.method == "forward":
+            steps = (P + steps) - P  # exactly representable
+            F = self._perturbed_values(P, steps, [1.0])[:, :, 0]
+            return (F - self._values(P)[:, None]) / steps
+        if self.method == "central":
+            F = self._perturbed_values(P, steps, [1.0, -1.0])
+            return (F[:, :, 0] - F[:, :, 1]) / (2.0 * steps)
+        F = self._perturbed_values(P, steps, [1j])[:, :, 0]
+        return F.imag / steps
+
+    # ----- Functions for the solvers -----
+
+    def f(self, x):
+        return float(np.real(self._f(np.asarray(x, dtype=float))))
+
+    def grad(self, x, out=None):
+        x = np.array(x, dtype=float)
+        if self._grad is not None:
+            g = np.asarray(self._grad(x), dtype=float)
+        else:
+            (g,) = self.gradients(x[None, :])
+        self._last_grad = (x, g)
+        if out is None:
+            return g.copy()
+        out[:] = g
+        return out
+
+    def _grad_at(self, x):
+        # Gradient at x, reusing the last one computed
+        if self._last_grad is not None and np.array_equal(self._last_grad[0], x):
+            return self._last_grad[1]
+        return self.grad(x)
+
+    def hvp(self, x, v, out=None):
+        """H(x) v ~ (grad(x + t v) - grad(x - t v)) / 2t (forward: / t)."""
+        x = np.asarray(x, dtype=float)
+        v = np.asarray(v, dtype=float)
+        vnorm = np.linalg.norm(v)
+        if out is None:
+            out = np.empty(len(x))
+        if vnorm == 0:
+            out.fill(0.0)
+            return out
+        t = self._hess_step * (1.0 + np.linalg.norm(x)) / vnorm
+        if self.method == "forward":
+            g0 = self._grad_at(x)
+            (g1,) = self.gradients((x + t * v)[None, :])
+            out[:] = (g1 - g0) / t
+        else:
+            g1, g2 = self.gradients(np.array([x + t * v, x - t * v]))
+            out[:] = (g1 - g2) / (2.0 * t)
+        return out
+
+    def hess(self, x, out=None):
+        """
+        Hessian at x, from the differences of the gradients along the sum
+        of the steps of each group of columns; a dense array, or a
+        scipy.sparse.csc_matrix with a sparsity pattern (out is then
+        ignored).
+        """
+        x = np.asarray(x, dtype=float)
+        n = len(x)
+        steps = self._hess_step * np.maximum(1.0, np.abs(x))
+        steps = (x + steps) - x
+        D = np.zeros((self.n_groups, n))
+        D[self.groups, np.arange(n)] = steps
+
+        if self.method == "forward":
+            G = self.gradients(x + D)
+            delta = G - self._grad_at(x)
+        else:
+            G = self.gradients(np.concatenate([x + D, x - D]))
+            delta = (G[:self.n_groups] - G[self.n_groups:]) / 2.0
+
+        if self.pattern is None:
+            # Column j: delta[j] / steps[j]
+            H = delta.T / steps
+            H = 0.5 * (H + H.T)
+            if out is None:
+                return H
+            out[:] = H
+            return out
+
+        from scipy.sparse import csc_matrix
+
+        S = self.pattern
+        cols = np.repeat(np.arange(n), np.diff(S.indptr))
+        rows = S.indices
+        H = csc_matrix((delta[self.groups[cols], rows] / steps[cols], rows, S.indptr),
+                       shape=(n, n))
+        return ((H + H.T) * 0.5).tocsc()
+
+    # ----- Pool -----
+
+    def close(self):
+        """Shut down the pool created by this object (a given executor is left open)."""
+        if self._executor is not None and not isinstance(self._pool, Executor):
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
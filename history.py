@@ -0,0 +1,167 @@
+# history.py
+import numpy as np
+
+
+RECORD_MODES = ("all", "none", "final", "stride", "ends")
+
+
+class History:
+    """
+    Iterates of a solver run, stored in preallocated NumPy arrays.
+
+    Each record holds the iteration number k, x_k, f(x_k), ||grad f(x_k)||
+    (nan where the solver did not evaluate it) and the step alpha_k that
+    led to x_k (nan for x_0).
+
+    Which iterates are kept is set by `record`:
+
+        "all"     every iterate
+        "none"    nothing
+        "final"   only the last iterate
+        "stride"  every record_n-th iterate, and the last one
+        "ends"    the first record_n and the last record_n iterates
+
+    For "all" and "stride", the storage grows by doubling as iterates are
+    recorded (up to what max_records needs), so it is proportional to the
+    number of iterations actually run (divided by record_n for "stride").
+    For "none", "final" and "ends", it is allocated once and its size does
+    not depend on the number of iterations; the last iterates are kept in
+    a ring buffer.
+
+    A History behaves as the array of the kept iterates (len(h), h[i],
+    np.array(h)); the fields are the arrays h.k, h.x, h.f, h.gnorm and
+    h.alpha, in iteration order.
+
+    Parameters
+    ----------
+    n : int
+        Dimension.
+    max_records : int
+        Largest number of iterates that can be recorded (max_iter + 1).
+    record : str
+        One of RECORD_MODES.
+    record_n : int
+        Stride for "stride", number of iterates kept at each end for "ends"
+        (at least 1).
+    """
+
+    def __init__(self, n, max_records, record="all", record_n=10):
+        if record not in RECORD_MODES:
+            raise ValueError(
+                "Unknown record mode '{}'; expected one of: {}.".format(
+                    record, ", ".join(RECORD_MODES)
+                )
+            )
+        if record_n < 1:
+            raise ValueError("record_n must be at least 1, got {}.".format(record_n))
+
+        if record == "all":
+            head, stride, tail = max_records, 1, 0
+        elif record == "none":
+            head, stride, tail = 0, 1, 0
+        elif record == "final":
+            head, stride, tail = 0, 1, 1
+        elif record == "stride":
+            head, stride, tail = -(-max_records // record_n), record_n, 1
+        else:  # "ends"
+            head, stride, tail = min(record_n, max_records), 1, record_n
+
+        self.record = record
+        self.stats = None  # instrument.Stats of the run, if any
+        # Hessian factorizations {"done": ..., "saved": ...}, for the
+        # solvers that reuse them
+        self.factorizations = None
+        self.count = 0  # number of iterates seen
+        self._n = n
+        self._stride = stride
+        self._head_max = head
+        self._head_cap = min(head, 64) if record in ("all", "stride") else head
+        self._n_head = 0
+        self._tail_cap = tail
+        self._n_tail = 0  # number of records written to the ring
+        self._allocate(self._head_cap + tail)
+
+    def _allocate(self, size):
+        self._k = np.zeros(size, dtype=int)
+        self._x = np.empty((size, self._n))
+        self._f = np.empty(size)
+        self._gnorm = np.empty(size)
+        self._alpha = np.empty(size)
+
+    def _grow(self):
+        # The ring rows (after the head) move to the end of the new arrays
+        old = (self._k, self._x, self._f, self._gnorm, self._alpha)
+        old_cap = self._head_cap
+        self._head_cap = min(2 * self._head_cap, self._head_max)
+        self._allocate(self._head_cap + self._tail_cap)
+        for new, arr in zip((self._k, self._x, self._f, self._gnorm, self._alpha), old):
+            new[: self._n_head] = arr[: self._n_head]
+            new[self._head_cap:] = arr[old_cap:]
+
+    def append(self, x, f=np.nan, gnorm=np.nan, alpha=np.nan):
+        """Record the next iterate x (copied) with f(x), ||grad f(x)|| and alpha."""
+        k = self.count
+        self.count += 1
+        if k % self._stride == 0 and self._n_head < self._head_max:
+            if self._n_head == self._head_cap:
+                self._grow()
+            row = self._n_head
+            self._n_head += 1
+        elif self._tail_cap:
+            row = self._head_cap + self._n_tail % self._tail_cap
+            self._n_tail += 1
+        else:
+            return
+        self._k[row] = k
+        self._x[row] = x
+        self._f[row] = f
+        self._gnorm[row] = gnorm
+        self._alpha[row] = alpha
+
+    def _rows(self):
+        # Head rows, then the ring rows in iteration order
+        if self._n_tail == 0:
+            return slice(0, self._n_head)
+        start = self._head_cap
+        n_ring = min(self._n_tail, self._tail_cap)
+        ring = start + (self._n_tail - n_ring + np.arange(n_ring)) % self._tail_cap
+        if self._n_head:
+            # With a stride, the ring may hold an iterate older than the
+            # last one taken into the head
+            ring = ring[self._k[ring] > self._k[self._n_head - 1]]
+        return np.concatenate([np.arange(self._n_head), ring])
+
+    @property
+    def k(self):
+        return self._k[self._rows()]
+
+    @property
+    def x(self):
+        return self._x[self._rows()]
+
+    @property
+    def f(self):
+        return self._f[self._rows()]
+
+    @property
+    def gnorm(self):
+        return self._gnorm[self._rows()]
+
+    @property
+    def alpha(self):
+        return self._alpha[self._rows()]
+
+    def __len__(self):
+        rows = self._rows()
+        return self._n_head if isinstance(rows, slice) else len(rows)
+
+    def __getitem__(self, index):
+        return self.x[index]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.x, dtype=dtype)
+
+    def __repr__(self):
+        return "History(record={!r}, {} of {} iterates kept)".format(
+            self.record, len(self), self.count
+        )
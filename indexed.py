@@ -0,0 +1,271 @@
+# indexed.py
+"""
+Objectives written with an indexed vector x[0], ..., x[n-1] instead of n
+named variables, e.g. the extended Rosenbrock function
+
+    sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)
+
+f is a sum of top-level terms. A term sum(expr, i) is expr summed over
+every i for which all of its x[i + c] are defined (here i = 0..n-2); expr
+may use i itself, and n. Other terms may only use fixed entries x[c] (c
+may be negative, counted from the end, or written n - c).
+
+Each term is recorded once on an automatic differentiation tape (see
+autodiff.py), with x[i + c] standing for the whole slice of x it takes
+over the range of i. The generated f, grad, hvp and hess are vectorized
+NumPy kernels on these slices: nothing depends on n when building, and n
+only sets the length of the slices when evaluating.
+"""
+import ast
+from collections.abc import Sequence
+
+from autodiff import (CONSTANTS, NUMPY_NAMES as _AD_NUMPY_NAMES, Tape, adjoints,
+                      literal, op_code, parse_node, split_terms, tangent, unsupported)
+
+
+# NumPy functions used by the generated source
+NUMPY_NAMES = _AD_NUMPY_NAMES + ("arange", "full", "sum")
+
+
+class Names(Sequence):
+    """The names "x[0]", ..., "x[n-1]", made on demand."""
+
+    def __init__(self, var, n):
+        self.var, self.n = var, n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if not -self.n <= i < self.n:
+            raise IndexError(i)
+        return "{}[{}]".format(self.var, i % self.n)
+
+    def __repr__(self):
+        if self.n <= 3:
+            return "({})".format(", ".join(self))
+        return "({}, {}, ..., {})".format(self[0], self[1], self[-1])
+
+
+def _index_offset(node, index_name):
+    """
+    (c, True) for x[i + c], (c, False) for a fixed x[c], from the ast of
+    the subscript.
+    """
+    def constant(n):
+        if isinstance(n, ast.Constant) and type(n.value) is int:
+            return n.value
+        if (isinstance(n, ast.UnaryOp) and isinstance(n.op, ast.USub)
+                and isinstance(n.operand, ast.Constant) and type(n.operand.value) is int):
+            return -n.operand.value
+        return None
+
+    def is_name(n, name):
+        return isinstance(n, ast.Name) and n.id == name
+
+    c = constant(node)
+    if c is not None:
+        return c, False
+    if index_name is not None and is_name(node, index_name):
+        return 0, True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        left, right = node.left, node.right
+        c = constant(right)
+        if c is not None:
+            if isinstance(node.op, ast.Sub):
+                c = -c
+            if index_name is not None and is_name(left, index_name):
+                return c, True
+            if is_name(left, "n") and c < 0:
+                return c, False
+        c = constant(left)
+        if (c is not None and isinstance(node.op, ast.Add) and index_name is not None
+                and is_name(right, index_name)):
+            return c, True
+    raise ValueError(
+        "Index '{}' is not supported; use i + c, i - c, c or n - c.".format(ast.unparse(node))
+    )
+
+
+class _Term:
+    """One top-level term of f, recorded on its own tape."""
+
+    def __init__(self, number, node, var, sign):
+        self.number = number
+        self.tape = tape = Tape()
+        self.summed = (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                       and node.func.id == "sum")
+        index_name = None
+        if self.summed:
+            if len(node.args) != 2 or node.keywords or not isinstance(node.args[1], ast.Name):
+                raise ValueError("Write sums as sum(expression, i).")
+            node, index_name = node.args[0], node.args[1].id
+
+        def leaf(n):
+            if isinstance(n, ast.Subscript):
+                if not (isinstance(n.value, ast.Name) and n.value.id == var):
+                    raise unsupported(n)
+                return tape.var(_index_offset(n.slice, index_name))
+            if n.id == index_name:
+                return tape.leaf("index", None)
+            if n.id == "n":
+                return tape.leaf("size", None)
+            if n.id in CONSTANTS:
+                return tape.const(CONSTANTS[n.id])
+            raise ValueError(
+                "Unknown name '{}' in the expression (the variables are {}[...]).".format(
+                    n.id, var
+                )
+            )
+
+        out = parse_node(node, tape, leaf)
+        self.out = out if sign > 0 else tape.op("neg", out)
+        self.variables = [tape.ops[k][2] for k in tape.reachable([self.out])
+                          if tape.ops[k][0] == "var"]
+        offsets = [c for c, relative in self.variables if relative]
+        self.m0 = min(offsets, default=0)
+        self.m1 = max(offsets, default=0)
+        # Number of values of i, as source
+        self.count = "(n - {})".format(self.m1 - self.m0) if self.m1 > self.m0 else "n"
+
+    def slice(self, c):
+        # Slice of x holding x[i + c] for all i
+        start, stop = c - self.m0, self.m1 - c
+        return "{}:{}".format(start, "n - {}".format(stop) if stop else "")
+
+    def rows(self, key):
+        c, relative = key
+        if relative:
+            return "arange({}, n - {})".format(c - self.m0, self.m1 - c)
+        position = c if c >= 0 else "n - {}".format(-c)
+        return "full({}, {})".format(self.count, position)
+
+    def code(self, outputs):
+        """
+        Source lines evaluating the entries needed by the outputs.
+
+        Returns
+        -------
+        lines : list of str
+        names : dict
+            Source of each entry (a temporary, slice, or literal).
+        vector : dict
+            Whether each entry varies with i (an array over the range).
+        """
+        tape, t = self.tape, self.number
+        lines, names, vector = [], {}, {}
+        for k in tape.reachable(outputs):
+            op, args, value = tape.ops[k]
+            if op in ("var", "dir"):
+                array = "x" if op == "var" else "v"
+                c, relative = value
+                names[k] = "{}[{}]".format(array, self.slice(c) if relative else c)
+                vector[k] = relative
+            elif op == "index":
+                names[k] = "_i{}".format(t)
+                vector[k] = True
+                lines.append("    _i{} = arange({}, n - {})\n".format(t, -self.m0, self.m1))
+            elif op == "size":
+                names[k], vector[k] = "n", False
+            elif op == "const":
+                names[k], vector[k] = literal(value), False
+            else:
+                names[k] = "_t{}_{}".format(t, k)
+                vector[k] = any(vector[a] for a in args)
+                lines.append("    {} = {}\n".format(
+                    names[k], op_code(op, [names[a] for a in args])
+                ))
+        return lines, names, vector
+
+    def total(self, k, names, vector):
+        """Source of the sum of entry k over the range of i."""
+        if vector[k]:
+            return "sum({})".format(names[k])
+        if self.summed:
+            return "{} * {}".format(self.count, names[k])
+        return names[k]
+
+    def accumulate(self, derivatives, names, vector):
+        """Lines adding {variable: entry} into out."""
+        lines = []
+        for (c, relative), k in derivatives.items():
+            if k is None:
+                continue
+            if relative:
+                lines.append("    out[{}] += {}\n".format(self.slice(c), names[k]))
+            else:
+                lines.append("    out[{}] += {}\n".format(c, self.total(k, names, vector)))
+        return lines
+
+
+def parse_indexed(f_str, var="x"):
+    """The top-level terms of f_str (list of _Term)."""
+    f_str = f_str.replace("^", "**")
+    terms = []
+    for sign, text in split_terms(f_str):
+        node = ast.parse(text.strip(), mode="eval").body
+        terms.append(_Term(len(terms), node, var, sign))
+    return terms
+
+
+def indexed_sources(f_str, var="x"):
+    """
+    Source of f(x), grad(x, out), hvp(x, v, out) and hess(x) for an
+    indexed objective; hess returns lists of row, column and value arrays
+    of the nonzero entries (duplicates are to be summed).
+    """
+    terms = parse_indexed(f_str, var)
+    f_src = ["def f(x):\n", "    n = len(x)\n", "    _f = 0.0\n"]
+    g_src = ["def grad(x, out):\n", "    n = len(x)\n", "    out.fill(0.0)\n"]
+    hv_src = ["def hvp(x, v, out):\n", "    n = len(x)\n", "    out.fill(0.0)\n"]
+    h_src = ["def hess(x):\n", "    n = len(x)\n", "    rows, cols, vals = [], [], []\n"]
+
+    for term in terms:
+        tape = term.tape
+        lines, names, vector = term.code([term.out])
+        f_src += lines
+        f_src.append("    _f += {}\n".format(term.total(term.out, names, vector)))
+
+        adjoint = adjoints(tape, term.out)
+        lines, names, vector = term.code(list(adjoint.values()))
+        g_src += lines + term.accumulate(adjoint, names, vector)
+
+        keys = list(adjoint)
+        tangents = dict(zip(keys, tangent(tape, [adjoint[p] for p in keys])))
+        lines, names, vector = term.code(list(tangents.values()))
+        hv_src += lines + term.accumulate(tangents, names, vector)
+
+        # Hessian entries: derivative of d f / d p in the direction of q
+        one = tape.const(1.0)
+        entries = []
+        for p in keys:
+            for q in term.variables:
+                (h,) = tangent(tape, [adjoint[p]], seed=lambda key: one if key == q else None)
+                if h is not None:
+                    entries.append((p, q, h))
+        lines, names, vector = term.code([h for _, _, h in entries])
+        h_src += lines
+        for p, q, h in entries:
+            if p[1] or q[1]:
+                value = names[h] if vector[h] else "full({}, {})".format(term.count, names[h])
+                h_src.append("    rows.append({})\n".format(term.rows(p)))
+                h_src.append("    cols.append({})\n".format(term.rows(q)))
+                h_src.append("    vals.append({})\n".format(value))
+            else:
+                position = [c if c >= 0 else "n - {}".format(-c) for c, _ in (p, q)]
+                h_src.append("    rows.append([{}])\n".format(position[0]))
+                h_src.append("    cols.append([{}])\n".format(position[1]))
+                h_src.append("    vals.append([{}])\n".format(term.total(h, names, vector)))
+
+    f_src.append("    return _f\n")
+    g_src.append("    return out\n")
+    hv_src.append("    return out\n")
+    h_src.append("    return rows, cols, vals\n")
+    return {
+        "f": "".join(f_src),
+        "grad": "".join(g_src),
+        "hvp": "".join(hv_src),
+        "hess": "".join(h_src),
+    }
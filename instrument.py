@@ -0,0 +1,130 @@
+# instrument.py
+from time import perf_counter
+
+
+PHASES = ("direction", "line search", "update")
+
+
+class Stats:
+    """
+    Call counts and times of the objective functions, and time spent in
+    each phase of a solver run.
+
+    Pass a Stats as the `stats` argument of a solver (it is then also
+    available as history.stats), or wrap functions directly with
+    instrument. The solvers mark the end of each phase with lap(); the
+    phases of an iteration are:
+
+        "direction"    computing d_k (including Hessian evaluations and
+                       linear algebra)
+        "line search"  choosing alpha_k (including the f / grad calls at
+                       trial points)
+        "update"       everything after the step: new gradient, D or
+                       (s, y) update, recording
+
+    Function times overlap the phases they are called in.
+
+    Attributes
+    ----------
+    calls : dict
+        Number of calls per function name.
+    func_time : dict
+        Seconds spent per function name.
+    phase_time : dict
+        Seconds spent per phase.
+    total_time : float
+        Seconds from the start to the end of the solver run (for the
+        generator forms, including the time spent by the consumer).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.func_time = {}
+        self.phase_time = dict.fromkeys(PHASES, 0.0)
+        self.total_time = 0.0
+        self._t_start = self._t_lap = perf_counter()
+
+    def wrap(self, name, fn):
+        """fn with its calls counted and timed under `name` (None stays None)."""
+        if fn is None:
+            return None
+        calls, times = self.calls, self.func_time
+        calls.setdefault(name, 0)
+        times.setdefault(name, 0.0)
+
+        def timed(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                times[name] += perf_counter() - t0
+                calls[name] += 1
+
+        return timed
+
+    def start(self):
+        self._t_start = self._t_lap = perf_counter()
+
+    def stop(self):
+        self.total_time += perf_counter() - self._t_start
+
+    def lap(self, name=None):
+        """Add the time since the previous lap to phase `name` (None: skip)."""
+        t = perf_counter()
+        if name is not None:
+            self.phase_time[name] = self.phase_time.get(name, 0.0) + t - self._t_lap
+        self._t_lap = t
+
+    def as_dict(self):
+        return {
+            "calls": dict(self.calls),
+            "func_time": dict(self.func_time),
+            "phase_time": dict(self.phase_time),
+            "total_time": self.total_time,
+        }
+
+    def report(self):
+        """Text table of the function and phase times."""
+        total = self.total_time or sum(self.phase_time.values()) or 1.0
+        lines = [f"{'function':<12} {'calls':>7} {'time':>11} {'per call':>11} {'share':>7}"]
+        for name, calls in self.calls.items():
+            t = self.func_time[name]
+            per_call = t / calls * 1e6 if calls else 0.0
+            lines.append(f"{name:<12} {calls:>7} {t * 1e3:>8.2f} ms "
+                         f"{per_call:>8.1f} us {100 * t / total:>6.1f}%")
+        lines.append("")
+        lines.append(f"{'phase':<12} {'':>7} {'time':>11} {'':>11} {'share':>7}")
+        for name, t in self.phase_time.items():
+            lines.append(f"{name:<12} {'':>7} {t * 1e3:>8.2f} ms {'':>11} {100 * t / total:>6.1f}%")
+        lines.append(f"{'total':<12} {'':>7} {self.total_time * 1e3:>8.2f} ms")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "Stats(" + ", ".join(
+            f"{name}={calls}" for name, calls in self.calls.items()
+        ) + f", total={self.total_time:.3g} s)"
+
+
+def _no_lap(name=None):
+    pass
+
+
+def lap_timer(stats):
+    """stats.lap, or a function doing nothing if stats is None."""
+    return _no_lap if stats is None else stats.lap
+
+
+def instrument(f, grad, hess=None, stats=None):
+    """
+    Wrap f, grad and hess (e.g. from build_functions_from_sympy) with call
+    counters and timers.
+
+    Returns
+    -------
+    f, grad, hess : callables (hess None if not given)
+    stats : Stats
+        The given stats, or a new one.
+    """
+    if stats is None:
+        stats = Stats()
+    return stats.wrap("f", f), stats.wrap("grad", grad), stats.wrap("hess", hess), stats
@@ -0,0 +1,59 @@
+# iteration.py
+from collections import namedtuple
+
+
+IterState = namedtuple("IterState", "k x f gnorm alpha nfev ngev")
+IterState.__doc__ = """
+State of a solver after iteration k, as yielded by the *_iter generators.
+
+x is the solver's current iterate itself (not a copy; the solver does not
+modify it in place, it moves to a new array at the next iteration). gnorm
+is nan at a final point where the gradient was not evaluated. nfev and
+ngev count the f and grad evaluations so far (a fused fg call counts as
+one of each).
+"""
+
+
+class Evaluations:
+    """
+    f, grad and fg wrapped to count their calls.
+
+    fg is None if no fused evaluator was given.
+    """
+
+    def __init__(self, f, grad, fg=None):
+        self.nfev = 0
+        self.ngev = 0
+        self._f, self._grad, self._fg = f, grad, fg
+        if fg is None:
+            self.fg = None
+
+    def f(self, x):
+        self.nfev += 1
+        return self._f(x)
+
+    def grad(self, x):
+        self.ngev += 1
+        return self._grad(x)
+
+    def fg(self, x):
+        self.nfev += 1
+        self.ngev += 1
+        return self._fg(x)
+
+
+def run(steps, callback=None):
+    """
+    Run a solver generator to the end and return its result.
+
+    callback(state) is called with every IterState; if it returns True, the
+    solver is asked to stop (it then finishes with converged False and
+    reason "stopped by callback").
+    """
+    try:
+        state = next(steps)
+        while True:
+            stop = callback is not None and bool(callback(state))
+            state = steps.send(stop)
+    except StopIteration as e:
+        return e.value
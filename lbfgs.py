@@ -0,0 +1,174 @@
+# lbfgs.py
+import numpy as np
+from line_search import get_line_search
+from history import History
+from instrument import lap_timer
+from iteration import Evaluations, IterState, run
+
+
+def lbfgs_direction(g, S, Y, rho, start, count):
+    """
+    Two-loop recursion: returns d = -H_k g without forming H_k.
+
+    The pairs (s_i, y_i) are stored in the rows of S and Y, used as a ring
+    buffer of capacity m. The oldest stored pair is at row `start` and
+    `count` pairs are valid.
+
+    H_k^0 = gamma I with gamma = s^T y / y^T y of the newest pair.
+    """
+    m = S.shape[0]
+    q = g.copy()
+    a = np.empty(count)
+
+    # Newest to oldest
+    for j in range(count - 1, -1, -1):
+        i = (start + j) % m
+        a[j] = rho[i] * np.dot(S[i], q)
+        q -= a[j] * Y[i]
+
+    if count > 0:
+        i = (start + count - 1) % m
+        q *= np.dot(S[i], Y[i]) / np.dot(Y[i], Y[i])
+
+    # Oldest to newest
+    for j in range(count):
+        i = (start + j) % m
+        b = rho[i] * np.dot(Y[i], q)
+        q += (a[j] - b) * S[i]
+
+    return -q
+
+
+def lbfgs(f, grad, x0, tol=1e-6, max_iter=100, m=10, line_search="wolfe",
+          fg=None, record="all", record_n=10, callback=None,
+          stats=None):
+    """
+    Limited-memory BFGS method with line search.
+
+    Only the last m pairs s_k = x_{k+1} - x_k, y_k = g_{k+1} - g_k are kept,
+    and d_k = -H_k g_k is computed by the two-loop recursion, so each
+    iteration costs O(m n) time and the method needs O(m n) memory.
+
+    line_search selects the step rule: "wolfe" (strong Wolfe, default) or
+    "armijo" (backtracking). Without the curvature condition the stored
+    pairs can have y^T s close to 0 and the method may stall. If a fused
+    evaluator fg(x) -> (f(x), grad(x)) is given (see
+    utils.build_fused_from_sympy), it is used instead of separate f and
+    grad calls wherever both are needed.
+
+    record selects which iterates are kept in the returned history
+    ("all", "none", "final", "stride" or "ends", with record_n the stride
+    or the number kept at each end; see history.History).
+
+    If an instrument.Stats is passed as stats, it collects the call counts
+    and times of the functions and the time of each phase of the
+    iterations (direction, line search, update); it is also attached to
+    the result as history.stats.
+
+    callback(state) is called after every iteration with an
+    iteration.IterState; if it returns True the run stops. See
+    lbfgs_iter for the generator form.
+
+    Returns
+    -------
+    x_star, it, history, converged, reason
+    """
+    return run(
+        lbfgs_iter(f, grad, x0, tol, max_iter, m, line_search, fg, record, record_n, stats),
+        callback,
+    )
+
+
+def lbfgs_iter(f, grad, x0, tol=1e-6, max_iter=100, m=10, line_search="wolfe",
+               fg=None, record="all", record_n=10, stats=None):
+    """
+    Generator form of lbfgs.
+
+    Yields an iteration.IterState after every iteration; sending True
+    asks the solver to stop. The generator returns the result of lbfgs.
+    """
+    lap = lap_timer(stats)
+    if stats is not None:
+        stats.start()
+        f, grad, fg = stats.wrap("f", f), stats.wrap("grad", grad), stats.wrap("fg", fg)
+    evals = Evaluations(f, grad, fg)
+    f, grad, fg = evals.f, evals.grad, evals.fg
+    search = get_line_search(line_search)
+    x = np.array(x0, dtype=float)
+    n = x.size
+    m = max(int(m), 1)
+    S = np.empty((m, n))
+    Y = np.empty((m, n))
+    rho = np.empty(m)
+    start = 0
+    count = 0
+
+    if fg is None:
+        fx, g = f(x), grad(x)
+    else:
+        fx, g = fg(x)
+    gnorm = np.linalg.norm(g)
+    history = History(x.size, max_iter + 1, record, record_n)
+    history.append(x, fx, gnorm)
+    converged = False
+    reason = ""
+
+    for k in range(max_iter):
+        if gnorm <= tol:
+            converged = True
+            reason = f"gradient norm {gnorm:.2e} <= tol"
+            break
+        lap()
+
+        d = lbfgs_direction(g, S, Y, rho, start, count)
+        lap("direction")
+
+        alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
+        if not ok:
+            d = -g
+            alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
+            if not ok:
+                reason = "line search failed"
+                break
+        lap("line search")
+
+        s = alpha * d
+        x_new = x + s
+        if g_new is None:
+            g_new = grad(x_new)
+        y = g_new - g
+
+        ys = np.dot(y, s)
+        if ys > 1e-12:
+            # Overwrite the oldest pair once the buffer is full
+            i = (start + count) % m
+            S[i] = s
+            Y[i] = y
+            rho[i] = 1.0 / ys
+            if count < m:
+                count += 1
+            else:
+                start = (start + 1) % m
+
+        step_norm = np.linalg.norm(x_new - x)
+        x, g, fx = x_new, g_new, f_new
+        gnorm = np.linalg.norm(g)
+        history.append(x, fx, gnorm, alpha)
+        lap("update")
+        stop = yield IterState(k + 1, x, fx, gnorm, alpha, evals.nfev, evals.ngev)
+
+        if step_norm <= tol:
+            converged = True
+            reason = f"step norm {step_norm:.2e} <= tol"
+            break
+        if stop:
+            reason = "stopped by callback"
+            break
+
+    if not converged and reason == "":
+        reason = "maximum iterations reached"
+
+    if stats is not None:
+        stats.stop()
+    history.stats = stats
+    return x, k + 1, history, converged, reason
@@ -2,7 +2,8 @@
 import numpy as np
 
 
-def line_search_backtracking(f, grad, x, d, alpha0=1.0, c1=1e-4, tau=0.5):
+def line_search_backtracking(f, grad, x, d, alpha0=1.0, c1=1e-4, tau=0.5,
+                             fx=None, gx=None, fg=None):
     """
     Backtracking line search with Armijo condition.
 
@@ -19,26 +20,214 @@ def line_search_backtracking(f, grad, x, d, alpha0=1.0, c1=1e-4, tau=0.5):
         Armijo parameter.
     tau : float
         Step reduction factor.
+    fx, gx : float and np.ndarray, optional
+        f(x) and grad(x) if the caller already has them; they are only
+        evaluated when not given.
+    fg : callable, optional
+        Fused evaluator fg(x) -> (f(x), grad(x)). If given, trial points are
+        evaluated with it, and the gradient at the accepted point comes for
+        the price of the shared subexpressions.
 
     Returns
     -------
     alpha : float
     ok : bool
         True if a satisfactory step was found.
+    f_new : float
+        f(x + alpha d) for the accepted step (f(x) on failure).
+    g_new : np.ndarray or None
+        grad(x + alpha d) if it was evaluated (only when fg is given),
+        else None.
     """
     alpha = alpha0
-    fx = f(x)
-    g = grad(x)
-    gd = np.dot(g, d)
+    if fx is None:
+        fx = f(x)
+    if gx is None:
+        gx = grad(x)
+    gd = np.dot(gx, d)
 
     # If not a descent direction, signal failure
     if gd >= 0:
-        return 0.0, False
+        return 0.0, False, fx, None
 
     while alpha > 1e-12:
         x_new = x + alpha * d
-        if f(x_new) <= fx + c1 * alpha * gd:
-            return alpha, True
+        if fg is None:
+            f_new, g_new = f(x_new), None
+        else:
+            f_new, g_new = fg(x_new)
+        if f_new <= fx + c1 * alpha * gd:
+            return alpha, True, f_new, g_new
         alpha *= tau
 
-    return 0.0, False
+    return 0.0, False, fx, None
+
+
+def _interpolate(a, fa, dfa, b, fb, dfb):
+    """
+    Safeguarded minimizer of the interpolant of phi on [a, b] (either order).
+
+    Uses the cubic through (a, fa, dfa) and (b, fb, dfb) when dfb is known,
+    else the quadratic through (a, fa, dfa) and (b, fb). The result is kept
+    at least 10% of the interval away from both ends, and bisection is used
+    when the interpolant has no usable minimizer.
+    """
+    t = None
+    if dfb is not None:
+        d1 = dfa + dfb - 3.0 * (fa - fb) / (a - b)
+        disc = d1 * d1 - dfa * dfb
+        if disc >= 0:
+            d2 = np.copysign(np.sqrt(disc), b - a)
+            den = dfb - dfa + 2.0 * d2
+            if den != 0:
+                t = b - (b - a) * (dfb + d2 - d1) / den
+    else:
+        den = 2.0 * (fb - fa - dfa * (b - a))
+        if den > 0:
+            t = a - dfa * (b - a) ** 2 / den
+
+    lo, hi = min(a, b), max(a, b)
+    delta = 0.1 * (hi - lo)
+    if t is None or not np.isfinite(t) or t < lo + delta or t > hi - delta:
+        t = 0.5 * (a + b)
+    return t
+
+
+def line_search_wolfe(f, grad, x, d, alpha0=1.0, c1=1e-4, c2=0.9,
+                      alpha_max=1e10, max_iter=20, fx=None, gx=None, fg=None):
+    """
+    Line search enforcing the strong Wolfe conditions.
+
+        f(x + alpha d) <= f(x) + c1 alpha grad(x)^T d
+        |grad(x + alpha d)^T d| <= c2 |grad(x)^T d|
+
+    The step is first expanded until an interval containing acceptable
+    steps is bracketed, which is then shrunk by zoom with safeguarded
+    cubic/quadratic interpolation (Nocedal & Wright, Alg. 3.5 and 3.6).
+    Along a step satisfying the curvature condition, y^T s > 0, so BFGS
+    and DFP updates stay positive definite.
+
+    Parameters
+    ----------
+    f, grad : callables
+    x : np.ndarray
+        Current point.
+    d : np.ndarray
+        Search direction.
+    alpha0 : float
+        Initial step length.
+    c1, c2 : float
+        Wolfe parameters, 0 < c1 < c2 < 1.
+    alpha_max : float
+        Largest step tried while bracketing.
+    max_iter : int
+        Maximum number of trial steps in each of the two phases.
+    fx, gx : float and np.ndarray, optional
+        f(x) and grad(x) if the caller already has them.
+    fg : callable, optional
+        Fused evaluator fg(x) -> (f(x), grad(x)) used at the trial points.
+        The extra derivative then also allows cubic interpolation after a
+        step that fails the Armijo test.
+
+    Returns
+    -------
+    alpha : float
+    ok : bool
+        True if a satisfactory step was found. If the curvature condition
+        could not be met within max_iter trials, the best step found that
+        satisfies the Armijo condition is returned.
+    f_new : float
+        f(x + alpha d) (f(x) on failure).
+    g_new : np.ndarray or None
+        grad(x + alpha d) (None on failure).
+    """
+    if fx is None:
+        fx = f(x)
+    if gx is None:
+        gx = grad(x)
+    gd = np.dot(gx, d)
+
+    # If not a descent direction, signal failure
+    if gd >= 0:
+        return 0.0, False, fx, None
+
+    def evaluate(alpha):
+        # f and, if it comes with it, grad at x + alpha d
+        x_new = x + alpha * d
+        if fg is None:
+            return f(x_new), None
+        return fg(x_new)
+
+    def slope(g_new):
+        return None if g_new is None else np.dot(g_new, d)
+
+    def zoom(lo, f_lo, df_lo, g_lo, hi, f_hi, df_hi):
+        # lo satisfies the Armijo condition and has the lowest f so far;
+        # the interval between lo and hi contains acceptable steps.
+        for _ in range(max_iter):
+            if abs(hi - lo) <= 1e-12:
+                break
+            alpha = _interpolate(lo, f_lo, df_lo, hi, f_hi, df_hi)
+            f_new, g_new = evaluate(alpha)
+            if f_new > fx + c1 * alpha * gd or f_new >= f_lo:
+                hi, f_hi, df_hi = alpha, f_new, slope(g_new)
+                continue
+
+            if g_new is None:
+                g_new = grad(x + alpha * d)
+            df_new = np.dot(g_new, d)
+            if abs(df_new) <= -c2 * gd:
+                return alpha, True, f_new, g_new
+            if df_new * (hi - lo) >= 0:
+                hi, f_hi, df_hi = lo, f_lo, df_lo
+            lo, f_lo, df_lo, g_lo = alpha, f_new, df_new, g_new
+
+        if lo > 0:
+            return lo, True, f_lo, g_lo
+        return 0.0, False, fx, None
+
+    alpha_prev, f_prev, df_prev, g_prev = 0.0, fx, gd, gx
+    alpha = alpha0
+
+    for i in range(max_iter):
+        f_new, g_new = evaluate(alpha)
+        if f_new > fx + c1 * alpha * gd or (i > 0 and f_new >= f_prev):
+            return zoom(alpha_prev, f_prev, df_prev, g_prev, alpha, f_new, slope(g_new))
+
+        if g_new is None:
+            g_new = grad(x + alpha * d)
+        df_new = np.dot(g_new, d)
+        if abs(df_new) <= -c2 * gd:
+            return alpha, True, f_new, g_new
+        if df_new >= 0:
+            return zoom(alpha, f_new, df_new, g_new, alpha_prev, f_prev, df_prev)
+
+        alpha_prev, f_prev, df_prev, g_prev = alpha, f_new, df_new, g_new
+        if alpha >= alpha_max:
+            break
+        alpha = min(2.0 * alpha, alpha_max)
+
+    if alpha_prev > 0:
+        return alpha_prev, True, f_prev, g_prev
+    return 0.0, False, fx, None
+
+
+LINE_SEARCHES = {
+    "armijo": line_search_backtracking,
+    "wolfe": line_search_wolfe,
+}
+
+
+def get_line_search(name):
+    """
+    Return the line search function registered under `name`
+    ("armijo" for backtracking, "wolfe" for strong Wolfe).
+    """
+    try:
+        return LINE_SEARCHES[name]
+    except KeyError:
+        raise ValueError(
+            "Unknown line search '{}'; expected one of: {}.".format(
+                name, ", ".join(LINE_SEARCHES)
+            )
+        )
@@ -1,10 +1,56 @@
 # main.py
+"""
+Console version.
+
+Without arguments, the problem, the starting point and the method are
+asked interactively. With --batch, jobs are read from a JSONL or CSV file
+and solved on a pool of processes, and one JSON line is written per job
+as soon as it is done:
+
+    python main.py --batch jobs.jsonl [--output results.jsonl] [--workers 8]
+
+Each job record has the fields (only expression or problem, and x0, are
+required):
+
+    id          any value, copied to the result (default: record number)
+    expression  f, as in build_functions_from_sympy (or indexed, see n)
+    problem     instead of expression, variables and backend: a file
+                written by utils.export_problem, loaded with NumPy only
+    variables   list of names, or one string of names separated by spaces;
+                omit it and give n for an objective written with x[i]
+    n           dimension of an indexed objective
+    x0          list of numbers, a string of numbers separated by spaces,
+                or one number (for every coordinate)
+    method      newton, newton-cg, trust-region, dfp, bfgs (default) or lbfgs
+    tol         default 1e-6
+    max_iter    default 100
+    backend     "codegen" (default) or "ad"
+    refresh     newton: reuse each Hessian factorization for up to this
+                many iterations (default 1, see newton_with_line_search)
+    checkpoint  newton, dfp, bfgs: directory where the state is saved
+                every 10 iterations; running the job again continues
+                from it (see checkpoint.py)
+
+In a CSV file, the fields are the columns.
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import csv
+import json
+import os
+import sys
+import time
+
 import numpy as np
 
-from utils import build_functions_from_sympy
-from newton_ls import newton_with_line_search
+from utils import (CACHE_DIR_ENV, build_functions_from_indexed, build_functions_from_sympy,
+                   build_fused_from_sympy, build_hvp_from_sympy, load_problem)
+from newton_ls import newton_with_line_search, newton_cg
 from quasi_newton_dfp import quasi_newton_dfp
 from bfgs import bfgs
+from lbfgs import lbfgs
+from trust_region import trust_region
+from checkpoint import Checkpoint
 
 
 def ask_problem():
@@ -16,8 +62,17 @@ def ask_problem():
     n = int(input("Enter the dimension n: "))
 
     # Variable names
-    print("Enter variable names separated by spaces (e.g. x y or x1 x2 ...):")
+    print("Enter variable names separated by spaces (e.g. x y or x1 x2 ...),")
+    print("or leave empty to use the vector x[0], ..., x[n-1] (suited to large n).")
     names = input("Variables: ").split()
+    if not names:
+        print("\nEnter the expression of f in terms of x[0], ..., x[n-1].")
+        print("sum(expression, i) sums over every i where all x[i + c] exist, e.g.")
+        print("  sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)")
+        print("  (x[0] - 1)**2 + sum((i + 1)*(2*x[i]**2 - x[i-1])**2, i)")
+        f_str = input("f = ")
+        f, grad, hess, _, names = build_functions_from_indexed(f_str, n)
+        return f, grad, hess, names, (f_str, names, "indexed")
     if len(names) != n:
         raise ValueError("Number of variable names must equal n.")
 
@@ -28,22 +83,56 @@ def ask_problem():
     print("  (x1**4 - 3) + x2**4")
     f_str = input("f = ")
 
+    # Derivatives
+    print("\nDerivatives: 1 - symbolic (Sympy), 2 - automatic differentiation")
+    print("(automatic differentiation builds much faster for large n).")
+    if input("Your choice [1] = ").strip() == "2":
+        f, grad, hess, vars_sym = build_functions_from_sympy(f_str, names, backend="ad")
+        return f, grad, hess, vars_sym, (f_str, names, "ad")
+
     f, grad, hess, vars_sym = build_functions_from_sympy(f_str, names)
-    return f, grad, hess, vars_sym
+    return f, grad, hess, vars_sym, (f_str, names, "symbolic")
+
+
+# Menu choices of the methods with a line search (they use fg)
+LINE_SEARCH_CHOICES = ("1", "2", "3", "4", "5")
+
+
+def build_extras(source, choice):
+    """
+    Fused evaluator fg and Hessian-vector product hvp of the problem
+    returned by ask_problem, built only if the method (menu choice) uses
+    them; None otherwise.
+    """
+    f_str, names, kind = source
+    fg = hvp = None
+    if kind == "indexed":
+        if choice == "5":
+            # Memoized: the functions built by ask_problem are reused
+            hvp = build_functions_from_indexed(f_str, len(names))[3]
+        return fg, hvp
+    if kind == "symbolic" and choice in LINE_SEARCH_CHOICES:
+        fg, _, _ = build_fused_from_sympy(f_str, names)
+    if choice == "5":
+        hvp, _ = build_hvp_from_sympy(f_str, names, backend="ad" if kind == "ad" else "codegen")
+    return fg, hvp
 
 
 def ask_initial_point(vars_sym):
     print("\nInitial point x0.")
     print("Variables and order:", vars_sym)
-    print("Enter the coordinates separated by spaces (no parentheses or commas).")
+    print("Enter the coordinates separated by spaces (no parentheses or commas),")
+    print("or a single value for all of them.")
     x0_vals = [float(v) for v in input("x0 = ").split()]
+    if len(x0_vals) == 1:
+        return np.full(len(vars_sym), x0_vals[0])
     if len(x0_vals) != len(vars_sym):
         raise ValueError("Number of coordinates must equal number of variables.")
     return np.array(x0_vals, dtype=float)
 
 
-def main():
-    f, grad, hess, vars_sym = ask_problem()
+def interactive():
+    f, grad, hess, vars_sym, source = ask_problem()
     x0 = ask_initial_point(vars_sym)
 
     print()
@@ -54,23 +143,42 @@ def main():
     print("  1 - Newton with line search")
     print("  2 - Quasi-Newton (DFP) with line search")
     print("  3 - Quasi-Newton (BFGS) with line search")
+    print("  4 - Limited-memory BFGS (L-BFGS) with line search")
+    print("  5 - Newton-CG (truncated Newton) with line search")
+    print("  6 - Newton with trust region (dogleg)")
     choice = input("Your choice = ")
+    fg, hvp = build_extras(source, choice)
 
     if choice == "1":
         x_star, it, _, conv, reason = newton_with_line_search(
-            f, grad, hess, x0, tol=tol, max_iter=max_iter
+            f, grad, hess, x0, tol=tol, max_iter=max_iter, fg=fg, record="none"
         )
         method_name = "Newton with line search"
     elif choice == "2":
         x_star, it, _, conv, reason = quasi_newton_dfp(
-            f, grad, x0, tol=tol, max_iter=max_iter
+            f, grad, x0, tol=tol, max_iter=max_iter, fg=fg, record="none"
         )
         method_name = "Quasi-Newton (DFP) with line search"
     elif choice == "3":
         x_star, it, _, conv, reason = bfgs(
-            f, grad, x0, tol=tol, max_iter=max_iter
+            f, grad, x0, tol=tol, max_iter=max_iter, fg=fg, record="none"
         )
         method_name = "BFGS with line search"
+    elif choice == "4":
+        x_star, it, _, conv, reason = lbfgs(
+            f, grad, x0, tol=tol, max_iter=max_iter, fg=fg, record="none"
+        )
+        method_name = "L-BFGS with line search"
+    elif choice == "5":
+        x_star, it, _, conv, reason = newton_cg(
+            f, grad, x0, hvp=hvp, tol=tol, max_iter=max_iter, fg=fg, record="none"
+        )
+        method_name = "Newton-CG with line search"
+    elif choice == "6":
+        x_star, it, _, conv, reason = trust_region(
+            f, grad, hess, x0, tol=tol, max_iter=max_iter, record="none"
+        )
+        method_name = "Newton with trust region (dogleg)"
     else:
         print("Invalid choice.")
         return
@@ -89,5 +197,237 @@ def main():
     print(f"Reason              : {reason}")
 
 
+# ---------- Batch mode ----------
+
+BATCH_METHODS = ("newton", "newton-cg", "trust-region", "dfp", "bfgs", "lbfgs")
+
+
+def read_jobs(path):
+    """
+    Job records of a JSONL or CSV (.csv) file, read one at a time.
+
+    Yields (number, record); a line that is not valid JSON gives a record
+    with an "error" entry, so that the job is reported as failed.
+    """
+    with open(path, newline="", encoding="utf-8") as fh:
+        if path.lower().endswith(".csv"):
+            for number, row in enumerate(csv.DictReader(fh)):
+                yield number, {k: v for k, v in row.items() if v not in (None, "")}
+            return
+        number = 0
+        for line in fh:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("a job must be a JSON object")
+            except ValueError as e:
+                record = {"error": "invalid job: {}".format(e)}
+            yield number, record
+            number += 1
+
+
+def _job_functions(record):
+    """f, grad, hess, hvp (None if not built) and the dimension of a job."""
+    if record.get("problem"):
+        f, grad, hess, hvp, names = _load_problem(record["problem"], record.get("n"))
+        return f, grad, hess, hvp, len(names)
+    f_str = record["expression"]
+    backend = record.get("backend", "codegen")
+    names = record.get("variables")
+    if names is None:
+        f, grad, hess, hvp, _ = build_functions_from_indexed(f_str, int(record["n"]))
+        return f, grad, hess, hvp, int(record["n"])
+    if isinstance(names, str):
+        names = names.split()
+    # The builders are memoized: jobs with the same expression (in this
+    # process) share one build
+    f, grad, hess, _ = build_functions_from_sympy(f_str, names, backend=backend)
+    hvp = None
+    if record.get("method") == "newton-cg":
+        hvp, _ = build_hvp_from_sympy(f_str, names, backend=backend)
+    return f, grad, hess, hvp, len(names)
+
+
+_problems = {}
+
+
+def _load_problem(path, n):
+    # Loaded once per process
+    key = (path, None if n is None else int(n))
+    if key not in _problems:
+        _problems[key] = load_problem(*key)
+    return _problems[key]
+
+
+def _job_x0(value, n):
+    if isinstance(value, str):
+        value = [float(v) for v in value.split()]
+    x0 = np.array(value, dtype=float).reshape(-1)
+    if x0.size == 1:
+        return np.full(n, x0[0])
+    if x0.size != n:
+        raise ValueError("x0 has {} components, expected {}.".format(x0.size, n))
+    return x0
+
+
+def run_job(number, record):
+    """Solve one job; returns its result record (never raises)."""
+    t0 = time.perf_counter()
+    result = {"id": record.get("id", number)}
+    try:
+        if "error" in record:
+            raise ValueError(record["error"])
+        method = record.get("method", "bfgs")
+        if method not in BATCH_METHODS:
+            raise ValueError("Unknown method '{}'; expected one of: {}.".format(
+                method, ", ".join(BATCH_METHODS)))
+        f, grad, hess, hvp, n = _job_functions(record)
+        x0 = _job_x0(record["x0"], n)
+        options = dict(tol=float(record.get("tol", 1e-6)),
+                       max_iter=int(record.get("max_iter", 100)), record="none")
+        if record.get("checkpoint") and method in ("newton", "dfp", "bfgs"):
+            options["checkpoint"] = Checkpoint(record["checkpoint"])
+
+        if method == "newton":
+            x, it, _, converged, reason = newton_with_line_search(
+                f, grad, hess, x0, refresh=int(record.get("refresh", 1)), **options)
+        elif method == "newton-cg":
+            x, it, _, converged, reason = newton_cg(f, grad, x0, hvp=hvp, **options)
+        elif method == "trust-region":
+            x, it, _, converged, reason = trust_region(f, grad, hess, x0, **options)
+        elif method == "dfp":
+            x, it, _, converged, reason = quasi_newton_dfp(f, grad, x0, **options)
+        elif method == "bfgs":
+            x, it, _, converged, reason = bfgs(f, grad, x0, **options)
+        else:
+            x, it, _, converged, reason = lbfgs(f, grad, x0, **options)
+
+        result.update(
+            ok=True,
+            method=method,
+            converged=bool(converged),
+            reason=reason,
+            iterations=int(it),
+            f=float(f(x)),
+            gnorm=float(np.linalg.norm(grad(x))),
+            x=x.tolist(),
+        )
+    except Exception as e:
+        result.update(ok=False, error="{}: {}".format(type(e).__name__, e))
+    result["time_s"] = time.perf_counter() - t0
+    return result
+
+
+def _run_chunk(chunk):
+    with np.errstate(all="ignore"):
+        return [run_job(number, record) for number, record in chunk]
+
+
+def _init_batch_worker(cache_dir):
+    if cache_dir:
+        os.environ[CACHE_DIR_ENV] = cache_dir
+
+
+def _chunks(jobs, size):
+    """
+    Consecutive jobs in chunks of up to `size`; a chunk only holds jobs
+    with the same expression (or problem file), so each worker builds it once per chunk.
+    """
+    chunk, key = [], None
+    for number, record in jobs:
+        job_key = (record.get("expression"), record.get("problem"),
+                   str(record.get("variables")), record.get("n"))
+        if chunk and (job_key != key or len(chunk) == size):
+            yield chunk
+            chunk = []
+        chunk.append((number, record))
+        key = job_key
+    if chunk:
+        yield chunk
+
+
+def run_batch(path, out=sys.stdout, workers=None, chunk_size=16, cache_dir=None):
+    """
+    Solve the jobs of a JSONL/CSV file and write one JSON result line per
+    job to `out` as soon as its chunk is done (in completion order; the
+    results carry the job ids).
+
+    Jobs are read as they are submitted: at most a few chunks per worker
+    are waiting at any time, and results are not kept. With workers=1,
+    the jobs are solved in this process.
+
+    Returns
+    -------
+    n_jobs, n_failed : int
+    """
+    counts = [0, 0]
+
+    def write(results):
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+            counts[0] += 1
+            counts[1] += not result["ok"]
+        out.flush()
+
+    chunks = _chunks(read_jobs(path), chunk_size)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_batch_worker(cache_dir)
+        for chunk in chunks:
+            write(_run_chunk(chunk))
+        return tuple(counts)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(cache_dir,)) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(_run_chunk, chunk))
+            if len(pending) >= 4 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(future.result())
+    return tuple(counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Unconstrained optimization (interactive, or batch with --batch)."
+    )
+    parser.add_argument("--batch", metavar="JOBS",
+                        help="JSONL or CSV file of jobs to solve (see the module docstring)")
+    parser.add_argument("--output", help="write the JSON result lines to this file "
+                                         "(default: standard output)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument("--chunk", type=int, default=16,
+                        help="jobs sent to a worker at a time (default 16)")
+    parser.add_argument("--cache-dir",
+                        help="on-disk cache of the built functions, shared by the workers")
+    args = parser.parse_args(argv)
+
+    if args.batch is None:
+        interactive()
+        return 0
+
+    t0 = time.perf_counter()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            n_jobs, n_failed = run_batch(args.batch, out, args.workers, args.chunk,
+                                         args.cache_dir)
+    else:
+        n_jobs, n_failed = run_batch(args.batch, sys.stdout, args.workers, args.chunk,
+                                     args.cache_dir)
+    print("{} jobs, {} failed, {:.2f} s".format(n_jobs, n_failed, time.perf_counter() - t0),
+          file=sys.stderr)
+    return 1 if n_failed else 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# multistart.py
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from utils import build_functions_from_sympy, build_fused_from_sympy
+from newton_ls import newton_with_line_search
+from quasi_newton_dfp import quasi_newton_dfp
+from bfgs import bfgs
+from lbfgs import lbfgs
+
+
+METHODS = ("newton", "dfp", "bfgs", "lbfgs")
+
+
+def run_method(method, f, grad, hess, x0, tol=1e-6, max_iter=100, fg=None):
+    """
+    Run the solver named `method` ("newton", "dfp", "bfgs" or "lbfgs"),
+    with the fused evaluator fg if given.
+
+    Returns
+    -------
+    x_star, it, history, converged, reason
+    """
+    if method == "newton":
+        return newton_with_line_search(
+            f, grad, hess, x0, tol=tol, max_iter=max_iter, fg=fg
+        )
+    if method == "dfp":
+        return quasi_newton_dfp(f, grad, x0, tol=tol, max_iter=max_iter, fg=fg)
+    if method == "bfgs":
+        return bfgs(f, grad, x0, tol=tol, max_iter=max_iter, fg=fg)
+    if method == "lbfgs":
+        return lbfgs(f, grad, x0, tol=tol, max_iter=max_iter, fg=fg)
+    raise ValueError(
+        "Unknown method '{}'; expected one of: {}.".format(method, ", ".join(METHODS))
+    )
+
+
+def _box(bounds, n):
+    """Lower and upper corners from one (lo, hi) pair or n pairs."""
+    b = np.array(bounds, dtype=float)
+    if b.shape == (2,):
+        b = np.tile(b, (n, 1))
+    if b.shape != (n, 2):
+        raise ValueError("bounds must be one (lo, hi) pair or {} pairs.".format(n))
+    if np.any(b[:, 0] > b[:, 1]):
+        raise ValueError("bounds must satisfy lo <= hi.")
+    return b[:, 0], b[:, 1]
+
+
+def sample_starts(n_starts, bounds, n, sampling="lhs", seed=None):
+    """
+    Starting points in the box given by bounds.
+
+    Parameters
+    ----------
+    n_starts : int
+    bounds : (lo, hi) or sequence of n (lo, hi) pairs
+    n : int
+        Dimension.
+    sampling : str
+        "lhs" (Latin hypercube: each coordinate hits every one of the
+        n_starts equal slices exactly once) or "uniform".
+    seed : int, optional
+
+    Returns
+    -------
+    X0 : np.ndarray of shape (n_starts, n)
+    """
+    lo, hi = _box(bounds, n)
+    rng = np.random.default_rng(seed)
+    if sampling == "lhs":
+        U = (rng.permuted(np.tile(np.arange(n_starts), (n, 1)), axis=1).T
+             + rng.random((n_starts, n))) / n_starts
+    elif sampling == "uniform":
+        U = rng.random((n_starts, n))
+    else:
+        raise ValueError("sampling must be 'lhs' or 'uniform'.")
+    return lo + U * (hi - lo)
+
+
+# Functions built once per worker process by _init_worker
+_worker_functions = None
+
+
+def _init_worker(f_str, var_names):
+    global _worker_functions
+    f, grad, hess, _ = build_functions_from_sympy(f_str, var_names)
+    fg, _, _ = build_fused_from_sympy(f_str, var_names)
+    _worker_functions = (f, grad, hess, fg)
+
+
+def _solve_one(method, x0, tol, max_iter, second_order):
+    f, grad, hess, fg = _worker_functions
+    x, it, _, converged, reason = run_method(
+        method, f, grad, hess, x0, tol=tol, max_iter=max_iter, fg=fg
+    )
+    if converged and second_order:
+        # Saddle points also satisfy the stopping tests
+        lam_min = np.linalg.eigvalsh(hess(x))[0]
+        if lam_min < -np.sqrt(tol):
+            converged = False
+            reason = f"saddle point (min Hessian eigenvalue {lam_min:.2e})"
+    return x, f(x), it, converged, reason
+
+
+def distinct_minima(points, values, tol=1e-4):
+    """
+    Group points closer than tol * (1 + ||x||) and keep the lowest of each
+    group.
+
+    Returns
+    -------
+    minima : list of (x, fx, count), sorted by increasing fx
+    """
+    minima = []
+    for i in np.argsort(values):
+        x = points[i]
+        for j, (xm, fm, count) in enumerate(minima):
+            if np.linalg.norm(x - xm) <= tol * (1.0 + np.linalg.norm(xm)):
+                minima[j] = (xm, fm, count + 1)
+                break
+        else:
+            minima.append((x, float(values[i]), 1))
+    return minima
+
+
+def multistart(f_str, var_names, method="bfgs", x0s=None, n_starts=100,
+               bounds=(-5.0, 5.0), sampling="lhs", seed=None, tol=1e-6,
+               max_iter=100, max_workers=None, dedup_tol=1e-4, second_order=True):
+    """
+    Run a solver from many starting points on a pool of processes.
+
+    Each worker builds f, grad and hess from f_str once, in the pool
+    initializer, and reuses them for all of its starts. On platforms that
+    spawn processes, call this under `if __name__ == "__main__":`.
+
+    Parameters
+    ----------
+    f_str : str
+    var_names : list[str]
+    method : str
+        "newton", "dfp", "bfgs" or "lbfgs".
+    x0s : array_like of shape (B, n), optional
+        Starting points. If not given, n_starts points are sampled in
+        bounds with `sampling` ("lhs" or "uniform").
+    max_workers : int, optional
+        Number of processes (default: number of CPUs).
+    dedup_tol : float
+        Relative distance under which two minimizers are the same.
+    second_order : bool
+        If True, converged points whose Hessian has a negative eigenvalue
+        are reported as saddle points (not converged) and are not minima.
+
+    Returns
+    -------
+    x_best : np.ndarray or None
+        Lowest converged minimizer (None if no run converged).
+    f_best : float
+    minima : list of (x, fx, count)
+        Distinct minimizers of the converged runs, best first; count is the
+        number of starts that reached each one.
+    results : list of (x0, x_star, fx, it, converged, reason)
+        One entry per start, in the order of x0s.
+    """
+    if method not in METHODS:
+        raise ValueError(
+            "Unknown method '{}'; expected one of: {}.".format(method, ", ".join(METHODS))
+        )
+    n = len(var_names)
+    if x0s is None:
+        X0 = sample_starts(n_starts, bounds, n, sampling=sampling, seed=seed)
+    else:
+        X0 = np.array(x0s, dtype=float).reshape(-1, n)
+
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(X0) // (4 * workers))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(f_str, list(var_names))
+    ) as pool:
+        runs = list(pool.map(
+            _solve_one, [method] * len(X0), X0, [tol] * len(X0), [max_iter] * len(X0),
+            [second_order] * len(X0), chunksize=chunksize,
+        ))
+
+    results = [(x0,) + run for x0, run in zip(X0, runs)]
+    ok = [r for r in results if r[4] and np.isfinite(r[2])]
+    if not ok:
+        return None, np.inf, [], results
+
+    minima = distinct_minima(
+        np.array([r[1] for r in ok]), np.array([r[2] for r in ok]), tol=dedup_tol
+    )
+    x_best, f_best, _ = minima[0]
+    return x_best, f_best, minima, results
@@ -1,69 +1,532 @@
 # newton_ls.py
 import numpy as np
-from line_search import line_search_backtracking
+from line_search import get_line_search
+from history import History
+from instrument import lap_timer
+from iteration import Evaluations, IterState, run
 
+try:
+    from scipy.linalg import cho_factor, cho_solve
+    from scipy.sparse import issparse
+except ImportError:  # SciPy is optional
+    cho_factor = cho_solve = None
 
-def newton_with_line_search(f, grad, hess, x0, tol=1e-6, max_iter=100):
+    def issparse(H):
+        return False
+
+
+def newton_factor(H, beta=1e-3, max_tries=60):
+    """
+    Cholesky factorization of H + tau I, shifted to be positive definite.
+
+    tau = 0 if H is positive definite; otherwise tau starts at
+    beta - min(diag H) (or beta) and is doubled until the Cholesky
+    factorization succeeds (Nocedal & Wright, Alg. 3.3).
+
+    The triangular solves use scipy.linalg.cho_solve when SciPy is
+    installed, and _cholesky_solve (substitution with the factor L)
+    without it.
+
+    Returns
+    -------
+    solve : callable or None
+        solve(b) -> (H + tau I)^{-1} b; None if no factorization succeeded.
+    tau : float
+        Shift that was added to the diagonal (inf if none succeeded).
     """
-    Newton method with backtracking line search.
+    n = len(H)
+    diag_min = np.min(np.diag(H))
+    tau = 0.0 if diag_min > 0 else beta - diag_min
+
+    for _ in range(max_tries):
+        H_shift = H + tau * np.eye(n) if tau > 0 else H
+        try:
+            if cho_factor is not None:
+                c = cho_factor(H_shift, lower=True, check_finite=False)
+                if np.all(np.isfinite(np.diag(c[0]))):
+                    return (lambda b: cho_solve(c, b, check_finite=False)), tau
+            else:
+                L = np.linalg.cholesky(H_shift)
+                if np.all(np.isfinite(np.diag(L))):
+                    return (lambda b: _cholesky_solve(L, b)), tau
+        except np.linalg.LinAlgError:
+            pass
+        tau = max(2.0 * tau, beta)
+
+    return None, np.inf
+
+
+def _cholesky_solve(L, b):
+    """Solve L L^T x = b by forward and back substitution (L lower triangular)."""
+    n = len(L)
+    y = np.array(b, dtype=float)
+    for i in range(n):
+        y[i] = (y[i] - L[i, :i] @ y[:i]) / L[i, i]
+    for i in range(n - 1, -1, -1):
+        y[i] = (y[i] - L[i + 1:, i] @ y[i + 1:]) / L[i, i]
+    return y
+
+
+def newton_direction(H, g, beta=1e-3, max_tries=60):
+    """
+    Newton direction d = -(H + tau I)^{-1} g from a Cholesky factorization
+    (see newton_factor). The direction is always a descent direction, also
+    where H is indefinite.
+
+    Returns
+    -------
+    d : np.ndarray
+    tau : float
+        Shift that was added to the diagonal (-g is returned, with
+        tau = inf, if no factorization succeeded).
+    """
+    solve, tau = newton_factor(H, beta, max_tries)
+    if solve is not None:
+        d = solve(-g)
+        if np.all(np.isfinite(d)):
+            return d, tau
+    return -g, np.inf
+
+
+def _sparse_newton_factor(H, ordering, beta=1e-3, max_tries=60):
+    """
+    Sparse factorization (SuperLU) of H + tau I for a scipy.sparse
+    Hessian, shifted to be positive definite as in newton_factor.
+
+    SuperLU factorizes with diagonal pivots only, so H + tau I = L U with
+    diag(U) the pivots of its LDL^T factorization: it is positive definite
+    if they are all positive (and no row was exchanged), otherwise tau is
+    raised.
+
+    The reverse Cuthill-McKee ordering of the pattern is computed on the
+    first call and stored in the dict `ordering`; the pattern does not
+    change between iterations, so later calls only permute and factorize.
+
+    Returns
+    -------
+    solve : callable or None
+        solve(b) -> (H + tau I)^{-1} b; None if no factorization succeeded.
+    tau : float
+        Shift that was added to the diagonal (inf if none succeeded).
+    """
+    from scipy.sparse import identity
+    from scipy.sparse.csgraph import reverse_cuthill_mckee
+    from scipy.sparse.linalg import splu
+
+    H = H.tocsc()
+    if "perm" not in ordering:
+        ordering["perm"] = reverse_cuthill_mckee(H, symmetric_mode=True)
+    p = ordering["perm"]
+    Hp = H[p][:, p].tocsc()
+    options = dict(SymmetricMode=True)
+
+    n = H.shape[0]
+    diag_min = Hp.diagonal().min()
+    tau = 0.0 if diag_min > 0 else beta - diag_min
+
+    for _ in range(max_tries):
+        H_shift = (Hp + tau * identity(n, format="csc")).tocsc() if tau > 0 else Hp
+        try:
+            lu = splu(H_shift, permc_spec="NATURAL", diag_pivot_thresh=0.0,
+                      options=options)
+        except RuntimeError:  # exactly singular
+            lu = None
+        if (lu is not None and np.all(lu.perm_r == np.arange(n))
+                and np.all(lu.U.diagonal() > 0)):
+            break
+        tau = max(2.0 * tau, beta)
+    else:
+        return None, np.inf
+
+    def solve(b):
+        d = np.empty_like(b)
+        d[p] = lu.solve(b[p])
+        return d
+
+    return solve, tau
+
+
+def _sparse_newton_direction(H, g, ordering):
+    """
+    Direction -(H + tau I)^{-1} g for a scipy.sparse Hessian (see
+    _sparse_newton_factor); -g if no factorization succeeded.
+    """
+    solve, _ = _sparse_newton_factor(H, ordering)
+    return -g if solve is None else solve(-g)
+
+
+def newton_with_line_search(f, grad, hess, x0, tol=1e-6, max_iter=100,
+                            line_search="armijo", fg=None, record="all",
+                            record_n=10, callback=None,
+                            stats=None, refresh=1, contraction=0.5, checkpoint=None):
+    """
+    Newton method with line search.
 
     x_{k+1} = x_k + alpha_k * d_k,
     d_k = -H(x_k)^{-1} grad(x_k).
 
+    The system is solved by a Cholesky factorization; where H(x_k) is not
+    positive definite, a multiple of the identity is added first (see
+    newton_direction), so d_k is always a descent direction.
+
+    line_search selects the step rule: "armijo" (backtracking) or "wolfe"
+    (strong Wolfe). If a fused evaluator fg(x) -> (f(x), grad(x)) is given
+    (see utils.build_fused_from_sympy), it is used instead of separate f
+    and grad calls wherever both are needed.
+
+    hess may return a scipy.sparse matrix (see the sparse option of
+    utils.build_functions_from_sympy); the Newton system is then solved by
+    a sparse factorization instead of a dense one. Any other result is
+    converted to a dense array.
+
+    With refresh > 1 the factorization is kept and reused for up to
+    `refresh` iterations (Shamanskii's method, or "lazy Newton"): those
+    iterations cost one solve with the factors and no Hessian evaluation.
+    The Hessian is evaluated and factorized again earlier if progress
+    stalls, i.e. if the full step was not accepted by the line search or
+    ||g_{k+1}|| > contraction * ||g_k||, and whenever the old factors do
+    not give a descent direction. The numbers of factorizations done and
+    saved are given as history.factorizations.
+
+    If a checkpoint.Checkpoint is passed as checkpoint, x, g and the
+    iteration are saved in its directory periodically, and a run given a
+    checkpoint that already holds a Newton state continues from it
+    instead of x0 (see checkpoint.resume; the Hessian is evaluated again
+    at the saved point).
+
+    record selects which iterates are kept in the returned history
+    ("all", "none", "final", "stride" or "ends", with record_n the stride
+    or the number kept at each end; see history.History).
+
+    If an instrument.Stats is passed as stats, it collects the call counts
+    and times of the functions and the time of each phase of the
+    iterations (direction, line search, update); it is also attached to
+    the result as history.stats.
+
+    callback(state) is called after every iteration with an
+    iteration.IterState; if it returns True the run stops. See
+    newton_with_line_search_iter for the generator form.
+
+    Returns
+    -------
+    x_star : np.ndarray
+    it : int
+        Number of iterations performed.
+    history : history.History
+        Recorded iterates x_k, with f(x_k), ||grad f(x_k)|| and alpha_k
+        (np.array(history) is the array of iterates).
+    converged : bool
+    reason : str
+    """
+    return run(
+        newton_with_line_search_iter(
+            f, grad, hess, x0, tol, max_iter, line_search, fg, record, record_n, stats,
+            refresh, contraction, checkpoint,
+        ),
+        callback,
+    )
+
+
+def newton_with_line_search_iter(f, grad, hess, x0, tol=1e-6, max_iter=100,
+                                 line_search="armijo", fg=None, record="all",
+                                 record_n=10, stats=None, refresh=1, contraction=0.5,
+                                 checkpoint=None):
+    """
+    Generator form of newton_with_line_search.
+
+    Yields an iteration.IterState after every iteration; sending True
+    asks the solver to stop. The generator returns the result of
+    newton_with_line_search.
+    """
+    lap = lap_timer(stats)
+    if stats is not None:
+        stats.start()
+        f, grad, fg = stats.wrap("f", f), stats.wrap("grad", grad), stats.wrap("fg", fg)
+        hess = stats.wrap("hess", hess)
+    evals = Evaluations(f, grad, fg)
+    f, grad, fg = evals.f, evals.grad, evals.fg
+    search = get_line_search(line_search)
+    x = np.array(x0, dtype=float)
+    state = None
+    if checkpoint is not None:
+        state = checkpoint.begin("newton", x.size, dict(
+            tol=tol, max_iter=max_iter, line_search=line_search, refresh=refresh,
+            contraction=contraction,
+        ))
+    if state is not None:
+        x, fx, g = state["x"], state["fx"], state["g"]
+        evals.nfev, evals.ngev = state["nfev"], state["ngev"]
+        if g is None:
+            # Saved at a stop on the step norm, where grad was not evaluated
+            g = grad(x)
+    elif fg is None:
+        fx, g = f(x), grad(x)
+    else:
+        fx, g = fg(x)
+    gnorm = np.linalg.norm(g)
+    history = History(x.size, max_iter + 1, record, record_n)
+    history.append(x, fx, gnorm)
+    converged = False
+    reason = ""
+    ordering = {}
+    solve = None  # factorization of the Hessian at an earlier iterate
+    age = 0  # number of directions computed with it
+    n_factorized = n_saved = 0
+    k0 = 0 if state is None else state["k"]
+    k = k0 - 1  # (it = k0 if no iteration is left)
+
+    for k in range(k0, max_iter):
+        if gnorm <= tol:
+            converged = True
+            reason = f"gradient norm {gnorm:.2e} <= tol"
+            break
+        lap()
+
+        d = None
+        if solve is not None and age < refresh:
+            d = solve(-g)
+            if np.all(np.isfinite(d)) and np.dot(g, d) < 0:
+                n_saved += 1
+            else:
+                d = None
+        if d is None:
+            H = hess(x)
+            # Factorize H + tau I, shifted to be positive definite
+            if issparse(H):
+                solve, _ = _sparse_newton_factor(H, ordering)
+            else:
+                solve, _ = newton_factor(np.asarray(H, dtype=float))
+            d = None if solve is None else solve(-g)
+            if d is None or not np.all(np.isfinite(d)):
+                d = -g
+            n_factorized += 1
+            age = 0
+        age += 1
+        lap("direction")
+
+        alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
+        stalled = not ok or alpha < 1.0
+        if not ok:
+            # Try steepest descent once
+            d = -g
+            alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
+            if not ok:
+                reason = "line search failed"
+                break
+        lap("line search")
+
+        x_new = x + alpha * d
+        step_norm = np.linalg.norm(x_new - x)
+        x, fx = x_new, f_new
+        if g_new is None and step_norm > tol:
+            # (at a final point, grad is not evaluated just for the record)
+            g_new = grad(x)
+        g = g_new
+        gnorm_old, gnorm = gnorm, np.nan if g is None else np.linalg.norm(g)
+        if stalled or gnorm > contraction * gnorm_old:
+            # Refresh the Hessian at the next iteration
+            age = refresh
+        history.append(x, fx, gnorm, alpha)
+        if checkpoint is not None:
+            checkpoint.step(k + 1, x, fx, g, None, evals)
+        lap("update")
+        stop = yield IterState(k + 1, x, fx, gnorm, alpha, evals.nfev, evals.ngev)
+
+        if step_norm <= tol:
+            converged = True
+            reason = f"step norm {step_norm:.2e} <= tol"
+            break
+        if stop:
+            reason = "stopped by callback"
+            break
+
+    if not converged and reason == "":
+        reason = "maximum iterations reached"
+
+    if checkpoint is not None:
+        checkpoint.finish()
+    if stats is not None:
+        stats.stop()
+    history.stats = stats
+    history.factorizations = {"done": n_factorized, "saved": n_saved}
+    return x, k + 1, history, converged, reason
+
+
+def _truncated_cg(Hv, g, tol, max_iter):
+    """
+    Approximate solution of H d = -g by conjugate gradients, using only
+    products Hv(p) = H p.
+
+    Stops when the residual norm is <= tol, or when a direction of
+    nonpositive curvature is met; in that case the iterate so far is
+    returned (-g if it happens at the first iteration), which is always a
+    descent direction.
+
+    Returns
+    -------
+    d : np.ndarray
+    n_products : int
+        Number of Hessian-vector products used.
+    """
+    z = np.zeros_like(g)
+    r = g.copy()
+    p = -r
+    rr = np.dot(r, r)
+
+    for j in range(max_iter):
+        Hp = Hv(p)
+        pHp = np.dot(p, Hp)
+        if pHp <= 0:
+            # Negative curvature
+            return (-g if j == 0 else z), j + 1
+
+        a = rr / pHp
+        z += a * p
+        r += a * Hp
+        rr_new = np.dot(r, r)
+        if np.sqrt(rr_new) <= tol:
+            return z, j + 1
+
+        p *= rr_new / rr
+        p -= r
+        rr = rr_new
+
+    return z, max_iter
+
+
+def newton_cg(f, grad, x0, hvp=None, tol=1e-6, max_iter=100, line_search="armijo",
+              fg=None, cg_max_iter=None, record="all", record_n=10, callback=None,
+              stats=None):
+    """
+    Inexact (truncated) Newton method with line search.
+
+    The Newton system H(x_k) d = -grad(x_k) is solved approximately by
+    conjugate gradients, to the relative residual
+        eta_k = min(0.5, sqrt(||grad(x_k)||))
+    (loose far from the solution, tighter near it, for superlinear
+    convergence), and CG stops at directions of negative curvature. Only
+    Hessian-vector products are used: the n x n Hessian is never formed.
+
+    Parameters
+    ----------
+    f, grad : callables
+    x0 : array_like
+    hvp : callable, optional
+        hvp(x, v) -> H(x) v, e.g. from utils.build_hvp_from_sympy. If not
+        given, products are approximated by a forward difference of grad:
+        H v ~ (grad(x + h v) - grad(x)) / h.
+    tol, max_iter, line_search, fg
+        As in newton_with_line_search.
+    cg_max_iter : int, optional
+        Maximum number of CG iterations per Newton step (default: n).
+    record, record_n, callback, stats
+        As in newton_with_line_search (newton_cg_iter is the generator
+        form).
+
     Returns
     -------
     x_star : np.ndarray
     it : int
         Number of iterations performed.
-    history : np.ndarray
-        Array of iterates x_k.
+    history : history.History
+        Recorded iterates x_k, with f(x_k), ||grad f(x_k)|| and alpha_k
+        (np.array(history) is the array of iterates).
     converged : bool
     reason : str
     """
+    return run(
+        newton_cg_iter(
+            f, grad, x0, hvp, tol, max_iter, line_search, fg, cg_max_iter,
+            record, record_n, stats,
+        ),
+        callback,
+    )
+
+
+def newton_cg_iter(f, grad, x0, hvp=None, tol=1e-6, max_iter=100, line_search="armijo",
+                   fg=None, cg_max_iter=None, record="all", record_n=10, stats=None):
+    """
+    Generator form of newton_cg.
+
+    Yields an iteration.IterState after every iteration; sending True
+    asks the solver to stop. The generator returns the result of
+    newton_cg.
+    """
+    lap = lap_timer(stats)
+    if stats is not None:
+        stats.start()
+        f, grad, fg = stats.wrap("f", f), stats.wrap("grad", grad), stats.wrap("fg", fg)
+        hvp = stats.wrap("hvp", hvp)
+    evals = Evaluations(f, grad, fg)
+    f, grad, fg = evals.f, evals.grad, evals.fg
+    search = get_line_search(line_search)
     x = np.array(x0, dtype=float)
-    history = [x.copy()]
+    if fg is None:
+        fx, g = f(x), grad(x)
+    else:
+        fx, g = fg(x)
+    gnorm = np.linalg.norm(g)
+    history = History(x.size, max_iter + 1, record, record_n)
+    history.append(x, fx, gnorm)
+    if cg_max_iter is None:
+        cg_max_iter = len(x)
     converged = False
     reason = ""
 
     for k in range(max_iter):
-        g = grad(x)
-        gnorm = np.linalg.norm(g)
         if gnorm <= tol:
             converged = True
             reason = f"gradient norm {gnorm:.2e} <= tol"
             break
+        lap()
 
-        H = hess(x)
+        if hvp is not None:
+            Hv = lambda v: hvp(x, v)
+        else:
+            xnorm = np.linalg.norm(x)
 
-        # Solve H d = -g (with simple regularization if needed)
-        try:
-            d = np.linalg.solve(H, -g)
-        except np.linalg.LinAlgError:
-            H_reg = H + 1e-6 * np.eye(len(x))
-            d = np.linalg.solve(H_reg, -g)
+            def Hv(v):
+                h = np.sqrt(np.finfo(float).eps) * (1.0 + xnorm) / np.linalg.norm(v)
+                return (grad(x + h * v) - g) / h
 
-        alpha, ok = line_search_backtracking(f, grad, x, d)
+        eta = min(0.5, np.sqrt(gnorm))
+        d, _ = _truncated_cg(Hv, g, eta * gnorm, cg_max_iter)
+        lap("direction")
+
+        alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
         if not ok:
             # Try steepest descent once
             d = -g
-            alpha, ok = line_search_backtracking(f, grad, x, d)
+            alpha, ok, f_new, g_new = search(f, grad, x, d, fx=fx, gx=g, fg=fg)
             if not ok:
                 reason = "line search failed"
                 break
+        lap("line search")
 
         x_new = x + alpha * d
         step_norm = np.linalg.norm(x_new - x)
-        history.append(x_new.copy())
+        x, fx = x_new, f_new
+        if g_new is None and step_norm > tol:
+            # (at a final point, grad is not evaluated just for the record)
+            g_new = grad(x)
+        g = g_new
+        gnorm = np.nan if g is None else np.linalg.norm(g)
+        history.append(x, fx, gnorm, alpha)
+        lap("update")
+        stop = yield IterState(k + 1, x, fx, gnorm, alpha, evals.nfev, evals.ngev)
 
         if step_norm <= tol:
-            x = x_new
             converged = True
             reason = f"step norm {step_norm:.2e} <= tol"
             break
-
-        x = x_new
+        if stop:
+            reason = "stopped by callback"
+            break
 
     if not converged and reason == "":
         reason = "maximum iterations reached"
 
-    return x, k + 1, np.array(history), converged, reason
+    if stats is not None:
+        stats.stop()
+    history.stats = stats
+    return x, k + 1, history, converged, reason
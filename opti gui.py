@@ -1,13 +1,18 @@
 # opti_gui.py
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
 
 import numpy as np
 
-from utils import build_functions_from_sympy
-from newton_ls import newton_with_line_search
+from utils import (build_functions_from_indexed, build_functions_from_sympy,
+                   build_fused_from_sympy, build_hvp_from_sympy)
+from newton_ls import newton_with_line_search, newton_cg
 from quasi_newton_dfp import quasi_newton_dfp
 from bfgs import bfgs
+from lbfgs import lbfgs
+from trust_region import trust_region
 
 
 METHOD_DESCRIPTIONS = {
@@ -28,13 +33,46 @@ METHOD_DESCRIPTIONS = {
         "• Direction: d_k = -D_k ∇f(x_k), step α from line search.\n"
         "• In practice, often the most robust and efficient Quasi-Newton method."
     ),
+    "Limited-memory BFGS (L-BFGS) with line search": (
+        "• Same idea as BFGS, but D_k is never stored as an n × n matrix.\n"
+        "• Only the last m pairs (s_k, y_k) are kept; d_k = -D_k ∇f(x_k) is\n"
+        "  computed from them with the two-loop recursion.\n"
+        "• Cost and memory per iteration are O(m n): suited to large n."
+    ),
+    "Newton-CG (truncated Newton) with line search": (
+        "• Solves H(x_k) d_k = -∇f(x_k) only approximately, by conjugate gradients.\n"
+        "• CG needs only Hessian-vector products H v; the Hessian is never formed.\n"
+        "• Loose solves far from the minimum, tighter ones close to it.\n"
+        "• Keeps Newton-like convergence at a cost suited to large n."
+    ),
+    "Newton with trust region (dogleg)": (
+        "• Minimizes the quadratic model of f inside a ball of radius Δ_k.\n"
+        "• Dogleg step: between the steepest-descent (Cauchy) point and the Newton step.\n"
+        "• Δ_k shrinks after a poor step and grows after a good one.\n"
+        "• Handles indefinite Hessians (nonconvex f) without a line search."
+    ),
 }
 
+# Iterations shown in the history panel (only these are recorded: the
+# first and last HISTORY_ROWS // 2)
+HISTORY_ROWS = 20
+
+# Coordinates shown per iteration in the history panel (and rows of x*)
+HISTORY_COORDS = 10
+
+# Interval at which the GUI polls the solver thread (also the plot refresh)
+POLL_MS = 100
+
+# Iterations waiting for the next poll; the solver drops the ones that
+# come while the queue is full (they are only missing from the plot)
+QUEUE_SIZE = 1000
+
 EXAMPLES = {
     "Custom": "",
     "PW02 (a)": "x**2 - 5*x*y + y**4 - 25*x - 8*y",
     "PW02 (b)": "(x**4 - 3) + y**4",
     "PW02 (c)": "x**4 - 4*y**3 + 6*(x**2 + y**2) - 4*(x + y)",
+    "Rosenbrock x[i]": "sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)",
 }
 
 
@@ -157,6 +195,9 @@ class OptiApp(tk.Tk):
             if expr:
                 self.func_text.delete("1.0", tk.END)
                 self.func_text.insert("1.0", expr)
+                if "x[" in expr:
+                    # Indexed objectives use the vector x, not named variables
+                    self.vars_var.set("")
 
         ex_combo.bind("<<ComboboxSelected>>", on_example_change)
 
@@ -164,7 +205,9 @@ class OptiApp(tk.Tk):
             "Examples:\n"
             "  x**2 - 5*x*y + y**4 - 25*x - 8*y\n"
             "  (x1**4 - 3) + x2**4\n"
-            "Use exact variable names given above (x, y, x1, x2, ...)."
+            "Use exact variable names given above (x, y, x1, x2, ...).\n"
+            "With no variable names, f uses the vector x[0], ..., x[n-1]:\n"
+            "  sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)"
         )
         ttk.Label(frm_func, text=examples, foreground="gray").pack(anchor="w", pady=(5, 2))
 
@@ -192,7 +235,12 @@ class OptiApp(tk.Tk):
         # Buttons
         btn_frame = tk.Frame(left, bg="#f5f5f5", pady=10)
         btn_frame.pack(fill=tk.X)
-        ttk.Button(btn_frame, text="Run optimization", command=self.run_optimization).pack(side=tk.LEFT, padx=5)
+        self.run_btn = ttk.Button(btn_frame, text="Run optimization", command=self.run_optimization)
+        self.run_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_btn = ttk.Button(
+            btn_frame, text="Cancel", command=self.cancel_optimization, state=tk.DISABLED
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Clear results", command=self.clear_results).pack(side=tk.LEFT, padx=5)
 
         # ===== Right: Results =====
@@ -236,11 +284,21 @@ class OptiApp(tk.Tk):
         self.coords_tree.column("value", width=120, anchor="center")
         self.coords_tree.pack(fill=tk.X, pady=(4, 0))
 
-        # 5. History
-        frm_hist = ttk.LabelFrame(right, text="5. Iteration history (first 20)", padding=10)
+        # 5. Convergence plot
+        frm_plot = ttk.LabelFrame(right, text="5. Convergence (log scale)", padding=10)
+        frm_plot.pack(fill=tk.X, pady=(10, 0))
+
+        self.plot_canvas = tk.Canvas(frm_plot, height=170, bg="white", highlightthickness=0)
+        self.plot_canvas.pack(fill=tk.X)
+        self.plot_k, self.plot_f, self.plot_g = [], [], []
+
+        # 6. History
+        frm_hist = ttk.LabelFrame(
+            right, text=f"6. Iteration history (first {HISTORY_ROWS})", padding=10
+        )
         frm_hist.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
 
-        self.history_text = tk.Text(frm_hist, height=18)
+        self.history_text = tk.Text(frm_hist, height=10)
         self.history_text.pack(fill=tk.BOTH, expand=True)
 
     # ---------- Helpers ----------
@@ -255,6 +313,8 @@ class OptiApp(tk.Tk):
         for row in self.coords_tree.get_children():
             self.coords_tree.delete(row)
         self.history_text.delete("1.0", tk.END)
+        self.plot_k, self.plot_f, self.plot_g = [], [], []
+        self.plot_canvas.delete("all")
 
     # ---------- Main optimization ----------
 
@@ -266,8 +326,9 @@ class OptiApp(tk.Tk):
             messagebox.showerror("Input error", "Dimension n must be an integer.")
             return
 
+        # No names: f is written with the vector x[0], ..., x[n-1]
         var_names = self.vars_var.get().split()
-        if len(var_names) != n:
+        if var_names and len(var_names) != n:
             messagebox.showerror(
                 "Input error",
                 "Number of variable names ({}) must equal n = {}.".format(len(var_names), n),
@@ -284,8 +345,12 @@ class OptiApp(tk.Tk):
         except ValueError:
             messagebox.showerror("Input error", "Initial point x0 must contain valid numbers.")
             return
+        if len(x0_vals) == 1:
+            x0_vals = x0_vals * n
         if len(x0_vals) != n:
-            messagebox.showerror("Input error", "x0 must have {} components.".format(n))
+            messagebox.showerror(
+                "Input error", "x0 must have {} components (or a single value).".format(n)
+            )
             return
         x0 = np.array(x0_vals, dtype=float)
 
@@ -303,33 +368,175 @@ class OptiApp(tk.Tk):
 
         method = self.method_var.get()
 
+        # Solve on a worker thread; results come back through self.queue
+        self.clear_results()
+        self.lbl_method.config(text=f"Method: {method}")
+        self.lbl_status.config(text="Status: running...")
+        self.run_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.cancel_event = threading.Event()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.plot_k, self.plot_f, self.plot_g = [], [], []
+        worker = threading.Thread(
+            target=self.solve,
+            args=(method, f_str, var_names, x0, tol, max_iter),
+            daemon=True,
+        )
+        worker.start()
+        self.after(POLL_MS, self.poll_worker)
+
+    def cancel_optimization(self):
+        self.cancel_event.set()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.lbl_status.config(text="Status: cancelling...")
+
+    def solve(self, method, f_str, var_names, x0, tol, max_iter):
+        """Worker thread: build f, run the solver, post messages to the queue."""
         # Build functions
         try:
-            f, grad, hess, vars_sym = build_functions_from_sympy(f_str, var_names)
+            if not var_names:
+                f, grad, hess, hvp, vars_sym = build_functions_from_indexed(f_str, len(x0))
+                var_names, fg = vars_sym, None
+            else:
+                f, grad, hess, vars_sym = build_functions_from_sympy(f_str, var_names)
+                # The trust region only evaluates f and grad together at x0
+                fg = None
+                if method != "Newton with trust region (dogleg)":
+                    fg, _, _ = build_fused_from_sympy(f_str, var_names)
+                if method == "Newton-CG (truncated Newton) with line search":
+                    hvp, _ = build_hvp_from_sympy(f_str, var_names)
         except Exception as e:
-            messagebox.showerror("Error in function definition", str(e))
+            self.queue.put(("error", "Error in function definition", str(e)))
             return
 
+        def callback(state):
+            try:
+                self.queue.put_nowait(("iter", state.k, state.f, state.gnorm))
+            except queue.Full:
+                pass
+            return self.cancel_event.is_set()
+
+        options = dict(
+            tol=tol, max_iter=max_iter, fg=fg, record="ends", record_n=HISTORY_ROWS // 2,
+            callback=callback,
+        )
+
         # Run method
         try:
             if method == "Newton with line search":
-                x_star, it, hist, conv, reason = newton_with_line_search(
-                    f, grad, hess, x0, tol=tol, max_iter=max_iter
-                )
+                result = newton_with_line_search(f, grad, hess, x0, **options)
             elif method == "Quasi-Newton (DFP) with line search":
-                x_star, it, hist, conv, reason = quasi_newton_dfp(
-                    f, grad, x0, tol=tol, max_iter=max_iter
-                )
+                result = quasi_newton_dfp(f, grad, x0, **options)
+            elif method == "Limited-memory BFGS (L-BFGS) with line search":
+                result = lbfgs(f, grad, x0, **options)
+            elif method == "Newton-CG (truncated Newton) with line search":
+                result = newton_cg(f, grad, x0, hvp=hvp, **options)
+            elif method == "Newton with trust region (dogleg)":
+                result = trust_region(f, grad, hess, x0, **options)
             else:  # BFGS
-                x_star, it, hist, conv, reason = bfgs(
-                    f, grad, x0, tol=tol, max_iter=max_iter
-                )
+                result = bfgs(f, grad, x0, **options)
+            x_star = result[0]
+            summary = (float(f(x_star)), float(np.linalg.norm(grad(x_star))))
         except Exception as e:
-            messagebox.showerror("Runtime error", str(e))
+            self.queue.put(("error", "Runtime error", str(e)))
             return
 
-        g_norm = float(np.linalg.norm(grad(x_star)))
-        fx_star = f(x_star)
+        self.queue.put(("done", method, vars_sym, var_names, result, summary))
+
+    def poll_worker(self):
+        """Handle the worker's messages; redraw the plot at most once per poll."""
+        new_points = False
+        while True:
+            try:
+                msg = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if msg[0] == "iter":
+                _, k, fk, gk = msg
+                self.plot_k.append(k)
+                self.plot_f.append(fk)
+                self.plot_g.append(gk)
+                new_points = True
+            else:
+                if new_points:
+                    self.draw_plot()
+                self.run_btn.config(state=tk.NORMAL)
+                self.cancel_btn.config(state=tk.DISABLED)
+                if msg[0] == "error":
+                    self.lbl_status.config(text="Status: -")
+                    messagebox.showerror(msg[1], msg[2])
+                else:
+                    self.show_results(*msg[1:])
+                return
+
+        if new_points:
+            self.lbl_iters.config(text=f"Iterations: {self.plot_k[-1]}")
+            self.draw_plot()
+        self.after(POLL_MS, self.poll_worker)
+
+    def draw_plot(self):
+        """Log-scale plot of ||grad f(x_k)|| and f(x_k) - min f over k."""
+        c = self.plot_canvas
+        c.delete("all")
+        w, h = c.winfo_width(), c.winfo_height()
+        left, right, top, bottom = 50, 10, 10, 20
+        if len(self.plot_k) < 1 or w <= left + right or h <= top + bottom:
+            return
+
+        k = np.array(self.plot_k, dtype=float)
+        f_min = min(self.plot_f)
+        series = []
+        for values, color in (
+            (np.array(self.plot_g, dtype=float), "#1f4e79"),
+            (np.array(self.plot_f, dtype=float) - f_min, "#c0504d"),
+        ):
+            ok = np.isfinite(values) & (values > 0)
+            series.append((k[ok], np.log10(values[ok]), color))
+
+        logs = np.concatenate([s[1] for s in series])
+        if logs.size == 0:
+            return
+        y_lo, y_hi = np.floor(logs.min()), np.ceil(logs.max())
+        if y_hi == y_lo:
+            y_hi += 1.0
+        k_hi = max(k[-1], 1.0)
+
+        def px(kk, yy):
+            return (
+                left + kk / k_hi * (w - left - right),
+                top + (y_hi - yy) / (y_hi - y_lo) * (h - top - bottom),
+            )
+
+        # Axes and decades
+        c.create_rectangle(left, top, w - right, h - bottom, outline="gray")
+        step = max(1, int((y_hi - y_lo) // 6))
+        for e in np.arange(y_lo, y_hi + 1, step):
+            _, y = px(0, e)
+            c.create_line(left, y, w - right, y, fill="#e0e0e0")
+            c.create_text(left - 4, y, text=f"1e{int(e)}", anchor="e", font=("Segoe UI", 7))
+        c.create_text(w - right, h - bottom + 2, text=f"k = {int(k[-1])}",
+                      anchor="ne", font=("Segoe UI", 7))
+
+        # Curves (at most one point per pixel column)
+        for kk, yy, color in series:
+            stride = max(1, len(kk) // (w - left - right))
+            pts = [coord for p in zip(kk[::stride], yy[::stride]) for coord in px(*p)]
+            if len(pts) >= 4:
+                c.create_line(*pts, fill=color, width=2)
+            elif pts:
+                c.create_oval(pts[0] - 2, pts[1] - 2, pts[0] + 2, pts[1] + 2, fill=color)
+
+        c.create_text(left + 6, top + 4, text="||grad f||", anchor="nw",
+                      fill="#1f4e79", font=("Segoe UI", 8, "bold"))
+        c.create_text(left + 70, top + 4, text="f - min f", anchor="nw",
+                      fill="#c0504d", font=("Segoe UI", 8, "bold"))
+
+    def show_results(self, method, vars_sym, var_names, result, summary):
+        x_star, it, hist, conv, reason = result
+        fx_star, g_norm = summary
+        if reason == "stopped by callback":
+            reason = "cancelled by the user"
 
         # ----- Summary labels -----
         self.lbl_method.config(text=f"Method: {method}")
@@ -342,20 +549,23 @@ class OptiApp(tk.Tk):
         # ----- x* coordinates table -----
         for row in self.coords_tree.get_children():
             self.coords_tree.delete(row)
-        for name, val in zip(vars_sym, x_star):
+        for name, val in zip(vars_sym, x_star[:HISTORY_COORDS]):
             self.coords_tree.insert("", tk.END, values=(str(name), f"{val:.6f}"))
+        if len(x_star) > HISTORY_COORDS:
+            self.coords_tree.insert(
+                "", tk.END, values=("...", f"({len(x_star) - HISTORY_COORDS} more)")
+            )
 
         # ----- History -----
         self.history_text.delete("1.0", tk.END)
         if hist is not None and len(hist) > 0:
-            max_show = min(20, len(hist))
-            header = "k\t" + "\t".join(var_names) + "\tf(x_k)\n"
+            max_show = min(HISTORY_ROWS, len(hist))
+            more = "\t..." if len(var_names) > HISTORY_COORDS else ""
+            header = "k\t" + "\t".join(var_names[:HISTORY_COORDS]) + more + "\tf(x_k)\n"
             self.history_text.insert(tk.END, header)
             self.history_text.insert(tk.END, "-" * 60 + "\n")
-            for k in range(max_show):
-                xk = hist[k]
-                fxk = f(xk)
-                coords = "\t".join("{:.4f}".format(v) for v in xk)
+            for k, xk, fxk in zip(hist.k[:max_show], hist.x[:max_show], hist.f[:max_show]):
+                coords = "\t".join("{:.4f}".format(v) for v in xk[:HISTORY_COORDS]) + more
                 line = "{}\t{}\t{:.6f}\n".format(k, coords, fxk)
                 self.history_text.insert(tk.END, line)
         else:
@@ -0,0 +1,33 @@
+# test_batched.py
+import numpy as np
+import pytest
+
+from batched import bfgs_batched, newton_batched
+from bfgs import bfgs
+from newton_ls import newton_with_line_search
+from utils import build_batched_functions_from_sympy, build_functions_from_sympy
+
+PW02A = "x**2 - 5*x*y + y**4 - 25*x - 8*y"
+# The last start is the minimizer
+X0 = np.array([[1.0, 1.0], [-2.0, 3.0], [5.0, -4.0], [20.0, 3.0]])
+
+
+@pytest.mark.parametrize("method", ["newton", "bfgs"])
+def test_lanes_match_the_scalar_solver(method):
+    fb, gb, hb, _ = build_batched_functions_from_sympy(PW02A, ["x", "y"])
+    f, grad, hess, _ = build_functions_from_sympy(PW02A, ["x", "y"])
+    if method == "newton":
+        X, it, history, converged, reason = newton_batched(fb, gb, hb, X0, tol=1e-8)
+    else:
+        X, it, history, converged, reason = bfgs_batched(fb, gb, X0, tol=1e-8)
+    assert X.shape == X0.shape and len(reason) == len(X0)
+    assert np.all(converged)
+    assert np.array_equal(history[0], X0)
+    for b, x0 in enumerate(X0):
+        if method == "newton":
+            ref = newton_with_line_search(f, grad, hess, x0, tol=1e-8)
+        else:
+            ref = bfgs(f, grad, x0, tol=1e-8)
+        assert it[b] == ref[1]
+        assert np.allclose(X[b], ref[0], atol=1e-6)
+        assert np.allclose(X[b], [20.0, 3.0], atol=1e-6)
@@ -0,0 +1,54 @@
+# test_bench_solvers.py
+import json
+
+import pytest
+
+from bench_solvers import METHODS, compare, main, run_suite, slowdowns
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return run_suite([2], ["rosenbrock", "pw02a"], list(METHODS), repeat=1)
+
+
+def test_suite(rows):
+    assert len(rows) == 2 * len(METHODS)
+    for r in rows:
+        assert r["converged"], r
+        assert r["nfev"] > 0 and r["time_s"] > 0
+    # The lazy Newton variant evaluates fewer Hessians
+    nhev = {(r["problem"], r["method"]): r["nhev"] for r in rows}
+    assert nhev["rosenbrock", "newton-lazy"] <= nhev["rosenbrock", "newton"]
+
+
+def test_counts_and_convergence_are_regressions(rows):
+    assert compare(rows, rows) == []
+    base = [dict(r) for r in rows]
+    base[0]["nfev"] -= 1
+    base[1]["converged"] = True
+    new = [dict(r) for r in rows]
+    new[1]["converged"] = False
+    regressions = compare(new, base)
+    assert len(regressions) == 2
+    assert "nfev" in regressions[0] and "no longer converges" in regressions[1]
+
+
+def test_times_are_not_regressions(rows):
+    base = [dict(r, time_s=r["time_s"] / 100) for r in rows]
+    assert compare(rows, base) == []
+    # Reported only above min_time
+    assert slowdowns(rows, base, min_time=1e3) == []
+    slow = [dict(r, time_s=r["time_s"] + 1.0) for r in rows]
+    assert len(slowdowns(slow, rows)) == len(rows)
+
+
+def test_exit_status(tmp_path, capsys):
+    baseline = tmp_path / "base.json"
+    args = ["--dims", "2", "--problems", "pw02a", "--methods", "bfgs", "--repeat", "1"]
+    assert main(args + ["--json", str(baseline)]) == 0
+    assert main(args + ["--baseline", str(baseline)]) == 0
+    data = json.loads(baseline.read_text(encoding="utf-8"))
+    data["results"][0]["iterations"] -= 1
+    baseline.write_text(json.dumps(data), encoding="utf-8")
+    assert main(args + ["--baseline", str(baseline)]) == 1
+    assert "iterations" in capsys.readouterr().out
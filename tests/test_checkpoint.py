@@ -0,0 +1,80 @@
+# test_checkpoint.py
+import numpy as np
+import pytest
+
+from bfgs import bfgs
+from checkpoint import Checkpoint, resume
+from newton_ls import newton_with_line_search
+from quasi_newton_dfp import quasi_newton_dfp
+from utils import build_functions_from_indexed, build_functions_from_sympy
+
+ROSENBROCK = "sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)"
+
+
+class Crash(Exception):
+    pass
+
+
+def _crash_at(k):
+    def callback(state):
+        if state.k == k:
+            raise Crash()
+    return callback
+
+
+@pytest.fixture(scope="module")
+def problem():
+    f, grad, hess, _, _ = build_functions_from_indexed(ROSENBROCK, 10)
+    return f, grad, hess, np.full(10, -1.0)
+
+
+@pytest.mark.parametrize("name, memmap", [
+    ("bfgs", False), ("bfgs", True), ("dfp", False), ("dfp", True), ("newton", False),
+])
+def test_resume_is_bit_identical(tmp_path, problem, name, memmap):
+    f, grad, hess, x0 = problem
+
+    def solve(**options):
+        if name == "newton":
+            return newton_with_line_search(f, grad, hess, x0, max_iter=300, **options)
+        solver = bfgs if name == "bfgs" else quasi_newton_dfp
+        return solver(f, grad, x0, max_iter=300, **options)
+
+    ref = solve()
+    with pytest.raises(Crash):
+        solve(callback=_crash_at(17), checkpoint=Checkpoint(str(tmp_path), every=5,
+                                                            memmap=memmap))
+    x, it, _, converged, reason = resume(str(tmp_path), f, grad, hess=hess)
+    assert np.array_equal(x, ref[0])
+    assert (it, converged, reason) == (ref[1], ref[3], ref[4])
+
+
+def test_resume_with_larger_max_iter(tmp_path, problem):
+    f, grad, _, x0 = problem
+    first = bfgs(f, grad, x0, max_iter=20, checkpoint=Checkpoint(str(tmp_path), every=None))
+    assert first[4] == "maximum iterations reached"
+    x, it, _, _, _ = resume(str(tmp_path), f, grad, max_iter=300)
+    ref = bfgs(f, grad, x0, max_iter=300)
+    assert np.array_equal(x, ref[0]) and it == ref[1]
+
+
+def test_newton_step_norm_stop_is_saved(tmp_path):
+    # grad is not evaluated at the last point of a stop on the step norm;
+    # the checkpoint must still hold that point
+    f, grad, hess, _ = build_functions_from_sympy("(x - 1)**2 + 10*(y - x**2)**2",
+                                                  ["x", "y"])
+    x_star, it, _, converged, reason = newton_with_line_search(
+        f, grad, hess, np.array([-1.2, 1.0]), tol=1e-8, max_iter=500,
+        checkpoint=Checkpoint(str(tmp_path), every=None),
+    )
+    assert converged and reason.startswith("step norm")
+    state = Checkpoint(str(tmp_path)).read_state()
+    assert state["k"] == it
+    with np.load(tmp_path / state["arrays"]) as arrays:
+        assert np.array_equal(arrays["x"], x_star)
+    # Resuming continues from that point instead of replaying iteration it
+    seen = []
+    x, _, _, converged, _ = resume(str(tmp_path), f, grad, hess=hess,
+                                   callback=lambda state: seen.append(state.k))
+    assert converged and np.allclose(x, x_star)
+    assert not seen or seen[0] == it + 1
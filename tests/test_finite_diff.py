@@ -0,0 +1,114 @@
+# test_finite_diff.py
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from bfgs import bfgs
+from finite_diff import FiniteDifferences, cpr_groups
+from utils import build_functions_from_indexed
+
+N = 8
+ROSENBROCK = "sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)"
+
+
+def rosenbrock(x):
+    # Black-box objective, real or complex (picklable for the process pool)
+    return np.sum(100.0 * (x[1:] - x[:-1] ** 2) ** 2 + (1.0 - x[:-1]) ** 2)
+
+
+def rosenbrock_rows(X):
+    return np.sum(100.0 * (X[:, 1:] - X[:, :-1] ** 2) ** 2 + (1.0 - X[:, :-1]) ** 2, axis=1)
+
+
+@pytest.fixture(scope="module")
+def exact():
+    f, grad, hess, hvp, _ = build_functions_from_indexed(ROSENBROCK, N)
+    return f, grad, hess, hvp
+
+
+@pytest.fixture(scope="module")
+def x():
+    return np.linspace(-1.2, 1.1, N)
+
+
+@pytest.mark.parametrize("method, rtol", [
+    ("forward", 1e-6), ("central", 1e-9), ("complex", 1e-14),
+])
+def test_gradient(exact, x, method, rtol):
+    fd = FiniteDifferences(rosenbrock, N, method=method)
+    g = exact[1](x)
+    assert np.allclose(fd.grad(x), g, rtol=rtol, atol=rtol * np.abs(g).max())
+    assert fd.nfev == {"forward": N + 1, "central": 2 * N, "complex": N}[method]
+
+
+@pytest.mark.parametrize("method, rtol", [
+    ("forward", 1e-2), ("central", 1e-5), ("complex", 1e-8),
+])
+def test_hessian_and_products(exact, x, method, rtol):
+    fd = FiniteDifferences(rosenbrock, N, method=method)
+    H = exact[2](x).toarray()
+    scale = np.abs(H).max()
+    assert np.allclose(fd.hess(x), H, atol=rtol * scale)
+    v = np.arange(1.0, N + 1)
+    fd.grad(x)
+    assert np.allclose(fd.hvp(x, v), H @ v, atol=rtol * scale * np.abs(v).sum())
+
+
+def test_exact_gradient_given(exact, x):
+    fd = FiniteDifferences(rosenbrock, N, grad=exact[1])
+    assert np.array_equal(fd.grad(x), exact[1](x))
+    assert np.allclose(fd.hess(x), exact[2](x).toarray(), rtol=1e-7, atol=1e-6)
+
+
+def test_vectorized_and_pools_agree(x):
+    ref = FiniteDifferences(rosenbrock, N).grad(x)
+    assert np.array_equal(FiniteDifferences(rosenbrock_rows, N, vectorized=True).grad(x), ref)
+    for pool in ("thread", "process"):
+        with FiniteDifferences(rosenbrock, N, pool=pool, workers=2) as fd:
+            assert np.array_equal(fd.grad(x), ref)
+
+
+def test_small_batches(x):
+    ref = FiniteDifferences(rosenbrock_rows, N, vectorized=True).hess(x)
+    fd = FiniteDifferences(rosenbrock_rows, N, vectorized=True, batch_floats=3 * N)
+    assert np.array_equal(fd.hess(x), ref)
+
+
+def test_sparse_hessian(exact, x):
+    pattern = sp.diags([np.ones(N - 1), np.ones(N), np.ones(N - 1)], [-1, 0, 1])
+    fd = FiniteDifferences(rosenbrock, N, sparsity=pattern)
+    assert fd.n_groups == 3
+    H = fd.hess(x)
+    assert sp.issparse(H)
+    assert np.allclose(H.toarray(), exact[2](x).toarray(), atol=1e-5 * abs(H).max())
+
+
+def test_cpr_groups():
+    pattern = sp.diags([np.ones(9), np.ones(10), np.ones(9)], [-1, 0, 1])
+    groups, S = cpr_groups(pattern)
+    assert groups.max() == 2
+    # No two columns of a group share a row
+    for g in range(3):
+        assert S[:, groups == g].sum(axis=1).max() == 1
+    groups, _ = cpr_groups(np.ones((4, 4)))
+    assert sorted(groups) == [0, 1, 2, 3]
+
+
+def test_complex_step_rejects_a_real_f(x):
+    fd = FiniteDifferences(lambda y: float(np.real(rosenbrock(y))), N, method="complex")
+    with pytest.raises(ValueError):
+        fd.grad(x)
+
+
+def test_invalid_options():
+    with pytest.raises(ValueError):
+        FiniteDifferences(rosenbrock, N, method="backward")
+    with pytest.raises(ValueError):
+        FiniteDifferences(rosenbrock, N, pool="gpu")
+
+
+def test_solver_with_finite_differences():
+    fd = FiniteDifferences(rosenbrock, 2, method="complex")
+    x_star, _, _, converged, _ = bfgs(fd.f, fd.grad, np.array([-1.2, 1.0]), max_iter=200)
+    assert converged
+    assert np.allclose(x_star, [1.0, 1.0], atol=1e-5)
@@ -0,0 +1,50 @@
+# test_history.py
+import numpy as np
+import pytest
+
+from history import History
+
+
+def _run(record, record_n, count, max_records=1000):
+    h = History(2, max_records, record, record_n)
+    for k in range(count):
+        h.append(np.array([k, -k], dtype=float), f=float(k), gnorm=2.0 * k, alpha=0.5)
+    return h
+
+
+@pytest.mark.parametrize("record, record_n, count, expected", [
+    ("all", 10, 150, list(range(150))),
+    ("none", 10, 150, []),
+    ("final", 10, 150, [149]),
+    ("stride", 10, 150, list(range(0, 150, 10)) + [149]),
+    ("stride", 10, 141, list(range(0, 141, 10))),
+    ("ends", 3, 150, [0, 1, 2, 147, 148, 149]),
+    ("ends", 3, 4, [0, 1, 2, 3]),
+])
+def test_record_modes(record, record_n, count, expected):
+    h = _run(record, record_n, count)
+    assert h.k.tolist() == expected
+    assert len(h) == len(expected)
+    assert h.count == count
+    assert np.array_equal(h.x, np.array([[k, -k] for k in expected], dtype=float).reshape(-1, 2))
+    assert np.array_equal(h.f, np.array(expected, dtype=float))
+    assert np.array_equal(h.gnorm, 2.0 * np.array(expected, dtype=float))
+
+
+def test_stride_storage_grows_lazily():
+    h = History(1000, 10**6 + 1, "stride", 10)
+    assert h._x.nbytes < 10**6
+    for k in range(1000):
+        h.append(np.full(1000, float(k)))
+    assert h.k.tolist() == list(range(0, 1000, 10)) + [999]
+
+
+@pytest.mark.parametrize("record_n", [0, -1])
+def test_invalid_record_n(record_n):
+    with pytest.raises(ValueError):
+        History(2, 100, "stride", record_n)
+
+
+def test_unknown_record_mode():
+    with pytest.raises(ValueError):
+        History(2, 100, "every")
@@ -0,0 +1,106 @@
+# test_main.py
+import csv
+import io
+import json
+
+import numpy as np
+import pytest
+
+from main import BATCH_METHODS, run_batch
+from utils import export_problem
+
+PW02A = "x**2 - 5*x*y + y**4 - 25*x - 8*y"
+
+
+def _run(path, workers=1):
+    out = io.StringIO()
+    n_jobs, n_failed = run_batch(str(path), out=out, workers=workers)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    return n_jobs, n_failed, {r["id"]: r for r in results}
+
+
+def _write_jsonl(path, jobs):
+    path.write_text("".join(json.dumps(job) + "\n" for job in jobs), encoding="utf-8")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_jsonl_round_trip(tmp_path, workers):
+    path = tmp_path / "jobs.jsonl"
+    jobs = [{"id": method, "expression": PW02A, "variables": ["x", "y"], "x0": [1, 1],
+             "method": method} for method in BATCH_METHODS]
+    jobs.append({"id": "indexed", "expression": "sum((x[i] - 1)**2, i)", "n": 5, "x0": 0})
+    _write_jsonl(path, jobs)
+    n_jobs, n_failed, results = _run(path, workers)
+    assert (n_jobs, n_failed) == (len(jobs), 0)
+    for method in BATCH_METHODS:
+        assert results[method]["converged"], results[method]
+        assert results[method]["method"] == method
+        assert np.allclose(results[method]["x"], [20.0, 3.0], atol=1e-5)
+    assert np.allclose(results["indexed"]["x"], np.ones(5))
+
+
+def test_csv_round_trip(tmp_path):
+    path = tmp_path / "jobs.csv"
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, ["id", "expression", "variables", "x0", "method",
+                                     "backend", "tol"])
+        writer.writeheader()
+        writer.writerow({"id": "a", "expression": PW02A, "variables": "x y", "x0": "1 1",
+                         "method": "newton", "backend": "ad", "tol": "1e-8"})
+        writer.writerow({"id": "b", "expression": "(x - 2)**2 + y**2", "variables": "x y",
+                         "x0": "5", "method": "lbfgs"})
+    n_jobs, n_failed, results = _run(path)
+    assert (n_jobs, n_failed) == (2, 0)
+    assert np.allclose(results["a"]["x"], [20.0, 3.0], atol=1e-6)
+    assert np.allclose(results["b"]["x"], [2.0, 0.0], atol=1e-5)
+
+
+def test_problem_file(tmp_path):
+    problem = str(tmp_path / "pw02a.json")
+    export_problem(problem, PW02A, ["x", "y"])
+    path = tmp_path / "jobs.jsonl"
+    _write_jsonl(path, [{"id": m, "problem": problem, "x0": [1, 1], "method": m}
+                        for m in ("newton", "newton-cg")])
+    n_jobs, n_failed, results = _run(path)
+    assert (n_jobs, n_failed) == (2, 0)
+    assert all(np.allclose(r["x"], [20.0, 3.0], atol=1e-5) for r in results.values())
+
+
+def test_checkpoint_and_refresh(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    job = {"id": "ck", "expression": PW02A, "variables": "x y", "x0": [1, 1],
+           "method": "newton", "refresh": 3, "checkpoint": str(tmp_path / "ck")}
+    _write_jsonl(path, [job])
+    first = _run(path)[2]["ck"]
+    assert first["converged"]
+    assert (tmp_path / "ck" / "state.json").exists()
+    # Running the job again continues from the checkpoint
+    again = _run(path)[2]["ck"]
+    assert again["converged"] and again["x"] == pytest.approx(first["x"])
+
+
+def test_failed_jobs_are_reported(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"id": "method", "expression": PW02A, "variables": "x y", "x0": 1,
+                    "method": "simplex"}),
+        json.dumps({"id": "x0", "expression": PW02A, "variables": "x y", "x0": [1, 2, 3]}),
+        json.dumps({"id": "syntax", "expression": "x +", "variables": "x", "x0": 1}),
+        "{not json",
+        "# comment",
+        "",
+    ]) + "\n", encoding="utf-8")
+    n_jobs, n_failed, results = _run(path)
+    assert (n_jobs, n_failed) == (4, 4)
+    assert all(not r["ok"] and r["error"] for r in results.values())
+
+
+@pytest.mark.parametrize("backend", ["codegen", "ad"])
+def test_batch_fractional_power(tmp_path, backend):
+    # The line search probes x < 0, where x**1.5 is nan
+    path = tmp_path / "jobs.jsonl"
+    _write_jsonl(path, [{"id": "pow", "expression": "x**1.5 + x + y**2", "variables": "x y",
+                         "x0": [1, 1], "backend": backend}])
+    n_jobs, n_failed, results = _run(path)
+    assert (n_jobs, n_failed) == (1, 0)
+    assert results["pow"]["ok"] and results["pow"]["converged"]
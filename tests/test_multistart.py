@@ -0,0 +1,48 @@
+# test_multistart.py
+import numpy as np
+import pytest
+
+from multistart import distinct_minima, multistart, sample_starts
+
+# Two minimizers, (-1, 0) and (1, 0), and a saddle point at the origin
+DOUBLE_WELL = "(x**2 - 1)**2 + y**2"
+
+
+def test_latin_hypercube():
+    X = sample_starts(10, [(-1.0, 1.0), (0.0, 5.0)], 2, seed=0)
+    assert X.shape == (10, 2)
+    for j, (lo, hi) in enumerate([(-1.0, 1.0), (0.0, 5.0)]):
+        slices = np.floor((X[:, j] - lo) / (hi - lo) * 10).astype(int)
+        assert sorted(slices) == list(range(10))
+    assert np.array_equal(X, sample_starts(10, [(-1.0, 1.0), (0.0, 5.0)], 2, seed=0))
+
+
+@pytest.mark.parametrize("bounds", [[(0.0, 1.0)] * 3, (1.0, 0.0)])
+def test_invalid_bounds(bounds):
+    with pytest.raises(ValueError):
+        sample_starts(5, bounds, 2)
+
+
+def test_distinct_minima():
+    points = np.array([[1.0, 0.0], [-1.0, 0.0], [1.0 + 1e-7, 0.0], [-1.0, 1e-8]])
+    values = np.array([0.0, 1.0, 1e-3, 0.5])
+    minima = distinct_minima(points, values)
+    assert [(fx, count) for _, fx, count in minima] == [(0.0, 2), (0.5, 2)]
+
+
+@pytest.mark.parametrize("method", ["newton", "dfp", "bfgs", "lbfgs"])
+def test_multistart_finds_both_minima(method):
+    x0s = [[-2.0, 1.0], [2.0, -1.0], [-0.5, 0.3], [0.7, 0.2], [0.0, 0.0]]
+    x_best, f_best, minima, results = multistart(DOUBLE_WELL, ["x", "y"], method=method,
+                                                 x0s=x0s, tol=1e-8, max_workers=2)
+    assert len(results) == len(x0s)
+    assert f_best < 1e-12
+    found = sorted(round(x[0]) for x, _, _ in minima)
+    assert found == [-1, 1]
+    # The start at the saddle point converges there, and is not a minimum
+    assert not results[-1][4] and results[-1][5].startswith("saddle point")
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        multistart(DOUBLE_WELL, ["x", "y"], method="simplex", n_starts=2)
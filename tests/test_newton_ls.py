@@ -0,0 +1,54 @@
+# test_newton_ls.py
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+import newton_ls
+from newton_ls import newton_factor, newton_with_line_search
+from utils import build_functions_from_sympy
+
+ROSENBROCK = "(x - 1)**2 + 10*(y - x**2)**2"
+
+
+@pytest.fixture(scope="module")
+def rosenbrock():
+    return build_functions_from_sympy(ROSENBROCK, ["x", "y"])[:3]
+
+
+@pytest.mark.filterwarnings("ignore:the matrix subclass:PendingDeprecationWarning")
+@pytest.mark.parametrize("convert", [
+    np.asarray, np.asmatrix, lambda H: H.tolist(), sp.csr_matrix,
+], ids=["array", "matrix", "list", "sparse"])
+def test_hessian_types(rosenbrock, convert):
+    f, grad, hess = rosenbrock
+    x0 = np.array([-1.2, 1.0])
+    ref = newton_with_line_search(f, grad, hess, x0, tol=1e-8)
+    x_star, it, _, converged, _ = newton_with_line_search(
+        f, grad, lambda x: convert(hess(x)), x0, tol=1e-8
+    )
+    assert converged and it == ref[1]
+    assert np.allclose(x_star, ref[0])
+
+
+def test_newton_factor_without_scipy(monkeypatch):
+    monkeypatch.setattr(newton_ls, "cho_factor", None)
+    H = np.diag([1.0, -2.0, 3.0])
+    solve, tau = newton_factor(H)
+    g = np.ones(3)
+    d = solve(-g)
+    assert tau > 2.0
+    assert np.allclose((H + tau * np.eye(3)) @ d, -g)
+    assert np.dot(g, d) < 0
+
+
+def test_sparse_indefinite_hessian_gives_descent():
+    rng = np.random.default_rng(0)
+    n = 50
+    H = sp.diags([np.ones(n - 1), 3 * rng.standard_normal(n), np.ones(n - 1)],
+                 [-1, 0, 1]).tocsr()
+    g = rng.standard_normal(n)
+    solve, tau = newton_ls._sparse_newton_factor(H, {})
+    d = solve(-g)
+    assert np.linalg.eigvalsh(H.toarray()).min() + tau > 0
+    assert np.allclose((H + tau * sp.identity(n)) @ d, -g)
+    assert np.dot(g, d) < 0
@@ -0,0 +1,97 @@
+# test_opti_gui.py
+import importlib.util
+import os
+import queue
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tkinter")
+
+_spec = importlib.util.spec_from_file_location(
+    "opti_gui", os.path.join(os.path.dirname(os.path.dirname(__file__)), "opti gui.py")
+)
+gui = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(gui)
+
+ROSENBROCK = "(x - 1)**2 + 100*(y - x**2)**2"
+
+
+def _solve(method, max_size=0, max_iter=500):
+    """Run OptiApp.solve on a worker thread and collect its messages."""
+    app = types.SimpleNamespace(queue=queue.Queue(maxsize=max_size),
+                                cancel_event=threading.Event())
+    worker = threading.Thread(target=gui.OptiApp.solve, args=(
+        app, method, ROSENBROCK, ["x", "y"], np.array([-1.2, 1.0]), 1e-8, max_iter))
+    worker.start()
+    if max_size:
+        # Let the solver fill the queue before the first poll
+        while not app.queue.full() and worker.is_alive():
+            time.sleep(0.001)
+    messages = []
+    while worker.is_alive() or not app.queue.empty():
+        try:
+            messages.append(app.queue.get(timeout=0.01))
+        except queue.Empty:
+            pass
+    worker.join()
+    return messages
+
+
+@pytest.mark.parametrize("method", list(gui.METHOD_DESCRIPTIONS))
+def test_solve_every_method(method):
+    messages = _solve(method)
+    kind, _, _, _, result, summary = messages[-1]
+    assert kind == "done"
+    x_star, it, history, converged, _ = result
+    assert converged
+    # Nothing is dropped from an unbounded queue (the last iteration
+    # counted may be the final gradient test)
+    ks = [m[1] for m in messages[:-1]]
+    assert ks == list(range(1, len(ks) + 1)) and len(ks) >= it - 1
+    assert len(history) <= gui.HISTORY_ROWS
+    assert np.allclose(x_star, [1.0, 1.0], atol=1e-5)
+
+
+def test_full_queue_drops_iterations():
+    messages = _solve("Quasi-Newton (DFP) with line search", max_size=5)
+    kind, _, _, _, result, _ = messages[-1]
+    assert kind == "done" and result[3]
+    assert len(messages) - 1 < result[1]
+
+
+class _Widget:
+    def __init__(self):
+        self.rows = []
+
+    def config(self, **kwargs):
+        pass
+
+    def get_children(self):
+        return list(range(len(self.rows)))
+
+    def delete(self, *items):
+        if items and items[0] != "1.0":
+            self.rows = []
+
+    def insert(self, *args, **kwargs):
+        self.rows.append(kwargs.get("values", args))
+
+
+@pytest.mark.parametrize("n", [3, 1000])
+def test_coordinates_table_is_capped(n):
+    app = types.SimpleNamespace(**{name: _Widget() for name in (
+        "lbl_method", "lbl_status", "lbl_reason", "lbl_iters", "lbl_fx", "lbl_gnorm",
+        "coords_tree", "history_text")})
+    names = ["x{}".format(i) for i in range(n)]
+    gui.OptiApp.show_results(app, "method", names, names,
+                             (np.ones(n), 1, None, True, "done"), (0.0, 0.0))
+    rows = app.coords_tree.rows
+    if n <= gui.HISTORY_COORDS:
+        assert len(rows) == n
+    else:
+        assert len(rows) == gui.HISTORY_COORDS + 1
+        assert rows[-1] == ("...", "({} more)".format(n - gui.HISTORY_COORDS))
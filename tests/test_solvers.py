@@ -0,0 +1,178 @@
+# test_solvers.py
+import numpy as np
+import pytest
+
+from bench_updates import bfgs_update_dense, dfp_update_dense, make_problem
+from bfgs import bfgs, bfgs_iter, bfgs_update
+from instrument import PHASES, Stats, instrument
+from lbfgs import lbfgs
+from line_search import get_line_search
+from newton_ls import newton_cg, newton_with_line_search
+from quasi_newton_dfp import dfp_update, quasi_newton_dfp
+from trust_region import trust_region
+from utils import build_functions_from_sympy, build_fused_from_sympy, build_hvp_from_sympy
+
+# Examples of the course (the PW02 exercises), as in the GUI
+PW02A = "x**2 - 5*x*y + y**4 - 25*x - 8*y"
+PW02B = "(x**4 - 3) + y**4"
+PW02C = "x**4 - 4*y**3 + 6*(x**2 + y**2) - 4*(x + y)"
+SOLVERS = ["newton", "dfp", "bfgs", "lbfgs", "newton-cg", "trust-region"]
+
+
+def _problem(f_str):
+    f, grad, hess, _ = build_functions_from_sympy(f_str, ["x", "y"])
+    hvp, _ = build_hvp_from_sympy(f_str, ["x", "y"])
+    return f, grad, hess, hvp
+
+
+def _solve(method, problem, x0, **options):
+    f, grad, hess, hvp = problem
+    x0 = np.array(x0, dtype=float)
+    if method == "newton":
+        return newton_with_line_search(f, grad, hess, x0, **options)
+    if method == "dfp":
+        return quasi_newton_dfp(f, grad, x0, **options)
+    if method == "bfgs":
+        return bfgs(f, grad, x0, **options)
+    if method == "lbfgs":
+        return lbfgs(f, grad, x0, **options)
+    if method == "newton-cg":
+        return newton_cg(f, grad, x0, hvp=hvp, **options)
+    return trust_region(f, grad, hess, x0, **options)
+
+
+@pytest.mark.parametrize("method", SOLVERS)
+@pytest.mark.parametrize("x0", [[1.0, 1.0], [-2.0, 3.0]])
+def test_pw02a_minimizer(method, x0):
+    # The minimizer found by the original Newton, DFP and BFGS
+    x_star, _, _, converged, _ = _solve(method, _problem(PW02A), x0, tol=1e-6, max_iter=200)
+    assert converged
+    assert np.allclose(x_star, [20.0, 3.0], atol=1e-5)
+
+
+@pytest.mark.parametrize("method", SOLVERS)
+def test_pw02b_minimizer(method):
+    # Quartic: the gradient test stops at |x| ~ (tol / 4)^(1/3)
+    x_star, _, _, converged, _ = _solve(method, _problem(PW02B), [-2.0, 3.0], tol=1e-6,
+                                        max_iter=200)
+    assert converged
+    assert np.all(np.abs(x_star) < 0.01)
+
+
+@pytest.mark.parametrize("method", SOLVERS)
+def test_pw02c_is_unbounded(method):
+    with np.errstate(all="ignore"):
+        _, _, _, converged, reason = _solve(method, _problem(PW02C), [1.0, 1.0], tol=1e-6,
+                                            max_iter=200)
+    assert not converged
+    assert reason in ("maximum iterations reached", "line search failed")
+
+
+@pytest.mark.parametrize("method, options", [
+    ("newton", {}), ("dfp", {}), ("bfgs", {}), ("newton-cg", {}),
+    # (with fg, the Wolfe search interpolates with the slope at rejected steps)
+    ("lbfgs", {"line_search": "armijo"}),
+])
+def test_fused_evaluator_gives_the_same_iterates(method, options):
+    problem = _problem(PW02A)
+    fg, _, _ = build_fused_from_sympy(PW02A, ["x", "y"])
+    x0 = [-2.0, 3.0]
+    ref = _solve(method, problem, x0, **options)
+    x_star, it, history, converged, _ = _solve(method, problem, x0, fg=fg, **options)
+    assert converged and it == ref[1]
+    assert np.allclose(x_star, ref[0], rtol=1e-10)
+    assert np.allclose(history.x, ref[2].x, rtol=1e-10)
+
+
+@pytest.mark.parametrize("method", SOLVERS)
+def test_callback_and_stats(method):
+    states = []
+
+    def callback(state):
+        states.append(state)
+        return state.k == 3
+
+    stats = Stats()
+    x_star, it, history, converged, reason = _solve(
+        method, _problem(PW02A), [1.0, 1.0], callback=callback, stats=stats
+    )
+    assert not converged and reason == "stopped by callback" and it == 3
+    assert [s.k for s in states] == [1, 2, 3]
+    assert np.array_equal(states[-1].x, x_star)
+    assert history.stats is stats
+    assert set(PHASES) <= set(stats.phase_time)
+    assert stats.calls["grad"] >= states[-1].ngev - stats.calls.get("fg", 0)
+
+
+def test_generator_form():
+    f, grad, _, _ = _problem(PW02A)
+    steps = bfgs_iter(f, grad, np.array([1.0, 1.0]))
+    state = next(steps)
+    assert state.k == 1 and state.nfev >= 1
+    state = steps.send(False)
+    assert state.k == 2
+    with pytest.raises(StopIteration) as stop:
+        steps.send(True)
+    x_star, it, _, converged, reason = stop.value.value
+    assert (it, converged, reason) == (2, False, "stopped by callback")
+    assert np.array_equal(x_star, state.x)
+
+
+def test_instrumented_functions():
+    f, grad, _, _ = _problem(PW02A)
+    f, grad, hess, stats = instrument(f, grad)
+    assert hess is None
+    f(np.zeros(2))
+    grad(np.zeros(2))
+    grad(np.ones(2))
+    assert stats.calls == {"f": 1, "grad": 2}
+    assert stats.as_dict()["calls"] == {"f": 1, "grad": 2}
+    report = stats.report()
+    assert "grad" in report and all(phase in report for phase in PHASES)
+
+
+@pytest.mark.parametrize("method", SOLVERS)
+@pytest.mark.parametrize("record, expected", [("none", 0), ("final", 1), ("ends", 4)])
+def test_record_modes(method, record, expected):
+    x_star, it, history, _, _ = _solve(method, _problem(PW02B), [-2.0, 3.0],
+                                       record=record, record_n=2)
+    assert len(history) == min(expected, it + 1)
+    if len(history):
+        assert np.array_equal(history.x[-1], x_star)
+
+
+@pytest.mark.parametrize("update, dense", [(bfgs_update, bfgs_update_dense),
+                                           (dfp_update, dfp_update_dense)])
+@pytest.mark.parametrize("rows", [None, 7])
+def test_inverse_hessian_updates(update, dense, rows):
+    n = 40
+    D, s, y = make_problem(n)
+    expected = dense(D, s, y)
+    work = np.empty((n if rows is None else rows, n))
+    assert update(D, s, y, np.empty(n), work)
+    assert np.allclose(D, expected, rtol=1e-10, atol=1e-12)
+    assert np.allclose(D, D.T)
+
+
+@pytest.mark.parametrize("update", [bfgs_update, dfp_update])
+def test_updates_skip_nonpositive_curvature(update):
+    D = np.eye(3)
+    assert not update(D, np.array([1.0, 0.0, 0.0]), np.array([-1.0, 0.0, 0.0]),
+                      np.empty(3), np.empty((3, 3)))
+    assert np.array_equal(D, np.eye(3))
+
+
+@pytest.mark.parametrize("name", ["armijo", "wolfe"])
+def test_line_search_conditions(name):
+    f, grad, _, _ = _problem(PW02A)
+    search = get_line_search(name)
+    x = np.array([1.0, 1.0])
+    d = -grad(x)
+    alpha, ok, f_new, _ = search(f, grad, x, d)
+    assert ok and alpha > 0
+    assert f_new == f(x + alpha * d)
+    assert f_new <= f(x) + 1e-4 * alpha * np.dot(grad(x), d)
+    if name == "wolfe":
+        assert abs(np.dot(grad(x + alpha * d), d)) <= 0.9 * abs(np.dot(grad(x), d))
+    # Not a descent direction
+    assert not search(f, grad, x, -d)[1]
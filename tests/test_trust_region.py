@@ -0,0 +1,46 @@
+# test_trust_region.py
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from trust_region import trust_region
+from utils import build_functions_from_sympy
+
+
+@pytest.fixture(scope="module")
+def rosenbrock():
+    return build_functions_from_sympy("(x - 1)**2 + 10*(y - x**2)**2", ["x", "y"])[:3]
+
+
+@pytest.mark.filterwarnings("ignore:the matrix subclass:PendingDeprecationWarning")
+@pytest.mark.parametrize("convert", [
+    np.asarray, np.asmatrix, lambda H: H.tolist(), sp.csr_matrix,
+], ids=["array", "matrix", "list", "sparse"])
+def test_hessian_types(rosenbrock, convert):
+    f, grad, hess = rosenbrock
+    x0 = np.array([-1.2, 1.0])
+    ref = trust_region(f, grad, hess, x0, tol=1e-8)
+    x_star, it, _, converged, _ = trust_region(f, grad, lambda x: convert(hess(x)), x0,
+                                               tol=1e-8)
+    assert converged and it == ref[1]
+    assert np.allclose(x_star, ref[0])
+
+
+@pytest.mark.parametrize("subproblem", ["dogleg", "steihaug"])
+def test_subproblems_converge(rosenbrock, subproblem):
+    f, grad, hess = rosenbrock
+    x_star, _, _, converged, _ = trust_region(f, grad, hess, np.array([-1.2, 1.0]),
+                                              tol=1e-8, max_iter=500, subproblem=subproblem)
+    assert converged
+    assert np.allclose(x_star, [1.0, 1.0], atol=1e-6)
+
+
+def test_reduction_below_rounding_error():
+    # Near (20, 3) f is about -343 and the predicted reduction of the last
+    # steps is below its rounding error; the radius used to shrink to zero
+    f, grad, hess, _ = build_functions_from_sympy("x**2 - 5*x*y + y**4 - 25*x - 8*y",
+                                                  ["x", "y"])
+    x_star, _, _, converged, reason = trust_region(f, grad, hess, np.array([-2.0, 3.0]),
+                                                   tol=1e-6, max_iter=200)
+    assert converged, reason
+    assert np.allclose(x_star, [20.0, 3.0], atol=1e-6)
@@ -0,0 +1,173 @@
+# test_utils.py
+import numpy as np
+import pytest
+
+from bfgs import bfgs
+from utils import (build_batched_functions_from_sympy, build_functions_from_indexed,
+                   build_functions_from_sympy, build_fused_from_sympy, build_hvp_from_sympy,
+                   clear_cache, export_problem, load_problem)
+
+EXPRESSIONS = [
+    ("x**2 - 5*x*y + y**4 - 25*x - 8*y", ["x", "y"]),
+    ("x**4 - 4*y**3 + 6*(x**2 + y**2) - 4*(x + y)", ["x", "y"]),
+    ("exp(x*y) + sin(x) - log(1 + y**2) + sqrt(2 + z**2)*x", ["x", "y", "z"]),
+    ("(a - 1)**2 + 100*(b - a**2)**2 + (b - 1)**2 + 100*(c - b**2)**2", ["a", "b", "c"]),
+]
+
+
+def _points(n, count=4, seed=0):
+    return np.random.default_rng(seed).uniform(-1.5, 1.5, (count, n))
+
+
+def _reference(f_str, names):
+    return build_functions_from_sympy(f_str, names)[:3]
+
+
+@pytest.mark.parametrize("f_str, names", EXPRESSIONS)
+@pytest.mark.parametrize("backend", ["codegen", "ad", "sparse"])
+def test_backends_agree(f_str, names, backend):
+    f_ref, grad_ref, hess_ref = _reference(f_str, names)
+    if backend == "sparse":
+        f, grad, hess, _ = build_functions_from_sympy(f_str, names, sparse=True)
+    else:
+        f, grad, hess, _ = build_functions_from_sympy(f_str, names, backend=backend)
+    for x in _points(len(names)):
+        assert np.isclose(f(x), f_ref(x), rtol=1e-12)
+        assert np.allclose(grad(x), grad_ref(x), rtol=1e-12, atol=1e-12)
+        H = hess(x)
+        H = H.toarray() if backend == "sparse" else H
+        assert np.allclose(H, hess_ref(x), rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("f_str, names", EXPRESSIONS)
+def test_out_buffers(f_str, names):
+    f, grad, hess, _ = build_functions_from_sympy(f_str, names, backend="codegen")
+    n = len(names)
+    g_out, H_out = np.empty(n), np.empty((n, n))
+    x = _points(n, 1)[0]
+    assert grad(x, out=g_out) is g_out
+    assert hess(x, out=H_out) is H_out
+    assert np.allclose(g_out, grad(x)) and np.allclose(H_out, hess(x))
+
+
+@pytest.mark.parametrize("f_str, names", EXPRESSIONS)
+def test_fused_and_batched(f_str, names):
+    f_ref, grad_ref, hess_ref = _reference(f_str, names)
+    fg, fgh, _ = build_fused_from_sympy(f_str, names)
+    fb, gb, hb, _ = build_batched_functions_from_sympy(f_str, names)
+    X = _points(len(names))
+    for x in X:
+        fx, g = fg(x)
+        assert np.isclose(fx, f_ref(x)) and np.allclose(g, grad_ref(x))
+        fx, g, H = fgh(x)
+        assert np.isclose(fx, f_ref(x)) and np.allclose(g, grad_ref(x))
+        assert np.allclose(H, hess_ref(x))
+    assert np.allclose(fb(X), [f_ref(x) for x in X])
+    assert np.allclose(gb(X), [grad_ref(x) for x in X])
+    assert np.allclose(hb(X), [hess_ref(x) for x in X])
+
+
+@pytest.mark.parametrize("f_str, names", EXPRESSIONS)
+@pytest.mark.parametrize("backend", ["codegen", "ad"])
+def test_hvp(f_str, names, backend):
+    hess_ref = _reference(f_str, names)[2]
+    hvp, _ = build_hvp_from_sympy(f_str, names, backend=backend)
+    rng = np.random.default_rng(1)
+    for x in _points(len(names)):
+        v = rng.standard_normal(len(names))
+        assert np.allclose(hvp(x, v), hess_ref(x) @ v, rtol=1e-12, atol=1e-12)
+
+
+def test_indexed_matches_named():
+    n = 6
+    names = ["x{}".format(i) for i in range(n)]
+    named = "+".join("100*(x{1} - x{0}**2)**2 + (1 - x{0})**2".format(i, i + 1)
+                     for i in range(n - 1))
+    f_ref, grad_ref, hess_ref = _reference(named, names)
+    f, grad, hess, hvp, idx_names = build_functions_from_indexed(
+        "sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)", n
+    )
+    assert len(idx_names) == n
+    v = np.arange(1.0, n + 1)
+    for x in _points(n):
+        assert np.isclose(f(x), f_ref(x))
+        assert np.allclose(grad(x), grad_ref(x))
+        assert np.allclose(hess(x).toarray(), hess_ref(x))
+        assert np.allclose(hvp(x, v), hess_ref(x) @ v)
+
+
+@pytest.mark.parametrize("backend, sparse", [
+    ("lambdify", False), ("codegen", False), ("ad", False), ("codegen", True),
+])
+def test_export_load_round_trip(tmp_path, backend, sparse):
+    f_str, names = EXPRESSIONS[2]
+    path = str(tmp_path / "problem.json")
+    export_problem(path, f_str, names, backend=backend, sparse=sparse)
+    f, grad, hess, hvp, loaded_names = load_problem(path)
+    assert list(loaded_names) == names
+    f_ref, grad_ref, hess_ref = _reference(f_str, names)
+    v = np.array([1.0, -2.0, 0.5])
+    for x in _points(3):
+        H = hess(x)
+        H = H.toarray() if sparse else H
+        assert np.isclose(f(x), f_ref(x))
+        assert np.allclose(grad(x), grad_ref(x))
+        assert np.allclose(H, hess_ref(x))
+        assert np.allclose(hvp(x, v), hess_ref(x) @ v)
+
+
+def test_export_load_indexed(tmp_path):
+    path = str(tmp_path / "rosenbrock.json")
+    export_problem(path, "sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i)", n=4)
+    f, grad, _, _, names = load_problem(path)
+    assert len(names) == 4
+    assert f(np.ones(4)) == 0.0
+    f, grad, _, _, names = load_problem(path, n=7)
+    assert len(names) == 7 and np.allclose(grad(np.ones(7)), 0.0)
+
+
+@pytest.mark.parametrize("backend", ["lambdify", "codegen", "ad"])
+def test_disk_cache(tmp_path, backend):
+    f_str, names = EXPRESSIONS[0]
+    cache_dir = str(tmp_path)
+    clear_cache()
+    f1, grad1, _, _ = build_functions_from_sympy(f_str, names, cache_dir=cache_dir,
+                                                 backend=backend)
+    assert any(tmp_path.iterdir())
+    clear_cache()
+    f2, grad2, _, vars_sym = build_functions_from_sympy(f_str, names, cache_dir=cache_dir,
+                                                        backend=backend)
+    assert repr(vars_sym) == "(x, y)"
+    x = np.array([0.3, -0.7])
+    assert f1(x) == f2(x) and np.array_equal(grad1(x), grad2(x))
+
+
+@pytest.mark.parametrize("build", [
+    lambda: build_functions_from_sympy("floor(x)*y", ["x", "y"], backend="ad"),
+    lambda: build_functions_from_indexed("sum(x[i]*x[2*i], i)", 4),
+    lambda: build_functions_from_indexed("foo(x[0])", 4),
+], ids=["ad", "indexed-index", "indexed-function"])
+def test_unsupported_expressions(build):
+    with pytest.raises(ValueError):
+        build()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        build_functions_from_sympy("x**2", ["x"], backend="fortran")
+
+
+@pytest.mark.parametrize("backend", ["lambdify", "codegen", "ad"])
+def test_fractional_power_of_negative_base(backend):
+    # Python floats go complex where NumPy gives nan (the line search
+    # probes x < 0 from x0 = [1, 1])
+    f, grad, hess, _ = build_functions_from_sympy("x**1.5 + x + y**2", ["x", "y"],
+                                                  backend=backend)
+    with np.errstate(invalid="ignore"):
+        x = np.array([-1.0, 1.0])
+        assert np.isnan(f(x))
+        assert np.isnan(grad(x)[0]) and grad(x)[1] == 2.0
+        assert np.isnan(hess(x)[0, 0])
+        x_star, _, _, converged, _ = bfgs(f, grad, np.array([1.0, 1.0]))
+    assert converged
+    assert abs(x_star[0]) < 1e-6
@@ -0,0 +1,275 @@
+# trust_region.py
+import numpy as np
+from history import History
+from instrument import lap_timer
+from iteration import Evaluations, IterState, run
+from newton_ls import issparse, newton_direction, _sparse_newton_direction
+
+
+SUBPROBLEMS = ("dogleg", "steihaug")
+
+
+def _to_boundary(z, p, delta):
+    """tau >= 0 such that ||z + tau p|| = delta (z inside the region)."""
+    pp = np.dot(p, p)
+    zp = np.dot(z, p)
+    zz = np.dot(z, z)
+    return (-zp + np.sqrt(zp * zp + pp * (delta * delta - zz))) / pp
+
+
+def _cauchy_point(g, gHg, delta):
+    """Minimizer of the model along -g inside the region."""
+    gnorm = np.linalg.norm(g)
+    if gHg <= 0:
+        return -(delta / gnorm) * g
+    return -min(np.dot(g, g) / gHg, delta / gnorm) * g
+
+
+def _dogleg(g, gHg, d_newton, delta):
+    """
+    Dogleg step: the Newton step if it lies in the region, otherwise the
+    point where the path 0 -> Cauchy point -> Newton step leaves it.
+    """
+    if d_newton is not None and np.linalg.norm(d_newton) <= delta:
+        return d_newton
+    p_u = _cauchy_point(g, gHg, delta)
+    if d_newton is None or gHg <= 0 or np.linalg.norm(p_u) >= delta:
+        return p_u
+    return p_u + _to_boundary(p_u, d_newton - p_u, delta) * (d_newton - p_u)
+
+
+def _steihaug(Hv, g, delta, tol, max_iter):
+    """
+    Steihaug-Toint truncated CG on the model g.d + d.H d / 2, ||d|| <= delta.
+
+    Like newton_ls._truncated_cg, but a direction of nonpositive curvature,
+    or a CG iterate leaving the region, is followed to the boundary.
+
+    Returns
+    -------
+    d : np.ndarray
+    n_products : int
+        Number of Hessian-vector products used.
+    """
+    z = np.zeros_like(g)
+    r = g.copy()
+    p = -r
+    rr = np.dot(r, r)
+
+    for j in range(max_iter):
+        Hp = Hv(p)
+        pHp = np.dot(p, Hp)
+        if pHp <= 0:
+            # Negative curvature: go to the boundary
+            return z + _to_boundary(z, p, delta) * p, j + 1
+
+        a = rr / pHp
+        z_new = z + a * p
+        if np.linalg.norm(z_new) >= delta:
+            return z + _to_boundary(z, p, delta) * p, j + 1
+        z = z_new
+        r += a * Hp
+        rr_new = np.dot(r, r)
+        if np.sqrt(rr_new) <= tol:
+            return z, j + 1
+
+        p *= rr_new / rr
+        p -= r
+        rr = rr_new
+
+    return z, max_iter
+
+
+def trust_region(f, grad, hess, x0, tol=1e-6, max_iter=100, subproblem="dogleg",
+                 delta0=1.0, delta_max=100.0, eta=0.15, hvp=None, fg=None,
+                 record="all", record_n=10, callback=None, stats=None):
+    """
+    Newton method with a trust region.
+
+    At each iteration, the quadratic model m(s) = f + g.s + s.H s / 2 is
+    minimized approximately in the ball ||s|| <= delta, and the step is
+    accepted if the ratio rho of the actual to the predicted reduction is
+    > eta. The radius is divided by 4 if rho < 1/4 and doubled (up to
+    delta_max) if rho > 3/4 and the step reached the boundary (Nocedal &
+    Wright, Alg. 4.1).
+
+    Unlike the line-search methods, an indefinite Hessian needs no
+    fallback to steepest descent: the step follows the directions of
+    negative curvature up to the boundary.
+
+    A rejected step costs one f evaluation: x, g and H do not change, and
+    the subproblem is solved again with the smaller radius (for "dogleg",
+    without refactorizing H). grad is only evaluated at accepted points.
+
+    Parameters
+    ----------
+    f, grad, hess : callables
+        As in newton_ls.newton_with_line_search (hess may return a dense
+        array or a scipy.sparse matrix).
+    x0 : array_like
+    tol : float
+        Stop when ||grad f(x_k)|| <= tol or an accepted step has norm <= tol.
+    max_iter : int
+        Maximum number of iterations (accepted or rejected steps).
+    subproblem : str
+        "dogleg": dogleg path between the Cauchy point and the Newton step
+        of the shifted Cholesky factorization (newton_ls.newton_direction;
+        sparse LU for a sparse H).
+        "steihaug": Steihaug-Toint truncated CG, which only needs
+        products H v (suited to large n).
+    delta0, delta_max : float
+        Initial and largest trust-region radius.
+    eta : float
+        Acceptance threshold on rho, in [0, 1/4).
+    hvp : callable, optional
+        Hessian-vector product hvp(x, v) -> H(x) v, used instead of hess by
+        "steihaug" (hess may then be None).
+    fg : callable, optional
+        Fused evaluator fg(x) -> (f(x), grad(x)); only used at x0, since
+        the trial points need f alone.
+    record, record_n, callback, stats
+        As in newton_ls.newton_with_line_search (trust_region_iter is the
+        generator form). The history records every iteration, with
+        alpha = 1 for an accepted step and 0 for a rejected one; the time
+        spent evaluating and testing the trial step is counted in the
+        "line search" phase of stats.
+
+    Returns
+    -------
+    x_star, it, history, converged, reason
+    """
+    return run(
+        trust_region_iter(
+            f, grad, hess, x0, tol, max_iter, subproblem, delta0, delta_max, eta,
+            hvp, fg, record, record_n, stats,
+        ),
+        callback,
+    )
+
+
+def trust_region_iter(f, grad, hess, x0, tol=1e-6, max_iter=100, subproblem="dogleg",
+                      delta0=1.0, delta_max=100.0, eta=0.15, hvp=None, fg=None,
+                      record="all", record_n=10, stats=None):
+    """
+    Generator form of trust_region.
+
+    Yields an iteration.IterState after every iteration; sending True
+    asks the solver to stop. The generator returns the result of
+    trust_region.
+    """
+    if subproblem not in SUBPROBLEMS:
+        raise ValueError(
+            "Unknown subproblem '{}'; expected one of: {}.".format(
+                subproblem, ", ".join(SUBPROBLEMS)
+            )
+        )
+    if hess is None and (subproblem == "dogleg" or hvp is None):
+        raise ValueError("hess is required (or hvp with subproblem='steihaug').")
+
+    lap = lap_timer(stats)
+    if stats is not None:
+        stats.start()
+        f, grad, fg = stats.wrap("f", f), stats.wrap("grad", grad), stats.wrap("fg", fg)
+        hess, hvp = stats.wrap("hess", hess), stats.wrap("hvp", hvp)
+    evals = Evaluations(f, grad, fg)
+    f, grad, fg = evals.f, evals.grad, evals.fg
+    x = np.array(x0, dtype=float)
+    if fg is None:
+        fx, g = f(x), grad(x)
+    else:
+        fx, g = fg(x)
+    gnorm = np.linalg.norm(g)
+    history = History(x.size, max_iter + 1, record, record_n)
+    history.append(x, fx, gnorm)
+    delta = float(delta0)
+    converged = False
+    reason = ""
+    ordering = {}
+    model = None  # (Hv, gHg, d_newton) at x, kept while steps are rejected
+
+    for k in range(max_iter):
+        if gnorm <= tol:
+            converged = True
+            reason = f"gradient norm {gnorm:.2e} <= tol"
+            break
+        lap()
+
+        if model is None:
+            if subproblem == "steihaug" and hvp is not None:
+                x_k = x
+                Hv = lambda v: hvp(x_k, v)
+            else:
+                H = hess(x)
+                if not issparse(H):
+                    H = np.asarray(H, dtype=float)
+                Hv = H.__matmul__
+            gHg = np.dot(g, Hv(g))
+            d_newton = None
+            if subproblem == "dogleg":
+                if issparse(H):
+                    d_newton = _sparse_newton_direction(H, g, ordering)
+                else:
+                    d_newton, _ = newton_direction(H, g)
+                if not (np.all(np.isfinite(d_newton)) and np.dot(g, d_newton) < 0):
+                    d_newton = None
+            model = (Hv, gHg, d_newton)
+        Hv, gHg, d_newton = model
+
+        if subproblem == "dogleg":
+            s = _dogleg(g, gHg, d_newton, delta)
+        else:
+            s, _ = _steihaug(Hv, g, delta, min(0.5, np.sqrt(gnorm)) * gnorm, len(x))
+        step_norm = np.linalg.norm(s)
+        lap("direction")
+
+        # Ratio of actual to predicted reduction
+        predicted = -(np.dot(g, s) + 0.5 * np.dot(s, Hv(s)))
+        f_new = f(x + s)
+        rho = (fx - f_new) / predicted if predicted > 0 else -1.0
+        if 0 < predicted <= 10.0 * np.finfo(float).eps * abs(fx) and np.isfinite(f_new):
+            # The reduction is below the rounding error of f and cannot be
+            # measured: trust the model (near a minimizer it is accurate)
+            rho = 1.0
+        if not np.isfinite(rho):
+            rho = -1.0
+        lap("line search")
+
+        if rho < 0.25:
+            delta = 0.25 * step_norm
+        elif rho > 0.75 and step_norm >= 0.99 * delta:
+            delta = min(2.0 * delta, delta_max)
+
+        accepted = rho > eta
+        if accepted:
+            x = x + s
+            fx = f_new
+            if step_norm > tol:
+                # (at a final point, grad is not evaluated just for the record)
+                g = grad(x)
+                gnorm = np.linalg.norm(g)
+            else:
+                gnorm = np.nan
+            model = None
+        history.append(x, fx, gnorm, 1.0 if accepted else 0.0)
+        lap("update")
+        stop = yield IterState(k + 1, x, fx, gnorm, 1.0 if accepted else 0.0,
+                               evals.nfev, evals.ngev)
+
+        if accepted and step_norm <= tol:
+            converged = True
+            reason = f"step norm {step_norm:.2e} <= tol"
+            break
+        if delta <= np.finfo(float).eps * (1.0 + np.linalg.norm(x)):
+            reason = f"trust radius {delta:.2e} too small"
+            break
+        if stop:
+            reason = "stopped by callback"
+            break
+
+    if not converged and reason == "":
+        reason = "maximum iterations reached"
+
+    if stats is not None:
+        stats.stop()
+    history.stats = stats
+    return x, k + 1, history, converged, reason
@@ -1,53 +1,948 @@
 # utils.py
-import sympy as sp
+from collections import OrderedDict
+import hashlib
+import inspect
+import itertools
+import json
+import linecache
+import os
+from collections.abc import Sequence
+
 import numpy as np
 
+from autodiff import NUMPY_NAMES as _AD_NUMPY_NAMES, ad_sources
+from indexed import NUMPY_NAMES as _INDEXED_NUMPY_NAMES, Names, indexed_sources
+
+
+# In-process cache of built functions (least recently used entry evicted)
+CACHE_SIZE = 64
+_cache = OrderedDict()
+
+# Directory of the optional on-disk cache of lambdified source; used when
+# no cache_dir is passed to the builders.
+CACHE_DIR_ENV = "OPTI_CACHE_DIR"
+_DISK_FORMAT = 1
+
+
+def clear_cache():
+    """Empty the in-process cache (the on-disk cache is left untouched)."""
+    _cache.clear()
+
+
+def _cache_key(kind, f_str, var_names):
+    # Whitespace is not significant in the expression
+    return (kind, "".join(f_str.split()), tuple(var_names))
+
+
+def _cache_get(key):
+    value = _cache.get(key)
+    if value is not None:
+        _cache.move_to_end(key)
+    return value
+
+
+def _cache_put(key, value):
+    _cache[key] = value
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _disk_path(key, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir, key[0] + "_" + digest + ".json")
+
+
+def _lambdified_record(key, funcs):
+    """
+    Source and NumPy names of lambdified functions, or None if some global
+    they use cannot be rebuilt from NumPy alone.
+    """
+    sources, names, constants = {}, {}, {}
+    for label, fn in funcs.items():
+        sources[label] = inspect.getsource(fn)
+        for name in fn.__code__.co_names:
+            if name not in fn.__globals__ or name in names or name in constants:
+                continue
+            value = fn.__globals__[name]
+            if isinstance(value, (int, float, complex)):
+                constants[name] = [complex(value).real, complex(value).imag]
+            elif getattr(np, name, None) is value:
+                names[name] = name
+            elif getattr(np, getattr(value, "__name__", ""), None) is value:
+                names[name] = value.__name__
+            else:
+                return None
+    return {
+        "format": _DISK_FORMAT,
+        "kind": key[0],
+        "expression": key[1],
+        "var_names": list(key[2]),
+        "sources": sources,
+        "numpy_names": names,
+        "constants": constants,
+    }
+
+
+def _functions_from_record(record):
+    """Rebuild lambdified functions from a record, with NumPy only."""
+    namespace = {name: getattr(np, attr) for name, attr in record["numpy_names"].items()}
+    for name, (re, im) in record["constants"].items():
+        namespace[name] = complex(re, im) if im else re
+    funcs = {}
+    for label, source in record["sources"].items():
+        local = {}
+        exec(compile(source, "<cached {}>".format(label), "exec"), namespace, local)
+        (funcs[label],) = local.values()
+    return funcs
+
+
+def _load_lambdified(key, cache_dir):
+    path = _disk_path(key, cache_dir)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            record = json.load(fh)
+        if record.get("format") != _DISK_FORMAT or record["expression"] != key[1] \
+                or tuple(record["var_names"]) != key[2]:
+            return None
+        return _functions_from_record(record)
+    except (OSError, ValueError, KeyError, SyntaxError):
+        # Unreadable or stale entry: rebuild it
+        return None
+
+
+def _save_lambdified(key, funcs, cache_dir):
+    path = _disk_path(key, cache_dir)
+    if path is None:
+        return
+    record = _lambdified_record(key, funcs)
+    if record is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(record, fh)
+    os.replace(tmp, path)
+
+
+def _symbolic_derivatives(f_str, var_names):
+    """
+    Parse f and differentiate it symbolically. The result is kept in the
+    in-process cache, so builders of different kinds share the work.
+
+    Only the structurally nonzero Hessian entries are differentiated: d/dx_j
+    of the i-th gradient entry is needed only if x_j appears in it. For
+    separable or banded objectives this is O(n) derivatives instead of n^2.
+
+    Returns
+    -------
+    vars_sym : tuple of Sympy symbols
+    f_sym : Sympy expression
+    grad_sym : list of n Sympy expressions
+    hess_upper : dict
+        {(i, j): expression} for the nonzero entries with i <= j.
+    """
+    key = _cache_key("symbolic", f_str, var_names)
+    result = _cache_get(key)
+    if result is not None:
+        return result
+
+    import sympy as sp
+
+    # Create symbolic variables
+    vars_sym = tuple(sp.symbols(var_names))
+    index = {v: i for i, v in enumerate(vars_sym)}
+
+    # Symbolic function
+    f_sym = sp.sympify(f_str)
+
+    # Gradient: each partial derivative only of the additive terms of f
+    # that contain the variable (a large sum is not traversed n times)
+    terms = {v: [] for v in vars_sym}
+    for term in sp.Add.make_args(f_sym):
+        for v in term.free_symbols & terms.keys():
+            terms[v].append(term)
+    grad_sym = [sp.Add(*[sp.diff(t, v) for t in terms[v]]) for v in vars_sym]
+
+    # Upper triangle of the Hessian
+    hess_upper = {}
+    for i, gi in enumerate(grad_sym):
+        cols = sorted(index[v] for v in gi.free_symbols if index.get(v, -1) >= i)
+        for j in cols:
+            hij = sp.diff(gi, vars_sym[j])
+            if hij != 0:
+                hess_upper[i, j] = hij
+
+    result = (vars_sym, f_sym, grad_sym, hess_upper)
+    _cache_put(key, result)
+    return result
+
+
+def _hessian_matrix(hess_upper, n):
+    """Dense symmetric Sympy Matrix from the upper-triangle entries."""
+    import sympy as sp
+
+    H = sp.zeros(n, n)
+    for (i, j), hij in hess_upper.items():
+        H[i, j] = H[j, i] = hij
+    return H
+
+
+class Symbols(Sequence):
+    """
+    The Sympy symbols of var_names, created (and Sympy imported) on first
+    access: printing them, or taking their number, needs no Sympy.
+    """
+
+    def __init__(self, var_names):
+        self.names = tuple(var_names)
+        self._symbols = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        if self._symbols is None:
+            import sympy as sp
+
+            self._symbols = tuple(sp.symbols(list(self.names)))
+        return self._symbols[i]
+
+    def __repr__(self):
+        if len(self.names) == 1:
+            return "({},)".format(self.names[0])
+        return "({})".format(", ".join(self.names))
+
+
+def _ad_derivatives(f_str, var_names):
+    """
+    Source of f, grad and hvp by automatic differentiation (see
+    autodiff.py), kept in the in-process cache like _symbolic_derivatives.
+
+    Returns
+    -------
+    vars_sym : Symbols
+    sources : dict
+        {"f": source, "grad": source, "hvp": source}
+    """
+    key = _cache_key("autodiff", f_str, var_names)
+    result = _cache_get(key)
+    if result is None:
+        result = (Symbols(var_names), ad_sources(f_str, var_names))
+        _cache_put(key, result)
+    return result
+
 
-def build_functions_from_sympy(f_str, var_names):
+def _build_lambdified(kind, f_str, var_names, cache_dir):
+    """
+    The functions of the builder `kind` (see _BUILDERS), from the on-disk
+    cache if possible, otherwise derived and saved there.
+
+    Returns
+    -------
+    vars_sym : sequence of Sympy symbols
+    funcs : dict
+        Lambdified functions, by label.
+    """
+    key = _cache_key(kind, f_str, var_names)
+    derive, lambdify_all, _ = _BUILDERS[kind]
+    funcs = _load_lambdified(key, cache_dir)
+    if funcs is not None:
+        return Symbols(var_names), funcs
+    symbolic = derive(f_str, var_names)
+    funcs = lambdify_all(*symbolic)
+    _save_lambdified(key, funcs, cache_dir)
+    return symbolic[0], funcs
+
+
+def _cached_build(kind, f_str, var_names, cache_dir):
+    """
+    Shared cache logic of the builders.
+
+    _BUILDERS[kind] gives derive(f_str, var_names), which returns the
+    derivatives (vars_sym first; default: vars_sym, f_sym, grad_sym,
+    hess_upper), lambdify_all(*derived), a dict of lambdified functions,
+    and wrap(funcs, n), the user-facing callables. Lookup order:
+    in-process LRU, then on-disk source, then symbolic work. Sympy is only
+    imported by the symbolic work.
+    """
+    key = _cache_key(kind, f_str, var_names)
+    result = _cache_get(key)
+    if result is not None:
+        return result
+
+    vars_sym, funcs = _build_lambdified(kind, f_str, var_names, cache_dir)
+    result = _BUILDERS[kind][2](funcs, len(vars_sym)) + (vars_sym,)
+    _cache_put(key, result)
+    return result
+
+
+def build_functions_from_sympy(f_str, var_names, cache_dir=None, backend="lambdify",
+                               sparse=False):
     """
     Build numerical functions f, grad, hess from a string and variable names.
 
+    Results are memoized by expression (whitespace ignored) and variable
+    order, so building the same problem again skips all symbolic work.
+    Sympy is imported only when symbolic work is done.
+
+    With backend="lambdify", Sympy's lambdify functions are called with the
+    coordinates unpacked as NumPy scalars and their nested-list output is
+    converted to an array. With backend="codegen", plain Python/NumPy
+    source is generated instead: it indexes x[i] directly (as Python
+    floats), shares subexpressions (cse), and writes each entry into the
+    output array. Only nonzero Hessian entries are written.
+
+    With backend="ad", nothing is differentiated symbolically: f is
+    recorded on a tape and differentiated by automatic differentiation
+    (autodiff.py), in time linear in the size of the expression. grad is
+    computed in reverse mode, at a small multiple of the cost of f for any
+    n, and hess(x) in one forward-over-reverse pass with the n directions
+    of the identity (about n times the cost of grad). The generated code
+    is compiled and cached as with backend="codegen".
+
+    With sparse=True, the sparsity pattern of the Hessian is found
+    symbolically and hess returns a scipy.sparse CSC matrix whose data
+    array is filled by generated code (as with backend="codegen") at the
+    nonzero entries only; newton_with_line_search then solves with a
+    sparse factorization. Requires SciPy. backend is then ignored.
+
     Parameters
     ----------
     f_str : str
         Expression of f in Sympy/Python syntax.
     var_names : list[str]
         Variable names in the desired order, e.g. ["x", "y"].
+    cache_dir : str, optional
+        Directory of the on-disk cache of the generated source (default:
+        the OPTI_CACHE_DIR environment variable; no disk cache if unset).
+    backend : str
+        "lambdify", "codegen" or "ad".
+    sparse : bool
+        Return the Hessian as a scipy.sparse.csc_matrix.
 
     Returns
     -------
     f : callable
         f(x) -> float
     grad : callable
-        grad(x) -> np.ndarray of shape (n,)
+        grad(x, out=None) -> np.ndarray of shape (n,)
     hess : callable
-        hess(x) -> np.ndarray of shape (n, n)
-    vars_sym : tuple of Sympy symbols
+        hess(x, out=None) -> np.ndarray of shape (n, n)
+        If a preallocated array `out` is given, the result is written
+        into it and returned.
+    vars_sym : sequence of Sympy symbols
+        A Symbols when no symbolic work was done: with backend="ad", or
+        when loaded from the on-disk cache.
     """
-    # Create symbolic variables
-    vars_sym = sp.symbols(" ".join(var_names))
+    if sparse:
+        return _cached_build("sparse", f_str, var_names, cache_dir)
+    if backend == "lambdify":
+        return _cached_build("scalar", f_str, var_names, cache_dir)
+    if backend == "codegen":
+        return _cached_build("codegen", f_str, var_names, cache_dir)
+    if backend == "ad":
+        return _cached_build("ad", f_str, var_names, cache_dir)
+    raise ValueError("backend must be 'lambdify', 'codegen' or 'ad'.")
 
-    # Symbolic function
-    f_sym = sp.sympify(f_str)
 
-    # Gradient and Hessian
-    grad_sym = [sp.diff(f_sym, v) for v in vars_sym]
-    hess_sym = sp.hessian(f_sym, vars_sym)
+def _lambdify_scalar(vars_sym, f_sym, grad_sym, hess_upper):
+    import sympy as sp
 
     # Turn into numerical functions
-    f_l = sp.lambdify(vars_sym, f_sym, "numpy")
-    grad_l = sp.lambdify(vars_sym, grad_sym, "numpy")
-    hess_l = sp.lambdify(vars_sym, hess_sym, "numpy")
+    hess_sym = _hessian_matrix(hess_upper, len(vars_sym))
+    return {
+        "f": sp.lambdify(vars_sym, f_sym, "numpy"),
+        "grad": sp.lambdify(vars_sym, grad_sym, "numpy"),
+        "hess": sp.lambdify(vars_sym, hess_sym, "numpy"),
+    }
+
+
+def _wrap_scalar(funcs, n):
+    f_l, grad_l, hess_l = funcs["f"], funcs["grad"], funcs["hess"]
 
     def f(x):
         return float(f_l(*x))
 
-    def grad(x):
-        g = grad_l(*x)
-        return np.array(g, dtype=float).reshape(-1)
+    def grad(x, out=None):
+        g = np.array(grad_l(*x), dtype=float).reshape(-1)
+        if out is None:
+            return g
+        out[:] = g
+        return out
+
+    def hess(x, out=None):
+        H = np.array(hess_l(*x), dtype=float)
+        if out is None:
+            return H
+        out[:] = H
+        return out
+
+    return f, grad, hess
+
+
+_codegen_count = itertools.count()
+
+
+def _compile_function(source, name, namespace):
+    """
+    Compile generated source and return the function `name` defined in it.
+    The source is registered in linecache (as lambdify does), so that
+    inspect.getsource works on the result.
+    """
+    filename = "<codegen-{}>".format(next(_codegen_count))
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    local = {}
+    exec(compile(source, filename, "exec"), namespace, local)
+    return local[name]
+
+
+def _codegen_body(exprs, subs, printer):
+    """
+    Source lines assigning the common subexpressions of exprs (after the
+    substitution subs) to temporaries, and the source of each reduced
+    expression.
+    """
+    import sympy as sp
+
+    temps, reduced = sp.cse(
+        [sp.sympify(e).xreplace(subs) for e in exprs],
+        symbols=sp.numbered_symbols("_t"),
+    )
+    lines = "".join("    {} = {}\n".format(t, printer.doprint(e)) for t, e in temps)
+    return lines, [printer.doprint(e) for e in reduced]
+
+
+def _codegen_printer(vars_sym):
+    """NumPy printer and the substitution of the variables by x[i]."""
+    import sympy as sp
+    from sympy.printing.numpy import NumPyPrinter
+
+    xb = sp.IndexedBase("x")
+    subs = {v: xb[i] for i, v in enumerate(vars_sym)}
+    printer = NumPyPrinter({"fully_qualified_modules": False, "inline": True})
+    return printer, subs
+
+
+def _codegen_namespace(printer):
+    return {name: getattr(np, name) for name in printer.module_imports.get("numpy", ())}
+
+
+def _codegen_scalar(vars_sym, f_sym, grad_sym, hess_upper, sparse=False):
+    """
+    Generate the bodies of f(x), grad(x, out) and hess(x, out) as NumPy
+    source.
+
+    Variables are replaced by x[i], common subexpressions of each function
+    are assigned once to temporaries, and every gradient / nonzero Hessian
+    entry is written directly into `out`. With sparse=True, `out` is the
+    data array of a CSC matrix whose pattern is returned by the extra
+    generated function pattern() -> (n, indices, indptr).
+    """
+    n = len(vars_sym)
+    printer, subs = _codegen_printer(vars_sym)
+
+    lines, (f_code,) = _codegen_body([f_sym], subs, printer)
+    f_src = "def f(x):\n" + lines + "    return {}\n".format(f_code)
+
+    lines, g_codes = _codegen_body(grad_sym, subs, printer)
+    g_src = "def grad(x, out):\n" + lines
+    g_src += "".join("    out[{}] = {}\n".format(i, c) for i, c in enumerate(g_codes))
+    g_src += "    return out\n"
+
+    upper = sorted(hess_upper)
+    lines, h_codes = _codegen_body([hess_upper[ij] for ij in upper], subs, printer)
+    h_src = "def hess(x, out):\n"
+    if sparse:
+        # CSC layout: entries sorted by column, then row
+        entries = sorted(set(upper) | {(j, i) for i, j in upper}, key=lambda e: (e[1], e[0]))
+        pos = {e: k for k, e in enumerate(entries)}
+        indptr = np.searchsorted([c for _, c in entries], np.arange(n + 1)).tolist()
+        p_src = "def pattern():\n    return {}, {}, {}\n".format(
+            n, [r for r, _ in entries], indptr
+        )
+        targets = [
+            "out[{}]".format(pos[i, j]) if i == j
+            else "out[{}] = out[{}]".format(pos[i, j], pos[j, i])
+            for i, j in upper
+        ]
+    else:
+        if len(upper) < n * (n + 1) // 2:
+            h_src += "    out.fill(0.0)\n"
+        targets = [
+            "out[{0}, {0}]".format(i) if i == j
+            else "out[{0}, {1}] = out[{1}, {0}]".format(i, j)
+            for i, j in upper
+        ]
+    h_src += lines
+    h_src += "".join("    {} = {}\n".format(t, c) for t, c in zip(targets, h_codes))
+    h_src += "    return out\n"
+
+    namespace = _codegen_namespace(printer)
+    funcs = {
+        "f": _compile_function(f_src, "f", namespace),
+        "grad": _compile_function(g_src, "grad", namespace),
+        "hess": _compile_function(h_src, "hess", namespace),
+    }
+    if sparse:
+        funcs["pattern"] = _compile_function(p_src, "pattern", namespace)
+    return funcs
+
+
+def _codegen_sparse(vars_sym, f_sym, grad_sym, hess_upper):
+    return _codegen_scalar(vars_sym, f_sym, grad_sym, hess_upper, sparse=True)
+
+
+def _call_codegen(core, args, *out):
+    """
+    Call generated code on the arrays args (and output buffers out).
+
+    Arithmetic on Python floats is much faster than on NumPy scalars, but
+    raises (or goes complex) where NumPy returns inf/nan; in that case
+    evaluate again on the NumPy arrays, as lambdify would.
+    """
+    args = [np.asarray(a, dtype=float) for a in args]
+    try:
+        result = core(*[a.tolist() for a in args], *out)
+    except (OverflowError, ZeroDivisionError, TypeError):
+        return core(*args, *out)
+    if isinstance(result, complex):
+        # A negative base to a fractional power (a complex entry of an
+        # out buffer raises TypeError above)
+        return core(*args, *out)
+    return result
+
+
+def _wrap_codegen(funcs, n):
+    f_c, grad_c, hess_c = funcs["f"], funcs["grad"], funcs["hess"]
+
+    def f(x):
+        return float(_call_codegen(f_c, (x,)))
+
+    def grad(x, out=None):
+        if out is None:
+            out = np.empty(n)
+        return _call_codegen(grad_c, (x,), out)
+
+    if "pattern" in funcs:
+        from scipy.sparse import csc_matrix
+
+        _, indices, indptr = funcs["pattern"]()
+        indices = np.array(indices, dtype=np.int32)
+        indptr = np.array(indptr, dtype=np.int32)
+
+        def hess(x, out=None):
+            # out: a matrix returned by a previous call, refilled in place
+            if out is None:
+                out = csc_matrix((np.empty(indices.size), indices, indptr), shape=(n, n))
+            _call_codegen(hess_c, (x,), out.data)
+            return out
+
+        return f, grad, hess
+
+    def hess(x, out=None):
+        if out is None:
+            out = np.empty((n, n))
+        return _call_codegen(hess_c, (x,), out)
+
+    return f, grad, hess
+
+
+def build_hvp_from_sympy(f_str, var_names, cache_dir=None, backend="codegen"):
+    """
+    Build the Hessian-vector product of f, without ever forming the Hessian.
+
+    The product is the derivative of grad(x)^T v with respect to x: entry i
+    is the sum over the nonzero Hessian entries of row i times v_j. It is
+    generated as NumPy source like backend="codegen" of
+    build_functions_from_sympy, and cached the same way.
+
+    With backend="ad", it is instead obtained by forward-mode automatic
+    differentiation (dual numbers) of the reverse-mode gradient, at a small
+    multiple of the cost of grad, with no symbolic work.
+
+    Returns
+    -------
+    hvp : callable
+        hvp(x, v, out=None) -> np.ndarray of shape (n,)
+    vars_sym : sequence of Sympy symbols
+    """
+    if backend == "codegen":
+        return _cached_build("hvp", f_str, var_names, cache_dir)
+    if backend == "ad":
+        return _cached_build("ad-hvp", f_str, var_names, cache_dir)
+    raise ValueError("backend must be 'codegen' or 'ad'.")
+
+
+def _codegen_hvp(vars_sym, f_sym, grad_sym, hess_upper):
+    import sympy as sp
+
+    n = len(vars_sym)
+    printer, subs = _codegen_printer(vars_sym)
+    vb = sp.IndexedBase("v")
+
+    rows = [[] for _ in range(n)]
+    for (i, j), hij in hess_upper.items():
+        rows[i].append(hij * vb[j])
+        if i != j:
+            rows[j].append(hij * vb[i])
+    lines, codes = _codegen_body([sp.Add(*r) for r in rows], subs, printer)
+    src = "def hvp(x, v, out):\n" + lines
+    src += "".join("    out[{}] = {}\n".format(i, c) for i, c in enumerate(codes))
+    src += "    return out\n"
+
+    return {"hvp": _compile_function(src, "hvp", _codegen_namespace(printer))}
+
+
+def _wrap_hvp(funcs, n):
+    hvp_c = funcs["hvp"]
+
+    def hvp(x, v, out=None):
+        if out is None:
+            out = np.empty(n)
+        return _call_codegen(hvp_c, (x, v), out)
+
+    return (hvp,)
+
+
+def _compile_ad(vars_sym, sources, labels=("f", "grad", "hvp")):
+    namespace = {name: getattr(np, name) for name in _AD_NUMPY_NAMES}
+    return {label: _compile_function(sources[label], label, namespace) for label in labels}
+
+
+def _compile_ad_hvp(vars_sym, sources):
+    return _compile_ad(vars_sym, sources, ("hvp",))
+
+
+def _wrap_ad(funcs, n):
+    f_c, grad_c, hvp_c = funcs["f"], funcs["grad"], funcs["hvp"]
+    # Directions of the Hessian pass: the tangents are arrays of n entries
+    eye = list(np.eye(n))
+
+    def f(x):
+        return float(_call_codegen(f_c, (x,)))
+
+    def grad(x, out=None):
+        if out is None:
+            out = np.empty(n)
+        return _call_codegen(grad_c, (x,), out)
+
+    def hess(x, out=None):
+        if out is None:
+            out = np.empty((n, n))
+        # On NumPy scalars: the tangents are arrays, so a complex value
+        # from Python floats would be cast to real when written to out
+        return hvp_c(np.asarray(x, dtype=float), eye, out)
+
+    return f, grad, hess
+
+
+def build_functions_from_indexed(f_str, n, var="x", cache_dir=None):
+    """
+    Build f, grad, hess and hvp of an objective written with an indexed
+    vector, e.g. sum(100*(x[i+1] - x[i]**2)**2 + (1 - x[i])**2, i) (see
+    indexed.py for the syntax).
+
+    The functions are vectorized NumPy kernels generated by automatic
+    differentiation of each term once, so building takes the same time
+    for any n (and the result is cached for all n, in process and on
+    disk). Evaluating costs a few NumPy operations per term on arrays of
+    length about n.
+
+    Parameters
+    ----------
+    f_str : str
+        Expression of f.
+    n : int
+        Dimension.
+    var : str
+        Name of the vector in f_str.
+    cache_dir : str, optional
+        As in build_functions_from_sympy.
+
+    Returns
+    -------
+    f : callable
+        f(x) -> float
+    grad : callable
+        grad(x, out=None) -> np.ndarray of shape (n,)
+    hess : callable
+        hess(x) -> scipy.sparse.csc_matrix of shape (n, n) (requires
+        SciPy; newton_with_line_search solves with a sparse factorization)
+    hvp : callable
+        hvp(x, v, out=None) -> np.ndarray of shape (n,)
+    names : indexed.Names
+        Sequence of the names "x[0]", ..., "x[n-1]" (made on demand).
+    """
+    f, grad, hess, hvp, _ = _cached_build("indexed", f_str, (var,), cache_dir)
+    return f, grad, hess, hvp, Names(var, n)
+
+
+def _indexed_derivatives(f_str, var_names):
+    (var,) = var_names
+    return var_names, indexed_sources(f_str, var)
+
+
+def _compile_indexed(var_names, sources):
+    namespace = {name: getattr(np, name) for name in _INDEXED_NUMPY_NAMES}
+    return {label: _compile_function(src, label, namespace) for label, src in sources.items()}
+
+
+def _wrap_indexed(funcs, _):
+    f_c, grad_c, hess_c, hvp_c = funcs["f"], funcs["grad"], funcs["hess"], funcs["hvp"]
+
+    def f(x):
+        return float(f_c(np.asarray(x, dtype=float)))
+
+    def grad(x, out=None):
+        x = np.asarray(x, dtype=float)
+        if out is None:
+            out = np.empty(len(x))
+        return grad_c(x, out)
 
     def hess(x):
-        H = hess_l(*x)
-        return np.array(H, dtype=float)
+        from scipy.sparse import csc_matrix
+
+        x = np.asarray(x, dtype=float)
+        n = len(x)
+        rows, cols, vals = hess_c(x)
+        if not rows:
+            return csc_matrix((n, n))
+        # Entries given more than once (by several terms) are summed
+        return csc_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)
+        )
+
+    def hvp(x, v, out=None):
+        x = np.asarray(x, dtype=float)
+        if out is None:
+            out = np.empty(len(x))
+        return hvp_c(x, np.asarray(v, dtype=float), out)
+
+    return f, grad, hess, hvp
+
+
+def build_batched_functions_from_sympy(f_str, var_names, cache_dir=None):
+    """
+    Same as build_functions_from_sympy (including the caches), but the
+    functions evaluate a whole batch of B points at once.
+
+    The lambdified code only uses NumPy operations, so it broadcasts: every
+    component is evaluated once on the columns of X and written into the
+    stacked output (constant entries are broadcast to the batch).
+
+    Returns
+    -------
+    f : callable
+        f(X) -> np.ndarray of shape (B,), for X of shape (B, n)
+    grad : callable
+        grad(X) -> np.ndarray of shape (B, n)
+    hess : callable
+        hess(X) -> np.ndarray of shape (B, n, n)
+    vars_sym : sequence of Sympy symbols
+    """
+    return _cached_build("batched", f_str, var_names, cache_dir)
+
+
+def _lambdify_batched(vars_sym, f_sym, grad_sym, hess_upper):
+    import sympy as sp
+
+    # Nested lists (not a Matrix) so that scalar and array entries can mix
+    hess_sym = _hessian_matrix(hess_upper, len(vars_sym))
+    return {
+        "f": sp.lambdify(vars_sym, f_sym, "numpy"),
+        "grad": sp.lambdify(vars_sym, grad_sym, "numpy"),
+        "hess": sp.lambdify(vars_sym, hess_sym.tolist(), "numpy"),
+    }
+
+
+def _wrap_batched(funcs, n):
+    f_l, grad_l, hess_l = funcs["f"], funcs["grad"], funcs["hess"]
+
+    def f(X):
+        X = np.asarray(X, dtype=float)
+        out = np.empty(X.shape[0])
+        out[:] = f_l(*X.T)
+        return out
+
+    def grad(X):
+        X = np.asarray(X, dtype=float)
+        out = np.empty(X.shape)
+        for i, gi in enumerate(grad_l(*X.T)):
+            out[:, i] = gi
+        return out
+
+    def hess(X):
+        X = np.asarray(X, dtype=float)
+        out = np.empty((X.shape[0], n, n))
+        for i, row in enumerate(hess_l(*X.T)):
+            for j, hij in enumerate(row):
+                out[:, i, j] = hij
+        return out
+
+    return f, grad, hess
+
+
+def build_fused_from_sympy(f_str, var_names, cache_dir=None):
+    """
+    Build fused evaluators returning f and its derivatives from one call.
+
+    Common subexpressions of f, the gradient and the Hessian are extracted
+    once with Sympy's cse, so powers and products shared by the outputs
+    are computed a single time. Cached like build_functions_from_sympy.
+
+    Returns
+    -------
+    fg : callable
+        fg(x) -> (float, np.ndarray of shape (n,))
+    fgh : callable
+        fgh(x) -> (float, np.ndarray of shape (n,), np.ndarray of shape (n, n))
+    vars_sym : sequence of Sympy symbols
+    """
+    return _cached_build("fused", f_str, var_names, cache_dir)
+
+
+def _lambdify_fused(vars_sym, f_sym, grad_sym, hess_upper):
+    import sympy as sp
+
+    hess_sym = _hessian_matrix(hess_upper, len(vars_sym))
+    return {
+        "fg": sp.lambdify(vars_sym, [f_sym, grad_sym], "numpy", cse=True),
+        "fgh": sp.lambdify(vars_sym, [f_sym, grad_sym, hess_sym], "numpy", cse=True),
+    }
+
+
+def _wrap_fused(funcs, n):
+    fg_l, fgh_l = funcs["fg"], funcs["fgh"]
+
+    def fg(x):
+        fx, g = fg_l(*x)
+        return float(fx), np.array(g, dtype=float).reshape(-1)
+
+    def fgh(x):
+        fx, g, H = fgh_l(*x)
+        return float(fx), np.array(g, dtype=float).reshape(-1), np.array(H, dtype=float)
+
+    return fg, fgh
+
+
+# kind -> (derive, lambdify_all, wrap) of each builder (see _cached_build)
+_BUILDERS = {
+    "scalar": (_symbolic_derivatives, _lambdify_scalar, _wrap_scalar),
+    "codegen": (_symbolic_derivatives, _codegen_scalar, _wrap_codegen),
+    "sparse": (_symbolic_derivatives, _codegen_sparse, _wrap_codegen),
+    "ad": (_ad_derivatives, _compile_ad, _wrap_ad),
+    "hvp": (_symbolic_derivatives, _codegen_hvp, _wrap_hvp),
+    "ad-hvp": (_ad_derivatives, _compile_ad_hvp, _wrap_hvp),
+    "indexed": (_indexed_derivatives, _compile_indexed, _wrap_indexed),
+    "batched": (_symbolic_derivatives, _lambdify_batched, _wrap_batched),
+    "fused": (_symbolic_derivatives, _lambdify_fused, _wrap_fused),
+}
+
+
+def export_problem(path, f_str, var_names=None, backend="codegen", sparse=False,
+                   var="x", n=None, cache_dir=None):
+    """
+    Build a problem and write its generated source to a file that
+    load_problem reads back with NumPy alone (no Sympy, no symbolic work):
+    f, grad and hess as built by build_functions_from_sympy (or
+    build_functions_from_indexed), and hvp as built by build_hvp_from_sympy
+    (with backend="ad" if backend is "ad", "codegen" otherwise).
+
+    The file is JSON: the expression, variables and backend, and for each
+    builder the source of its functions with the NumPy names and constants
+    they use.
+
+    Parameters
+    ----------
+    path : str
+    f_str : str
+    var_names : list[str], optional
+        Variable names; None for an objective indexed by `var` (see
+        indexed.py).
+    backend, sparse
+        As in build_functions_from_sympy (ignored for indexed objectives).
+    var : str
+        Name of the vector of an indexed objective.
+    n : int, optional
+        Default dimension of an indexed objective when loading.
+    cache_dir : str, optional
+        As in build_functions_from_sympy.
+    """
+    if var_names is None:
+        kinds, var_names = ("indexed",), (var,)
+    else:
+        if backend not in ("lambdify", "codegen", "ad"):
+            raise ValueError("backend must be 'lambdify', 'codegen' or 'ad'.")
+        main_kind = "sparse" if sparse else {"lambdify": "scalar"}.get(backend, backend)
+        kinds = (main_kind, "ad-hvp" if backend == "ad" else "hvp")
+        var = None
+
+    parts = []
+    for kind in kinds:
+        _, funcs = _build_lambdified(kind, f_str, var_names, cache_dir)
+        record = _lambdified_record(_cache_key(kind, f_str, var_names), funcs)
+        if record is None:
+            raise ValueError(
+                "The functions of '{}' use names that cannot be rebuilt from NumPy.".format(kind)
+            )
+        parts.append(record)
+
+    problem = {
+        "format": _DISK_FORMAT,
+        "expression": f_str,
+        "var_names": None if var is not None else list(var_names),
+        "var": var,
+        "n": n,
+        "backend": "indexed" if var is not None else backend,
+        "sparse": bool(sparse) and var is None,
+        "parts": parts,
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(problem, fh)
+
+
+def load_problem(path, n=None):
+    """
+    Load a problem written by export_problem. Only NumPy is needed (and
+    SciPy for a sparse Hessian); Sympy is not imported.
+
+    Parameters
+    ----------
+    path : str
+    n : int, optional
+        Dimension of an indexed objective (default: the n given to
+        export_problem). Ignored otherwise.
+
+    Returns
+    -------
+    f, grad, hess, hvp : callables
+        As returned by the builders.
+    names : tuple of str or indexed.Names
+        Variable names.
+    """
+    with open(path, "r", encoding="utf-8") as fh:
+        problem = json.load(fh)
+    if problem.get("format") != _DISK_FORMAT:
+        raise ValueError("{} was written by an incompatible version.".format(path))
+
+    if problem["var"] is not None:
+        n = problem["n"] if n is None else n
+        if n is None:
+            raise ValueError("The dimension n of the indexed objective is required.")
+        names = Names(problem["var"], n)
+    else:
+        names = tuple(problem["var_names"])
+        n = len(names)
 
-    return f, grad, hess, vars_sym
+    functions = ()
+    for record in problem["parts"]:
+        wrap = _BUILDERS[record["kind"]][2]
+        functions += wrap(_functions_from_record(record), n)
+    return functions + (names,)